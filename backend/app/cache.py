@@ -0,0 +1,84 @@
+"""
+In-process response cache for the DefectDojo proxy endpoints
+
+- Entries younger than `ttl` are served directly
+- Entries younger than `ttl + stale_ttl` are served immediately while a single
+  background refresh runs (stale-while-revalidate)
+- Concurrent misses for the same key share one upstream call
+- invalidate() drops everything, e.g. when a scan finishes its DefectDojo import
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class ResponseCache:
+    """TTL cache with stale-while-revalidate and request coalescing"""
+
+    def __init__(self, ttl: float, stale_ttl: float = 0, max_entries: int = 256):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # Bumped by invalidate() so fetches started earlier are not stored
+        self._generation = 0
+
+    def invalidate(self) -> None:
+        self._entries.clear()
+        self._generation += 1
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.monotonic() - stored_at
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                return value
+            if age < self.ttl + self.stale_ttl:
+                if key not in self._inflight:
+                    self._start_fetch(key, fetch)
+                return value
+
+        future = self._inflight.get(key) or self._start_fetch(key, fetch)
+        # Shield so one cancelled client request does not cancel the shared fetch
+        return await asyncio.shield(future)
+
+    def _start_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        generation = self._generation
+        future = asyncio.ensure_future(fetch())
+        self._inflight[key] = future
+
+        def _done(f: asyncio.Future):
+            self._inflight.pop(key, None)
+            if f.cancelled() or f.exception() is not None:
+                return
+            value = f.result()
+            # Empty results are usually upstream errors swallowed by the client
+            if value and generation == self._generation:
+                self._store(key, value)
+
+        future.add_done_callback(_done)
+        return future
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+dojo_cache = ResponseCache(
+    ttl=float(os.getenv('DOJO_CACHE_TTL', '30')),
+    stale_ttl=float(os.getenv('DOJO_CACHE_STALE_TTL', '300')),
+    max_entries=int(os.getenv('DOJO_CACHE_MAX_ENTRIES', '256')),
+)
+
+
+async def invalidate_on_import(event: Dict[str, Any]) -> None:
+    """Scan-event listener: drop cached Dojo data once a task has imported new results"""
+    if event.get('dojo_import'):
+        dojo_cache.invalidate()
@@ -21,9 +21,35 @@ celery_app.conf.task_default_queue = 'ptaas'
 celery_app.conf.task_queues = (
     Queue('ptaas', routing_key='ptaas'),
     Queue('celery', routing_key='celery'),  # Accept default queue too
+    # One queue per scanner so long ZAP scans cannot starve quick Nmap scans;
+    # each is consumed by its own worker pool (see docker-compose.yml)
+    Queue('nmap', routing_key='nmap'),
+    Queue('zap', routing_key='zap'),
+    Queue('sqlmap', routing_key='sqlmap'),
+    Queue('import', routing_key='import'),  # Storage upload / DefectDojo import
 )
 celery_app.conf.task_default_exchange = 'ptaas'
 celery_app.conf.task_default_routing_key = 'ptaas'
+celery_app.conf.task_routes = {
+    'app.tasks.scan_with_nmap': {'queue': 'nmap', 'routing_key': 'nmap'},
+    'app.tasks.scan_nmap_shard': {'queue': 'nmap', 'routing_key': 'nmap'},
+    'app.tasks.merge_nmap_shards': {'queue': 'import', 'routing_key': 'import'},
+    'app.tasks.fail_sharded_nmap': {'queue': 'import', 'routing_key': 'import'},
+    'app.tasks.import_scan_results': {'queue': 'import', 'routing_key': 'import'},
+    'app.tasks.scan_with_zap': {'queue': 'zap', 'routing_key': 'zap'},
+    'app.tasks.scan_with_sqlmap': {'queue': 'sqlmap', 'routing_key': 'sqlmap'},
+}
+
+# Optional per-task rate limits (Celery syntax, e.g. "10/m"; enforced per worker)
+celery_app.conf.task_annotations = {
+    task: {'rate_limit': os.getenv(env)}
+    for task, env in (
+        ('app.tasks.scan_with_nmap', 'NMAP_RATE_LIMIT'),
+        ('app.tasks.scan_with_zap', 'ZAP_RATE_LIMIT'),
+        ('app.tasks.scan_with_sqlmap', 'SQLMAP_RATE_LIMIT'),
+    )
+    if os.getenv(env)
+}
 
 # Celery Configuration
 celery_app.conf.update(
@@ -40,6 +66,13 @@ celery_app.conf.update(
     result_accept_content=['json', 'application/json'],
     worker_enable_remote_control=False,  # Avoid pickle-based pidbox/mingle messages
     broker_connection_retry_on_startup=True,
+    # Message priorities on the Redis broker: 0 is served first
+    broker_transport_options={
+        'priority_steps': list(range(10)),
+        'sep': ':',
+        'queue_order_strategy': 'priority',
+    },
+    task_default_priority=4,
 )
 
 if __name__ == '__main__':
@@ -0,0 +1,136 @@
+"""
+Run-to-run diffs of parsed scan artifacts
+
+Compares the host records (Nmap) or alert records (ZAP) of a scan with those
+of the previous scan of the same target. The previous artifact is indexed in
+memory by a compact key and the current one is streamed against it. Listed
+items are capped at DIFF_MAX_ITEMS; the counts are always complete.
+"""
+import hashlib
+import os
+from typing import Any, Dict, Iterable, Tuple
+
+from .parsers.jsonl import read_jsonl
+
+DIFF_FILENAME = 'diff.json'
+DIFF_MAX_ITEMS = int(os.getenv('DIFF_MAX_ITEMS', '5000'))
+
+# Registry field holding each scan type's diffable artifact
+ARTIFACT_FIELDS = {'nmap': 'hosts_key', 'zap': 'alerts_key'}
+
+
+class _Changes:
+    def __init__(self, *kinds: str):
+        self.counts = {kind: 0 for kind in kinds}
+        self.items = {kind: [] for kind in kinds}
+
+    def add(self, kind: str, item: Any) -> None:
+        self.counts[kind] += 1
+        if len(self.items[kind]) < DIFF_MAX_ITEMS:
+            self.items[kind].append(item)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'changed': any(self.counts.values()),
+            'summary': dict(self.counts),
+            'truncated': any(self.counts[k] > len(self.items[k]) for k in self.counts),
+            **self.items,
+        }
+
+
+def _service(port: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: port[k] for k in ('service', 'product', 'version') if port.get(k)}
+
+
+def _script_digests(scripts: Dict[str, str]) -> Dict[str, str]:
+    """NSE script id -> short digest of its output (outputs can be large)"""
+    return {k: hashlib.sha1(v.encode('utf-8')).hexdigest()[:16] for k, v in scripts.items()}
+
+
+def _changed_scripts(before: Dict[str, str], after: Dict[str, str]) -> Dict[str, list]:
+    return {
+        'added': sorted(after.keys() - before.keys()),
+        'removed': sorted(before.keys() - after.keys()),
+        'changed': sorted(k for k in before.keys() & after.keys() if before[k] != after[k]),
+    }
+
+
+def _open_ports(host: Dict[str, Any]) -> Iterable[Tuple[Tuple[str, str, int], Dict[str, Any], Dict[str, str]]]:
+    for port in host.get('ports', []):
+        if port.get('state') == 'open':
+            key = (host.get('ip'), port.get('protocol'), port.get('port'))
+            yield key, _service(port), _script_digests(port.get('scripts', {}))
+
+
+def diff_nmap(previous: Iterable[Dict[str, Any]], current: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    New/gone hosts, new/closed open ports, changed services and changed NSE
+    script output (per port and per host) between two host artifacts
+    """
+    before_hosts: Dict[str, Dict[str, str]] = {}
+    before_ports: Dict[Tuple[str, str, int], Tuple[Dict[str, Any], Dict[str, str]]] = {}
+    for host in previous:
+        before_hosts[host.get('ip')] = _script_digests(host.get('hostscripts', {}))
+        for key, service, scripts in _open_ports(host):
+            before_ports[key] = (service, scripts)
+
+    changes = _Changes('new_hosts', 'gone_hosts', 'new_ports', 'closed_ports', 'changed_services', 'changed_scripts')
+    seen_hosts = set()
+    seen_ports = set()
+    for host in current:
+        ip = host.get('ip')
+        seen_hosts.add(ip)
+        hostscripts = _script_digests(host.get('hostscripts', {}))
+        if ip not in before_hosts:
+            changes.add('new_hosts', ip)
+        elif before_hosts[ip] != hostscripts:
+            changes.add('changed_scripts', {'ip': ip, **_changed_scripts(before_hosts[ip], hostscripts)})
+        for key, service, scripts in _open_ports(host):
+            seen_ports.add(key)
+            location = {'ip': key[0], 'protocol': key[1], 'port': key[2]}
+            if key not in before_ports:
+                changes.add('new_ports', {**location, **service})
+                continue
+            before_service, before_scripts = before_ports[key]
+            if before_service != service:
+                changes.add('changed_services', {**location, 'before': before_service, 'after': service})
+            if before_scripts != scripts:
+                changes.add('changed_scripts', {**location, **_changed_scripts(before_scripts, scripts)})
+
+    for ip in before_hosts.keys() - seen_hosts:
+        changes.add('gone_hosts', ip)
+    for key, (service, _) in before_ports.items():
+        if key not in seen_ports:
+            changes.add('closed_ports', {'ip': key[0], 'protocol': key[1], 'port': key[2], **service})
+    return changes.as_dict()
+
+
+def diff_zap(previous: Iterable[Dict[str, Any]], current: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """New and resolved alerts between two alert artifacts, matched by fingerprint"""
+    before = {record['fingerprint']: record for record in previous}
+
+    changes = _Changes('new_alerts', 'resolved_alerts')
+    seen = set()
+    for record in current:
+        fingerprint = record['fingerprint']
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        if fingerprint not in before:
+            changes.add('new_alerts', record)
+
+    for fingerprint, record in before.items():
+        if fingerprint not in seen:
+            changes.add('resolved_alerts', record)
+    return changes.as_dict()
+
+
+def diff_artifacts(storage, scan_type: str, previous_key: str, current_key: str) -> Dict[str, Any]:
+    """Diff two stored artifacts of the same scan type"""
+    if scan_type == 'nmap':
+        differ = diff_nmap
+    elif scan_type == 'zap':
+        differ = diff_zap
+    else:
+        raise ValueError(f"Diffs are not supported for {scan_type} scans")
+    return differ(read_jsonl(storage.iter_chunks(previous_key)), read_jsonl(storage.iter_chunks(current_key)))
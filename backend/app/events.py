@@ -0,0 +1,121 @@
+"""
+Scan progress events for PTaaS
+
+Celery workers publish every progress update to a single Redis pub/sub
+channel. The API process holds exactly one subscription to that channel and
+fans each message out to all connected dashboard streams, so Redis load does
+not grow with the number of open browser tabs.
+"""
+import asyncio
+import json
+import os
+from typing import Any, Dict, Optional, Set
+
+import redis.asyncio as aioredis
+
+from .registry import get_registry
+
+EVENTS_CHANNEL = os.getenv('SCAN_EVENTS_CHANNEL', 'ptaas:scan-events')
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv('SCAN_EVENTS_QUEUE_SIZE', '256'))
+# Extra progress fields forwarded from task meta when present
+PROGRESS_DETAIL_KEYS = ('phase', 'eta', 'hosts_done', 'parameters_tested', 'injectable')
+
+
+def publish_scan_event(task_id: str, state: str, meta: Optional[Dict[str, Any]] = None, **extra: Any) -> None:
+    """Publish a progress event and mirror the latest progress into the registry (worker side)"""
+    meta = meta if isinstance(meta, dict) else {}
+    event = {
+        'task_id': task_id,
+        'state': state,
+        'progress': meta.get('progress', 0),
+        'status': meta.get('status') or meta.get('error') or state.title(),
+    }
+    # Optional detail from the live output parsers (see app.progress)
+    event.update({k: meta[k] for k in PROGRESS_DETAIL_KEYS if meta.get(k) is not None})
+    event.update(extra)
+
+    registry = get_registry()
+    pipe = registry.client.pipeline(transaction=False)
+    registry.update(task_id, pipe=pipe, state=state, progress=event['progress'], status=event['status'],
+                    **{k: event[k] for k in PROGRESS_DETAIL_KEYS if k in event})
+    pipe.publish(EVENTS_CHANNEL, json.dumps(event))
+    pipe.execute()
+
+
+class ScanEventBroadcaster:
+    """Single Redis subscription fanned out to any number of asyncio queues"""
+
+    def __init__(self, redis_url: Optional[str] = None, channel: str = EVENTS_CHANNEL):
+        self.redis_url = redis_url or get_registry().redis_url
+        self.channel = channel
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._listeners = []
+        self._client = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add_listener(self, callback) -> None:
+        """Register a coroutine function called for every event (e.g. cache invalidation)"""
+        self._listeners.append(callback)
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._client = aioredis.Redis.from_url(self.redis_url, decode_responses=True)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def _fan_out(self, event: Dict[str, Any]) -> None:
+        for queue in list(self._subscribers):
+            if queue.full():
+                # Slow consumer: drop its oldest event rather than blocking everyone
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(event)
+
+    async def _run(self) -> None:
+        while True:
+            pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    try:
+                        event = json.loads(message['data'])
+                    except (TypeError, ValueError):
+                        continue
+                    self._fan_out(event)
+                    for callback in self._listeners:
+                        try:
+                            await callback(event)
+                        except Exception as e:
+                            print(f"[Events] Listener error: {e}")
+            except asyncio.CancelledError:
+                await pubsub.aclose()
+                raise
+            except Exception as e:
+                print(f"[Events] Subscription error, reconnecting: {e}")
+                await pubsub.aclose()
+                await asyncio.sleep(1)
+
+
+broadcaster = ScanEventBroadcaster()
@@ -0,0 +1,381 @@
+"""
+Local findings index for PTaaS
+
+An SQLite copy of the DefectDojo findings with B-tree indexes on the
+filterable columns and an FTS5 table for text search. It is kept current by
+incremental syncs (newest last_status_update first, stopping at the stored
+cursor), an immediate sync after every DefectDojo import and a periodic full
+resync that also drops findings deleted in DefectDojo.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import aclosing
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+INDEX_PATH = os.getenv(
+    'FINDINGS_INDEX_PATH',
+    os.path.join(os.path.dirname(__file__), '..', 'data', 'findings.db')
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS findings (
+    id INTEGER PRIMARY KEY,
+    title TEXT,
+    severity TEXT,
+    active INTEGER,
+    verified INTEGER,
+    date TEXT,
+    test_id INTEGER,
+    engagement_id INTEGER,
+    product_id INTEGER,
+    product_name TEXT,
+    scan_type TEXT,
+    last_status_update TEXT,
+    sync_run INTEGER,
+    payload TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_findings_severity ON findings(severity);
+CREATE INDEX IF NOT EXISTS idx_findings_test ON findings(test_id);
+CREATE INDEX IF NOT EXISTS idx_findings_engagement ON findings(engagement_id);
+CREATE INDEX IF NOT EXISTS idx_findings_product ON findings(product_id);
+CREATE INDEX IF NOT EXISTS idx_findings_product_name ON findings(product_name);
+CREATE INDEX IF NOT EXISTS idx_findings_scan_type ON findings(scan_type);
+CREATE VIRTUAL TABLE IF NOT EXISTS findings_fts USING fts5(title, description);
+CREATE TABLE IF NOT EXISTS index_meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# Deletes the sync lock only if it still holds our token (it may have expired
+# and been taken by another process meanwhile)
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Aggregate counters kept current by triggers, so summaries never rescan findings.
+# INSERT OR REPLACE fires the delete trigger for the replaced row because
+# recursive_triggers is enabled on the connection.
+COUNTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS finding_counts (
+    dimension TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, key)
+);
+CREATE TRIGGER IF NOT EXISTS findings_counts_insert AFTER INSERT ON findings BEGIN
+    INSERT INTO finding_counts(dimension, key, count)
+    SELECT d, k, 1 FROM (
+        SELECT 'severity' AS d, NEW.severity AS k
+        UNION ALL SELECT 'severity_active', NEW.severity WHERE NEW.active = 1
+        UNION ALL SELECT 'test', NEW.test_id
+        UNION ALL SELECT 'engagement', NEW.engagement_id
+        UNION ALL SELECT 'scan_type', NEW.scan_type
+    ) WHERE k IS NOT NULL
+    ON CONFLICT(dimension, key) DO UPDATE SET count = count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS findings_counts_delete AFTER DELETE ON findings BEGIN
+    UPDATE finding_counts SET count = count - 1
+    WHERE (dimension = 'severity' AND key = OLD.severity)
+       OR (dimension = 'severity_active' AND key = OLD.severity AND OLD.active = 1)
+       OR (dimension = 'test' AND key = CAST(OLD.test_id AS TEXT))
+       OR (dimension = 'engagement' AND key = CAST(OLD.engagement_id AS TEXT))
+       OR (dimension = 'scan_type' AND key = OLD.scan_type);
+    DELETE FROM finding_counts WHERE count <= 0;
+END;
+"""
+
+COUNTS_BACKFILL = """
+DELETE FROM finding_counts;
+INSERT INTO finding_counts(dimension, key, count)
+    SELECT 'severity', severity, COUNT(*) FROM findings WHERE severity IS NOT NULL GROUP BY severity
+    UNION ALL SELECT 'severity_active', severity, COUNT(*) FROM findings
+        WHERE severity IS NOT NULL AND active = 1 GROUP BY severity
+    UNION ALL SELECT 'test', test_id, COUNT(*) FROM findings WHERE test_id IS NOT NULL GROUP BY test_id
+    UNION ALL SELECT 'engagement', engagement_id, COUNT(*) FROM findings
+        WHERE engagement_id IS NOT NULL GROUP BY engagement_id
+    UNION ALL SELECT 'scan_type', scan_type, COUNT(*) FROM findings WHERE scan_type IS NOT NULL GROUP BY scan_type;
+"""
+
+
+def _related(finding: Dict[str, Any]) -> Tuple[Optional[int], Optional[int], Optional[int], Optional[str], Optional[str]]:
+    """(test_id, engagement_id, product_id, product_name, scan_type) from a finding fetched with related_fields"""
+    related = finding.get('related_fields') or {}
+    test = related.get('test') if isinstance(related.get('test'), dict) else {}
+    engagement = test.get('engagement') if isinstance(test.get('engagement'), dict) else {}
+    product = engagement.get('product') if isinstance(engagement.get('product'), dict) else {}
+    test_type = test.get('test_type') if isinstance(test.get('test_type'), dict) else {}
+
+    test_id = test.get('id') or (finding.get('test') if isinstance(finding.get('test'), int) else None)
+    scan_type = test_type.get('name') or test.get('scan_type') or finding.get('scan_type')
+    return test_id, engagement.get('id'), product.get('id'), product.get('name'), scan_type
+
+
+class FindingsIndex:
+    """SQLite-backed findings store; safe to share between threads"""
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('PRAGMA recursive_triggers=ON')
+            self._conn.executescript(SCHEMA)
+            counts_missing = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'finding_counts'"
+            ).fetchone() is None
+            self._conn.executescript(COUNTS_SCHEMA)
+            if counts_missing:
+                # Index files created before the counters existed
+                self._conn.executescript(COUNTS_BACKFILL)
+
+    # ----- metadata -----
+
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM index_meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else default
+
+    def set_meta(self, key: str, value: Any) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO index_meta(key, value) VALUES (?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+                (key, str(value))
+            )
+
+    def ready(self) -> bool:
+        """True once at least one full sync has completed"""
+        return self.get_meta('last_full_sync') is not None
+
+    # ----- writes -----
+
+    def upsert(self, findings: Iterable[Dict[str, Any]], sync_run: int = 0) -> int:
+        """Insert or replace findings; returns the number written"""
+        rows = []
+        for f in findings:
+            test_id, engagement_id, product_id, product_name, scan_type = _related(f)
+            rows.append((
+                f['id'], f.get('title'), f.get('severity'), int(bool(f.get('active', True))),
+                int(bool(f.get('verified', False))), str(f.get('date')) if f.get('date') else None,
+                test_id, engagement_id, product_id, product_name, scan_type,
+                f.get('last_status_update'), sync_run, json.dumps(f),
+                f.get('description') or ''
+            ))
+        if not rows:
+            return 0
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO findings (id, title, severity, active, verified, date, test_id, '
+                'engagement_id, product_id, product_name, scan_type, last_status_update, sync_run, payload) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [r[:-1] for r in rows]
+            )
+            self._conn.executemany('DELETE FROM findings_fts WHERE rowid = ?', [(r[0],) for r in rows])
+            self._conn.executemany(
+                'INSERT INTO findings_fts(rowid, title, description) VALUES (?, ?, ?)',
+                [(r[0], r[1] or '', r[-1]) for r in rows]
+            )
+        return len(rows)
+
+    def prune(self, sync_run: int) -> int:
+        """Delete findings not seen by the given full sync run"""
+        with self._lock, self._conn:
+            stale = [r['id'] for r in self._conn.execute('SELECT id FROM findings WHERE sync_run != ?', (sync_run,))]
+            if stale:
+                self._conn.executemany('DELETE FROM findings WHERE id = ?', [(i,) for i in stale])
+                self._conn.executemany('DELETE FROM findings_fts WHERE rowid = ?', [(i,) for i in stale])
+        return len(stale)
+
+    # ----- reads -----
+
+    def query(
+        self,
+        severity: Optional[str] = None,
+        product: Optional[str] = None,
+        test_id: Optional[int] = None,
+        scan_type: Optional[str] = None,
+        q: Optional[str] = None,
+        active: Optional[bool] = None,
+        limit: int = 100,
+        offset: int = 0
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """Filtered, paginated findings (newest first) and the total match count"""
+        clauses, params = [], []
+        if severity:
+            clauses.append('f.severity = ?')
+            params.append(severity)
+        if product:
+            if str(product).isdigit():
+                clauses.append('f.product_id = ?')
+                params.append(int(product))
+            else:
+                clauses.append('f.product_name = ?')
+                params.append(product)
+        if test_id is not None:
+            clauses.append('f.test_id = ?')
+            params.append(test_id)
+        if scan_type:
+            clauses.append('LOWER(f.scan_type) LIKE ?')
+            params.append(f'%{scan_type.lower()}%')
+        if active is not None:
+            clauses.append('f.active = ?')
+            params.append(int(active))
+        if q:
+            # Quote each term so user input cannot inject FTS5 query syntax
+            terms = ' '.join('"' + t.replace('"', '""') + '"' for t in q.split())
+            clauses.append('f.id IN (SELECT rowid FROM findings_fts WHERE findings_fts MATCH ?)')
+            params.append(terms)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._lock:
+            total = self._conn.execute(f'SELECT COUNT(*) FROM findings f {where}', params).fetchone()[0]
+            rows = self._conn.execute(
+                f'SELECT f.payload FROM findings f {where} ORDER BY f.id DESC LIMIT ? OFFSET ?',
+                params + [limit, offset]
+            ).fetchall()
+        return total, [json.loads(r['payload']) for r in rows]
+
+    def get(self, finding_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute('SELECT payload FROM findings WHERE id = ?', (finding_id,)).fetchone()
+        return json.loads(row['payload']) if row else None
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """Pre-aggregated finding counts: {dimension: {key: count}}"""
+        with self._lock:
+            rows = self._conn.execute('SELECT dimension, key, count FROM finding_counts').fetchall()
+        result: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            result.setdefault(row['dimension'], {})[str(row['key'])] = row['count']
+        return result
+
+
+class FindingsSyncer:
+    """Pulls findings from DefectDojo into a FindingsIndex"""
+
+    def __init__(self, index: FindingsIndex, full_sync_interval: float = None,
+                 redis_client=None, lock_key: str = 'ptaas:lock:findings-sync'):
+        self.index = index
+        self.full_sync_interval = full_sync_interval if full_sync_interval is not None else float(
+            os.getenv('FINDINGS_FULL_SYNC_INTERVAL', '3600')
+        )
+        # Several API processes share one index file; only the lock holder syncs
+        self.redis_client = redis_client
+        self.lock_key = lock_key
+        self.lock_ttl = int(os.getenv('FINDINGS_SYNC_LOCK_TTL', '600'))
+        self._lock_token: Optional[str] = None
+        self._release = redis_client.register_script(_RELEASE_LOCK_SCRIPT) if redis_client is not None else None
+        self._wakeup = asyncio.Event()
+
+    def request_sync(self) -> None:
+        """Ask the background loop to sync now (e.g. after a DefectDojo import)"""
+        self._wakeup.set()
+
+    async def run(self, dojo_client, interval: float) -> None:
+        """Background loop: sync every `interval` seconds or when requested"""
+        self._wakeup.set()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not await asyncio.to_thread(self._acquire_lock):
+                continue
+            try:
+                await self.sync(dojo_client)
+            except Exception as e:
+                print(f"[FindingsIndex] Sync failed: {e}")
+            finally:
+                await asyncio.to_thread(self._release_lock)
+
+    def _acquire_lock(self) -> bool:
+        if self.redis_client is None:
+            return True
+        token = f"{os.getpid()}:{uuid.uuid4().hex}"
+        try:
+            if self.redis_client.set(self.lock_key, token, nx=True, ex=self.lock_ttl):
+                self._lock_token = token
+                return True
+            return False
+        except Exception as e:
+            print(f"[FindingsIndex] Could not take sync lock: {e}")
+            return False
+
+    def _release_lock(self) -> None:
+        if self.redis_client is not None and self._lock_token is not None:
+            try:
+                self._release(keys=[self.lock_key], args=[self._lock_token])
+            except Exception:
+                pass
+            self._lock_token = None
+
+    def _needs_full_sync(self) -> bool:
+        last_full = self.index.get_meta('last_full_sync')
+        return last_full is None or time.time() - float(last_full) > self.full_sync_interval
+
+    async def sync(self, dojo_client, full: bool = False) -> int:
+        """Run an incremental (or full) sync with an AsyncDefectDojoClient; returns findings written"""
+        full = full or await asyncio.to_thread(self._needs_full_sync)
+        cursor = None if full else await asyncio.to_thread(self.index.get_meta, 'cursor')
+        sync_run = time.time_ns()
+        newest = cursor
+        written = 0
+
+        params = {'related_fields': 'true', 'o': '-last_status_update'}
+        async with aclosing(dojo_client.iter_pages('findings/', params=params)) as pages:
+            async for page in pages:
+                reached_cursor = False
+                if cursor is not None:
+                    fresh = []
+                    for f in page:
+                        stamp = f.get('last_status_update')
+                        # Findings without a timestamp cannot be ordered; always refresh them
+                        if stamp is None or stamp >= cursor:
+                            fresh.append(f)
+                        else:
+                            reached_cursor = True
+                    page = fresh
+                if page:
+                    written += await asyncio.to_thread(self.index.upsert, page, sync_run)
+                    stamps = [f.get('last_status_update') for f in page if f.get('last_status_update')]
+                    if stamps:
+                        newest = max([newest] + stamps) if newest else max(stamps)
+                if reached_cursor:
+                    # Ordered newest first: everything further back is already indexed
+                    break
+
+        if newest:
+            await asyncio.to_thread(self.index.set_meta, 'cursor', newest)
+        if full:
+            pruned = await asyncio.to_thread(self.index.prune, sync_run)
+            await asyncio.to_thread(self.index.set_meta, 'last_full_sync', time.time())
+            print(f"[FindingsIndex] Full sync: {written} findings, {pruned} removed")
+        elif written:
+            print(f"[FindingsIndex] Incremental sync: {written} findings updated")
+        return written
+
+
+_index: Optional[FindingsIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_findings_index() -> FindingsIndex:
+    """Return the process-wide FindingsIndex, creating it on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = FindingsIndex()
+    return _index
@@ -0,0 +1,87 @@
+"""
+Docker client for PTaaS scanner containers
+"""
+import os
+import threading
+import time
+from typing import BinaryIO, Callable, Optional, Tuple
+
+import docker
+
+# Seconds between liveness pings of the shared client
+DOCKER_HEALTH_INTERVAL = float(os.getenv('DOCKER_HEALTH_INTERVAL', '30'))
+
+_docker_client: Optional[docker.DockerClient] = None
+_docker_checked_at = 0.0
+_docker_lock = threading.Lock()
+
+
+def get_docker_client() -> docker.DockerClient:
+    """
+    Return the process-wide Docker client, creating it on first use
+    The client is pinged at most every DOCKER_HEALTH_INTERVAL seconds and
+    rebuilt if the daemon connection has gone bad
+    """
+    global _docker_client, _docker_checked_at
+    with _docker_lock:
+        now = time.monotonic()
+        if _docker_client is not None and now - _docker_checked_at > DOCKER_HEALTH_INTERVAL:
+            try:
+                _docker_client.ping()
+                _docker_checked_at = now
+            except Exception as e:
+                print(f"[Docker] Client unhealthy, reconnecting: {e}")
+                try:
+                    _docker_client.close()
+                except Exception:
+                    pass
+                _docker_client = None
+
+        if _docker_client is None:
+            _docker_client = docker.from_env(
+                max_pool_size=int(os.getenv('DOCKER_MAX_POOL_SIZE', '10'))
+            )
+            _docker_checked_at = now
+        return _docker_client
+
+
+def exec_stream(
+    container,
+    command: str,
+    output: BinaryIO,
+    merge_stderr: bool = False,
+    on_output: Optional[Callable[[bytes], None]] = None,
+    stderr_tail: int = 4096
+) -> Tuple[int, bytes]:
+    """
+    Run a command in a container, streaming its stdout into `output`
+    (any writable binary file) chunk by chunk instead of buffering it
+
+    Args:
+        container: docker Container to exec in
+        command: Command line to run
+        output: Writable binary file object receiving stdout
+        merge_stderr: Also write stderr into `output`
+        on_output: Called with every chunk written to `output`
+        stderr_tail: Bytes of (unmerged) stderr kept for error messages
+
+    Returns:
+        (exit code, last `stderr_tail` bytes of stderr)
+    """
+    api = container.client.api
+    exec_id = api.exec_create(container.id, command, stdout=True, stderr=True)['Id']
+    tail = bytearray()
+
+    for stdout, stderr in api.exec_start(exec_id, stream=True, demux=True):
+        if stderr and not merge_stderr:
+            tail += stderr
+            del tail[:-stderr_tail]
+            stderr = None
+        for chunk in (stdout, stderr):
+            if chunk:
+                output.write(chunk)
+                if on_output:
+                    on_output(chunk)
+
+    exit_code = api.exec_inspect(exec_id).get('ExitCode')
+    return exit_code, bytes(tail)
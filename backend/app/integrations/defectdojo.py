@@ -1,46 +1,213 @@
 """
 DefectDojo API Client for PTaaS
 """
-import requests
-from typing import Optional, List, Dict, Any
+import asyncio
+import threading
+import time
+import httpx
+from typing import Optional, List, Dict, Any, AsyncIterator, Iterator, BinaryIO, Union
 import os
+from datetime import date
 from io import BytesIO
+from .lookup_cache import get_lookup_cache
 
-class DefectDojoClient:
+# Status codes worth retrying for idempotent requests
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+
+def summarize_finding(f: Dict[str, Any]) -> Dict[str, Any]:
+    """Transform a raw finding to match our ResultResponse model"""
+    return {
+        'id': f['id'],
+        'title': f['title'],
+        'severity': f['severity'],
+        'description': f.get('description'),
+        'mitigation': f.get('mitigation'),
+        'impact': f.get('impact'),
+        'references': f.get('references'),
+        'cve': f.get('cve'),
+        'cvss_score': f.get('cvssv3_score'),
+        'found_by': [str(fb) for fb in f.get('found_by', [])] if f.get('found_by') else [],
+        'url': f.get('url'),
+        'date': str(f.get('date')) if f.get('date') else None,
+        'active': f.get('active', True),
+        'verified': f.get('verified', False)
+    }
+
+
+def finding_detail(finding: Dict[str, Any]) -> Dict[str, Any]:
+    """Transform a raw finding into the detail payload"""
+    return {
+        'id': finding['id'],
+        'title': finding['title'],
+        'severity': finding['severity'],
+        'description': finding.get('description'),
+        'mitigation': finding.get('mitigation'),
+        'impact': finding.get('impact'),
+        'references': finding.get('references'),
+        'cve': finding.get('cve'),
+        'cvss_score': finding.get('cvssv3_score'),
+        'found_by': finding.get('found_by', []),
+        'url': finding.get('url'),
+        'date': finding.get('date'),
+        'active': finding.get('active', True),
+        'verified': finding.get('verified', False),
+        'endpoints': finding.get('endpoints', []),
+        'tags': finding.get('tags', [])
+    }
+
+
+class _DefectDojoBase:
     """
-    Client for interacting with DefectDojo API
+    Shared configuration for the sync and async DefectDojo clients
     Supports both local and production environments via environment variables
     """
-    
+
     def __init__(self):
         self.base_url = os.getenv('DEFECTDOJO_URL', 'http://nginx:8080')
         self.api_key = os.getenv('DEFECTDOJO_API_KEY')
-        
+
         if not self.api_key:
             print("Warning: DEFECTDOJO_API_KEY not set")
-        
-        self.headers = {
-            'Authorization': f'Token {self.api_key}',
-            'Content-Type': 'application/json'
+
+        self.timeout = httpx.Timeout(
+            float(os.getenv('DOJO_TIMEOUT', '30')),
+            connect=float(os.getenv('DOJO_CONNECT_TIMEOUT', '5'))
+        )
+        # Imports can take minutes while DefectDojo parses the report
+        self.import_timeout = httpx.Timeout(
+            float(os.getenv('DOJO_IMPORT_TIMEOUT', '600')),
+            connect=float(os.getenv('DOJO_CONNECT_TIMEOUT', '5'))
+        )
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv('DOJO_MAX_CONNECTIONS', '20')),
+            max_keepalive_connections=int(os.getenv('DOJO_MAX_KEEPALIVE', '10')),
+            keepalive_expiry=float(os.getenv('DOJO_KEEPALIVE_EXPIRY', '30'))
+        )
+        self.retries = int(os.getenv('DOJO_RETRIES', '3'))
+        self.retry_backoff = float(os.getenv('DOJO_RETRY_BACKOFF', '0.5'))
+        # Collection reads are split into pages of this size
+        self.page_size = int(os.getenv('DOJO_PAGE_SIZE', '250'))
+        self.page_concurrency = int(os.getenv('DOJO_PAGE_CONCURRENCY', '4'))
+        # Product / product type / engagement IDs shared with every other process
+        self.ids = get_lookup_cache()
+
+    def _client_kwargs(self) -> Dict[str, Any]:
+        return {
+            'base_url': f"{self.base_url}/api/v2/",
+            'headers': {'Authorization': f'Token {self.api_key}'},
+            'timeout': self.timeout,
+        }
+
+    def _should_retry(self, method: str, attempt: int, response: Optional[httpx.Response] = None) -> bool:
+        """Retry idempotent requests on transport errors and overload status codes"""
+        if attempt >= self.retries or method.upper() not in ('GET', 'HEAD'):
+            return False
+        return response is None or response.status_code in RETRY_STATUS_CODES
+
+    def _backoff(self, attempt: int) -> float:
+        return self.retry_backoff * (2 ** attempt)
+
+    @staticmethod
+    def _log_error(e: Exception):
+        print(f"[DefectDojo] API error: {e}")
+        response = getattr(e, 'response', None)
+        if response is not None:
+            print(f"Response: {response.text}")
+
+    @staticmethod
+    def _import_form(scan_type: str, product_name: str, engagement_name: str, auto_create: bool) -> Dict[str, str]:
+        return {
+            'scan_type': scan_type,
+            'product_name': product_name,
+            'engagement_name': engagement_name,
+            'auto_create_context': str(auto_create).lower(),
+            'active': 'true',
+            'verified': 'false',
+            'close_old_findings': 'false'
         }
-    
+
+
+class DefectDojoClient(_DefectDojoBase):
+    """
+    Blocking client for interacting with DefectDojo API (used by Celery workers)
+    Reuses one pooled keep-alive connection set per instance
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.http = httpx.Client(
+            transport=httpx.HTTPTransport(retries=self.retries, limits=self.limits),
+            **self._client_kwargs()
+        )
+
+    def close(self):
+        self.http.close()
+
+    def _send(self, method: str, endpoint: str, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                response = self.http.request(method, endpoint, **kwargs)
+            except httpx.TransportError:
+                if not self._should_retry(method, attempt):
+                    raise
+            else:
+                if not self._should_retry(method, attempt, response):
+                    return response
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
     def _request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
         """Make HTTP request to DefectDojo API"""
-        url = f"{self.base_url}/api/v2/{endpoint}"
-        
         try:
-            response = requests.request(method, url, headers=self.headers, **kwargs)
+            response = self._send(method, endpoint, **kwargs)
             response.raise_for_status()
             return response.json() if response.content else {}
-        except requests.exceptions.RequestException as e:
-            print(f"[DefectDojo] API error: {e}")
-            if hasattr(e.response, 'text'):
-                print(f"Response: {e.response.text}")
+        except httpx.HTTPError as e:
+            self._log_error(e)
             raise
-    
+
+    def iter_pages(
+        self,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        max_items: Optional[int] = None,
+        offset: int = 0
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yield successive pages of a DefectDojo collection, following `next` links
+        until the collection or max_items is exhausted
+        """
+        remaining = max_items
+        params = dict(params or {})
+        params.update({'limit': min(self.page_size, remaining or self.page_size), 'offset': offset})
+        endpoint_or_url = endpoint
+
+        while True:
+            data = self._request('GET', endpoint_or_url, params=params)
+            results = data.get('results', [])
+            if remaining is not None:
+                results = results[:remaining]
+                remaining -= len(results)
+            if results:
+                yield results
+            if not data.get('next') or not results or remaining == 0:
+                return
+            # The next link already carries every query parameter
+            endpoint_or_url, params = data['next'], None
+
+    def collect(self, endpoint: str, params: Optional[Dict[str, Any]] = None,
+                max_items: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """All items of a collection (up to max_items) as one list"""
+        items: List[Dict[str, Any]] = []
+        for page in self.iter_pages(endpoint, params, max_items=max_items, offset=offset):
+            items.extend(page)
+        return items
+
     def import_scan(
         self,
-        file_content: bytes,
+        file_content: Union[bytes, BinaryIO],
         filename: str,
         scan_type: str,
         engagement_name: str,
@@ -49,79 +216,127 @@ class DefectDojoClient:
     ) -> Dict[str, Any]:
         """
         Import scan results into DefectDojo
-        
+
         Args:
-            file_content: Scan file content as bytes
+            file_content: Scan file content as bytes or a readable binary file
             filename: Name of the scan file
             scan_type: Type of scan (e.g., "Nmap Scan", "ZAP Scan")
             engagement_name: Name for the engagement
             product_name: Product name (will be created if doesn't exist)
             auto_create: Auto-create product and engagement if needed
-            
+
         Returns:
             Import result from DefectDojo API
         """
         # Ensure product exists first
         self._ensure_product_exists(product_name)
-        
-        import_url = f"{self.base_url}/api/v2/import-scan/"
-        
-        # Prepare headers without Content-Type (let requests handle multipart)
-        headers = {
-            'Authorization': f'Token {self.api_key}'
+
+        # Prepare multipart form data (httpx sets the multipart Content-Type)
+        # File objects are streamed by httpx rather than copied into the body
+        files = {
+            'file': (filename, BytesIO(file_content) if isinstance(file_content, bytes) else file_content)
         }
-        
-        # Prepare multipart form data
+
+        data = self._import_form(scan_type, product_name, engagement_name, auto_create)
+
+        try:
+            response = self._send('POST', 'import-scan/', data=data, files=files, timeout=self.import_timeout)
+
+            if response.status_code in [200, 201]:
+                print(f"[DefectDojo] Imported {scan_type} successfully")
+                return response.json()
+            else:
+                print(f"[DefectDojo] Import failed: {response.status_code}")
+                print(f"Response: {response.text}")
+                return {'error': response.text, 'status_code': response.status_code}
+
+        except Exception as e:
+            print(f"[DefectDojo] Import error: {e}")
+            raise
+
+    def reimport_scan(
+        self,
+        test_id: int,
+        file_content: Union[bytes, BinaryIO],
+        filename: str,
+        scan_type: str,
+        close_old_findings: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Re-import a scan into an existing test
+
+        DefectDojo matches the report against the test's findings: only new
+        findings are created and, with close_old_findings, the ones missing
+        from the report are mitigated. Unchanged findings are left as they are.
+
+        Returns:
+            Reimport result from DefectDojo API (or an error dict like import_scan)
+        """
         files = {
-            'file': (filename, BytesIO(file_content))
+            'file': (filename, BytesIO(file_content) if isinstance(file_content, bytes) else file_content)
         }
-        
         data = {
+            'test': str(test_id),
             'scan_type': scan_type,
-            'product_name': product_name,
-            'engagement_name': engagement_name,
-            'auto_create_context': str(auto_create).lower(),
             'active': 'true',
             'verified': 'false',
-            'close_old_findings': 'false'
+            'close_old_findings': str(close_old_findings).lower()
         }
-        
+
         try:
-            response = requests.post(import_url, headers=headers, data=data, files=files)
-            
+            response = self._send('POST', 'reimport-scan/', data=data, files=files, timeout=self.import_timeout)
+
             if response.status_code in [200, 201]:
-                print(f"[DefectDojo] Imported {scan_type} successfully")
+                print(f"[DefectDojo] Reimported {scan_type} into test {test_id}")
                 return response.json()
             else:
-                print(f"[DefectDojo] Import failed: {response.status_code}")
+                print(f"[DefectDojo] Reimport failed: {response.status_code}")
                 print(f"Response: {response.text}")
                 return {'error': response.text, 'status_code': response.status_code}
-                
+
         except Exception as e:
-            print(f"[DefectDojo] Import error: {e}")
+            print(f"[DefectDojo] Reimport error: {e}")
             raise
-    
+
+    def _product_id(self, product_name: str) -> Optional[int]:
+        """Product ID by name, served from the lookup cache when possible"""
+        hit, product_id = self.ids.get('product', product_name)
+        if hit:
+            return product_id
+        products = self._request('GET', 'products/', params={'name': product_name})
+        product_id = products['results'][0]['id'] if products.get('results') else None
+        self.ids.set('product', product_name, product_id)
+        return product_id
+
+    def _default_product_type_id(self) -> int:
+        """First product type, creating 'Security Testing' if none exists"""
+        hit, prod_type_id = self.ids.get('product_type', 'default')
+        if hit and prod_type_id is not None:
+            return prod_type_id
+
+        product_types = self._request('GET', 'product_types/')
+        if not product_types.get('results'):
+            # Create default product type if none exists
+            pt_data = {'name': 'Security Testing', 'description': 'Security testing projects'}
+            product_type = self._request('POST', 'product_types/', json=pt_data)
+            prod_type_id = product_type['id']
+            print(f"Created product type 'Security Testing' (ID: {prod_type_id})")
+        else:
+            prod_type_id = product_types['results'][0]['id']
+            print(f"Using product type ID: {prod_type_id}")
+        self.ids.set('product_type', 'default', prod_type_id)
+        return prod_type_id
+
     def _ensure_product_exists(self, product_name: str) -> Dict[str, Any]:
         """Create product if it doesn't exist"""
         try:
             # Check if product exists
-            products = self._request('GET', f'products/?name={product_name}')
-            if products.get('results'):
-                print(f"Product '{product_name}' exists")
-                return products['results'][0]
-            
-            # Get first available product type
-            product_types = self._request('GET', 'product_types/')
-            if not product_types.get('results'):
-                # Create default product type if none exists
-                pt_data = {'name': 'Security Testing', 'description': 'Security testing projects'}
-                product_type = self._request('POST', 'product_types/', json=pt_data)
-                prod_type_id = product_type['id']
-                print(f"Created product type 'Security Testing' (ID: {prod_type_id})")
-            else:
-                prod_type_id = product_types['results'][0]['id']
-                print(f"Using product type ID: {prod_type_id}")
-            
+            product_id = self._product_id(product_name)
+            if product_id is not None:
+                return {'id': product_id, 'name': product_name}
+
+            prod_type_id = self._default_product_type_id()
+
             # Create product
             print(f"Creating product '{product_name}'...")
             product_data = {
@@ -129,15 +344,53 @@ class DefectDojoClient:
                 'description': 'PTaaS Security Testing Project',
                 'prod_type': prod_type_id
             }
-            
+
             new_product = self._request('POST', 'products/', json=product_data)
+            self.ids.set('product', product_name, new_product['id'])
             print(f"Created product '{product_name}' (ID: {new_product['id']})")
             return new_product
-            
+
         except Exception as e:
             print(f"Warning: Could not ensure product exists: {e}")
             return {}
-    
+
+    def ensure_engagement(self, engagement_name: str, product_name: str) -> Optional[int]:
+        """
+        Engagement ID by name within a product, creating it if needed
+        Lets many concurrent imports share one engagement instead of racing auto_create
+        """
+        product_id = self._ensure_product_exists(product_name).get('id')
+        if product_id is None:
+            return None
+
+        cache_name = f"{product_id}:{engagement_name}"
+        hit, engagement_id = self.ids.get('engagement', cache_name)
+        if hit and engagement_id is not None:
+            return engagement_id
+
+        try:
+            existing = self._request('GET', 'engagements/', params={'product': product_id, 'name': engagement_name})
+            if existing.get('results'):
+                engagement_id = existing['results'][0]['id']
+            else:
+                today = date.today().isoformat()
+                engagement = self._request('POST', 'engagements/', json={
+                    'name': engagement_name,
+                    'product': product_id,
+                    'target_start': today,
+                    'target_end': today,
+                    'engagement_type': 'Interactive',
+                    'status': 'In Progress'
+                })
+                engagement_id = engagement['id']
+                print(f"[DefectDojo] Created engagement '{engagement_name}' (ID: {engagement_id})")
+        except httpx.HTTPError as e:
+            print(f"Warning: Could not ensure engagement exists: {e}")
+            return None
+
+        self.ids.set('engagement', cache_name, engagement_id)
+        return engagement_id
+
     def get_findings(
         self,
         product_name: Optional[str] = None,
@@ -147,13 +400,13 @@ class DefectDojoClient:
     ) -> List[Dict[str, Any]]:
         """
         Get findings from DefectDojo
-        
+
         Args:
             product_name: Filter by product name
             severity: Filter by severity (Critical, High, Medium, Low, Info)
             active: Only active findings
             limit: Maximum number of results
-            
+
         Returns:
             List of findings
         """
@@ -161,68 +414,32 @@ class DefectDojoClient:
             'limit': limit,
             'active': str(active).lower()
         }
-        
-        if product_name:
-            # First, get product ID
-            products = self._request('GET', f'products/?name={product_name}')
-            if products.get('results'):
-                params['test__engagement__product'] = products['results'][0]['id']
-        
-        if severity:
-            params['severity'] = severity
-        
+
         try:
+            if product_name:
+                # First, get product ID
+                product_id = self._product_id(product_name)
+                if product_id is not None:
+                    params['test__engagement__product'] = product_id
+
+            if severity:
+                params['severity'] = severity
+
             response = self._request('GET', 'findings/', params=params)
-            findings = response.get('results', [])
-            
-            # Transform findings to match our ResultResponse model
-            return [{
-                'id': f['id'],
-                'title': f['title'],
-                'severity': f['severity'],
-                'description': f.get('description'),
-                'mitigation': f.get('mitigation'),
-                'impact': f.get('impact'),
-                'references': f.get('references'),
-                'cve': f.get('cve'),
-                'cvss_score': f.get('cvssv3_score'),
-                'found_by': [str(fb) for fb in f.get('found_by', [])] if f.get('found_by') else [],
-                'url': f.get('url'),
-                'date': str(f.get('date')) if f.get('date') else None,
-                'active': f.get('active', True),
-                'verified': f.get('verified', False)
-            } for f in findings]
-            
+            return [summarize_finding(f) for f in response.get('results', [])]
+
         except Exception as e:
             print(f"[DefectDojo] Get findings error: {e}")
             return []
-    
+
     def get_finding_detail(self, finding_id: int) -> Optional[Dict[str, Any]]:
         """Get detailed information about a specific finding"""
         try:
-            finding = self._request('GET', f'findings/{finding_id}/')
-            return {
-                'id': finding['id'],
-                'title': finding['title'],
-                'severity': finding['severity'],
-                'description': finding.get('description'),
-                'mitigation': finding.get('mitigation'),
-                'impact': finding.get('impact'),
-                'references': finding.get('references'),
-                'cve': finding.get('cve'),
-                'cvss_score': finding.get('cvssv3_score'),
-                'found_by': finding.get('found_by', []),
-                'url': finding.get('url'),
-                'date': finding.get('date'),
-                'active': finding.get('active', True),
-                'verified': finding.get('verified', False),
-                'endpoints': finding.get('endpoints', []),
-                'tags': finding.get('tags', [])
-            }
+            return finding_detail(self._request('GET', f'findings/{finding_id}/'))
         except Exception as e:
             print(f"[DefectDojo] Get finding detail error: {e}")
             return None
-    
+
     def get_products(self) -> List[Dict[str, Any]]:
         """Get all products"""
         try:
@@ -235,8 +452,7 @@ class DefectDojoClient:
     def get_engagements(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Get engagements/tests for dashboard/history"""
         try:
-            response = self._request('GET', 'engagements/', params={'limit': limit})
-            return response.get('results', [])
+            return self.collect('engagements/', max_items=limit)
         except Exception as e:
             print(f"[DefectDojo] Get engagements error: {e}")
             return []
@@ -244,8 +460,7 @@ class DefectDojoClient:
     def list_findings_raw(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
         """Return raw findings payload (used by frontend to keep test info)"""
         try:
-            data = self._request('GET', 'findings/', params={'limit': limit, 'offset': offset})
-            return data.get('results', [])
+            return self.collect('findings/', max_items=limit, offset=offset)
         except Exception as e:
             print(f"[DefectDojo] List findings raw error: {e}")
             return []
@@ -253,8 +468,7 @@ class DefectDojoClient:
     def list_engagements_raw(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
         """Return raw engagements payload"""
         try:
-            data = self._request('GET', 'engagements/', params={'limit': limit, 'offset': offset})
-            return data.get('results', [])
+            return self.collect('engagements/', max_items=limit, offset=offset)
         except Exception as e:
             print(f"[DefectDojo] List engagements raw error: {e}")
             return []
@@ -262,8 +476,7 @@ class DefectDojoClient:
     def get_tests(self, limit: int = 1000) -> List[Dict[str, Any]]:
         """Get all tests with details"""
         try:
-            response = self._request('GET', 'tests/', params={'limit': limit})
-            return response.get('results', [])
+            return self.collect('tests/', max_items=limit)
         except Exception as e:
             print(f"[DefectDojo] Get tests error: {e}")
             return []
@@ -275,44 +488,35 @@ class DefectDojoClient:
         except Exception as e:
             print(f"[DefectDojo] Get test detail error: {e}")
             return None
-    
+
     def get_test_file(self, test_id: int) -> Optional[bytes]:
         """
         Try to download raw scan file from DefectDojo test
         DefectDojo may store file attachments in test files endpoint
-        Falls back to searching MinIO for matching raw files
+        Returns None so callers can fall back to MinIO
         """
         try:
-            # First, check if test has file_upload field or attachments
             test = self.get_test_detail(test_id)
             if not test:
                 return None
-            
-            # DefectDojo might have files in separate endpoint
+
             try:
                 files_response = self._request('GET', f'tests/{test_id}/files/')
                 if files_response and 'results' in files_response and len(files_response['results']) > 0:
-                    # Try to download the first file
                     file_obj = files_response['results'][0]
                     if 'file' in file_obj:
-                        file_url = file_obj['file']
-                        # Download the file
-                        headers = {'Authorization': f'Token {self.api_key}'}
-                        response = requests.get(file_url, headers=headers)
+                        response = self._send('GET', file_obj['file'])
                         if response.status_code == 200:
                             return response.content
-            except:
+            except Exception:
                 # DefectDojo may not have files endpoint, continue
                 pass
-            
-            # Fallback: Try to find raw file in MinIO by searching for test-related patterns
-            # This requires importing StorageClient, but avoid circular imports
-            # Instead, return None and let the endpoint handle MinIO fallback
+
             return None
         except Exception as e:
             print(f"[DefectDojo] Get test file error: {e}")
             return None
-    
+
     def create_product(self, name: str, description: str = "") -> Dict[str, Any]:
         """Create a new product"""
         data = {
@@ -320,9 +524,284 @@ class DefectDojoClient:
             'description': description,
             'prod_type': 1  # Default product type
         }
-        
+
         try:
             return self._request('POST', 'products/', json=data)
         except Exception as e:
             print(f"[DefectDojo] Create product error: {e}")
             raise
+
+
+class AsyncDefectDojoClient(_DefectDojoBase):
+    """
+    Non-blocking client for the API process
+    One instance per process (see get_async_dojo_client) so all requests share
+    a bounded keep-alive connection pool
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.http = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(retries=self.retries, limits=self.limits),
+            **self._client_kwargs()
+        )
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    async def _send(self, method: str, endpoint: str, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                response = await self.http.request(method, endpoint, **kwargs)
+            except httpx.TransportError:
+                if not self._should_retry(method, attempt):
+                    raise
+            else:
+                if not self._should_retry(method, attempt, response):
+                    return response
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def _request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
+        """Make HTTP request to DefectDojo API"""
+        try:
+            response = await self._send(method, endpoint, **kwargs)
+            response.raise_for_status()
+            return response.json() if response.content else {}
+        except httpx.HTTPError as e:
+            self._log_error(e)
+            raise
+
+    async def iter_pages(
+        self,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        max_items: Optional[int] = None,
+        offset: int = 0,
+        concurrency: Optional[int] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield pages of a DefectDojo collection in order
+
+        The first page reveals `count` and the page size DefectDojo actually
+        honoured; the remaining offsets are then fetched with at most
+        `concurrency` requests in flight. Collections without a count fall
+        back to following `next` links one by one.
+        """
+        params = dict(params or {})
+        concurrency = max(1, concurrency or self.page_concurrency)
+        first_limit = min(self.page_size, max_items) if max_items else self.page_size
+
+        first = await self._request('GET', endpoint, params={**params, 'limit': first_limit, 'offset': offset})
+        results = first.get('results', [])
+        if max_items is not None:
+            results = results[:max_items]
+        if results:
+            yield results
+        if not first.get('next') or not results:
+            return
+
+        count = first.get('count')
+        if count is None:
+            async for page in self._follow_next(first['next'], max_items, len(results)):
+                yield page
+            return
+
+        end = offset + count if max_items is None else min(offset + count, offset + max_items)
+        step = len(results)
+        offsets = list(range(offset + step, end, step))
+
+        async def fetch(page_offset: int) -> List[Dict[str, Any]]:
+            page_limit = min(step, end - page_offset)
+            data = await self._request('GET', endpoint, params={**params, 'limit': page_limit, 'offset': page_offset})
+            return data.get('results', [])[:page_limit]
+
+        # Sliding window: keep `concurrency` pages in flight, yield them in order
+        pending = [asyncio.ensure_future(fetch(o)) for o in offsets[:concurrency]]
+        next_index = len(pending)
+        try:
+            while pending:
+                page = await pending.pop(0)
+                if next_index < len(offsets):
+                    pending.append(asyncio.ensure_future(fetch(offsets[next_index])))
+                    next_index += 1
+                if page:
+                    yield page
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def _follow_next(self, url: str, max_items: Optional[int], seen: int) -> AsyncIterator[List[Dict[str, Any]]]:
+        while url:
+            data = await self._request('GET', url)
+            results = data.get('results', [])
+            if max_items is not None:
+                results = results[:max_items - seen]
+            seen += len(results)
+            if results:
+                yield results
+            if not results or (max_items is not None and seen >= max_items):
+                return
+            url = data.get('next')
+
+    async def collect(self, endpoint: str, params: Optional[Dict[str, Any]] = None,
+                      max_items: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """All items of a collection (up to max_items) as one list"""
+        items: List[Dict[str, Any]] = []
+        async for page in self.iter_pages(endpoint, params, max_items=max_items, offset=offset):
+            items.extend(page)
+        return items
+
+    async def _product_id(self, product_name: str) -> Optional[int]:
+        """Product ID by name, served from the lookup cache when possible"""
+        # The lookup cache talks to Redis synchronously: keep it off the event loop
+        hit, product_id = await asyncio.to_thread(self.ids.get, 'product', product_name)
+        if hit:
+            return product_id
+        products = await self._request('GET', 'products/', params={'name': product_name})
+        product_id = products['results'][0]['id'] if products.get('results') else None
+        await asyncio.to_thread(self.ids.set, 'product', product_name, product_id)
+        return product_id
+
+    async def get_findings(
+        self,
+        product_name: Optional[str] = None,
+        severity: Optional[str] = None,
+        active: bool = True,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """Get findings from DefectDojo (see DefectDojoClient.get_findings)"""
+        params = {
+            'limit': limit,
+            'active': str(active).lower()
+        }
+
+        try:
+            if product_name:
+                product_id = await self._product_id(product_name)
+                if product_id is not None:
+                    params['test__engagement__product'] = product_id
+
+            if severity:
+                params['severity'] = severity
+
+            response = await self._request('GET', 'findings/', params=params)
+            return [summarize_finding(f) for f in response.get('results', [])]
+
+        except Exception as e:
+            print(f"[DefectDojo] Get findings error: {e}")
+            return []
+
+    async def get_finding_detail(self, finding_id: int) -> Optional[Dict[str, Any]]:
+        """Get detailed information about a specific finding"""
+        try:
+            return finding_detail(await self._request('GET', f'findings/{finding_id}/'))
+        except Exception as e:
+            print(f"[DefectDojo] Get finding detail error: {e}")
+            return None
+
+    async def get_products(self) -> List[Dict[str, Any]]:
+        """Get all products"""
+        try:
+            response = await self._request('GET', 'products/')
+            return response.get('results', [])
+        except Exception as e:
+            print(f"[DefectDojo] Get products error: {e}")
+            return []
+
+    async def list_findings_raw(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """Return raw findings payload (used by frontend to keep test info)"""
+        try:
+            return await self.collect('findings/', max_items=limit, offset=offset)
+        except Exception as e:
+            print(f"[DefectDojo] List findings raw error: {e}")
+            return []
+
+    async def list_engagements_raw(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """Return raw engagements payload"""
+        try:
+            return await self.collect('engagements/', max_items=limit, offset=offset)
+        except Exception as e:
+            print(f"[DefectDojo] List engagements raw error: {e}")
+            return []
+
+    async def get_tests(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Get all tests with details"""
+        try:
+            return await self.collect('tests/', max_items=limit)
+        except Exception as e:
+            print(f"[DefectDojo] Get tests error: {e}")
+            return []
+
+    async def get_test_detail(self, test_id: int) -> Optional[Dict[str, Any]]:
+        """Get test detail by ID"""
+        try:
+            return await self._request('GET', f'tests/{test_id}/')
+        except Exception as e:
+            print(f"[DefectDojo] Get test detail error: {e}")
+            return None
+
+    async def open_test_file(self, test_id: int, headers: Optional[Dict[str, str]] = None) -> Optional[httpx.Response]:
+        """
+        Start streaming the raw scan file attached to a DefectDojo test
+        DefectDojo may store file attachments in test files endpoint
+        Returns the open response (the caller must aclose it), or None so the
+        endpoint can fall back to MinIO
+        """
+        try:
+            files_response = await self._request('GET', f'tests/{test_id}/files/')
+        except Exception:
+            # DefectDojo may not have files endpoint, continue
+            return None
+
+        results = files_response.get('results') or []
+        if not results or 'file' not in results[0]:
+            return None
+
+        try:
+            request = self.http.build_request('GET', results[0]['file'], headers=headers)
+            response = await self.http.send(request, stream=True)
+        except httpx.HTTPError as e:
+            print(f"[DefectDojo] Get test file error: {e}")
+            return None
+        if response.status_code in (200, 206, 304):
+            return response
+        await response.aclose()
+        return None
+
+
+_async_client: Optional[AsyncDefectDojoClient] = None
+_async_client_lock = threading.Lock()
+
+
+def get_async_dojo_client() -> AsyncDefectDojoClient:
+    """Return the process-wide AsyncDefectDojoClient, creating it on first use"""
+    global _async_client
+    if _async_client is None:
+        with _async_client_lock:
+            if _async_client is None:
+                _async_client = AsyncDefectDojoClient()
+    return _async_client
+
+
+async def close_async_dojo_client():
+    """Release pooled connections on API shutdown"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+_client: Optional[DefectDojoClient] = None
+_client_lock = threading.Lock()
+
+
+def get_dojo_client() -> DefectDojoClient:
+    """Return the process-wide blocking DefectDojoClient, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DefectDojoClient()
+    return _client
@@ -0,0 +1,89 @@
+"""
+DefectDojo ID lookup cache for PTaaS
+
+Product, product-type and engagement IDs almost never change, yet every
+import and filtered query used to look them up again. IDs are cached in Redis
+(shared by the API and all Celery workers) with a short in-process layer in
+front, and "not found" answers are cached briefly as well.
+"""
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import redis
+
+# Stored for lookups that found nothing
+_MISSING = '__missing__'
+
+
+class DojoLookupCache:
+    """Two-level (process + Redis) TTL cache for DefectDojo object IDs"""
+
+    def __init__(self, redis_url: Optional[str] = None, prefix: Optional[str] = None):
+        self.redis_url = redis_url or os.getenv(
+            'DOJO_LOOKUP_REDIS_URL',
+            os.getenv('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
+        )
+        self.prefix = (prefix or os.getenv('REGISTRY_PREFIX', 'ptaas')) + ':dojo-ids'
+        self.ttl = int(os.getenv('DOJO_LOOKUP_TTL', '3600'))
+        self.negative_ttl = int(os.getenv('DOJO_LOOKUP_NEGATIVE_TTL', '60'))
+        self.local_ttl = float(os.getenv('DOJO_LOOKUP_LOCAL_TTL', '30'))
+        self.client = redis.Redis.from_url(self.redis_url, decode_responses=True)
+        self._local: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, kind: str, name: str) -> str:
+        return f"{self.prefix}:{kind}:{name}"
+
+    def get(self, kind: str, name: str) -> Tuple[bool, Optional[Any]]:
+        """Return (hit, value); value is None for a cached "not found" """
+        key = self._key(kind, name)
+        with self._lock:
+            local = self._local.get(key)
+        if local and local[0] > time.monotonic():
+            return True, local[1]
+
+        try:
+            raw = self.client.get(key)
+        except redis.RedisError as e:
+            print(f"[DojoLookupCache] Redis error: {e}")
+            return False, None
+        if raw is None:
+            return False, None
+
+        value = None if raw == _MISSING else json.loads(raw)
+        self._remember(key, value)
+        return True, value
+
+    def set(self, kind: str, name: str, value: Optional[Any]) -> None:
+        """Cache a found value, or a negative result when value is None"""
+        key = self._key(kind, name)
+        try:
+            if value is None:
+                self.client.set(key, _MISSING, ex=self.negative_ttl)
+            else:
+                self.client.set(key, json.dumps(value), ex=self.ttl)
+        except redis.RedisError as e:
+            print(f"[DojoLookupCache] Redis error: {e}")
+        self._remember(key, value)
+
+    def _remember(self, key: str, value: Optional[Any]) -> None:
+        ttl = self.local_ttl if value is not None else min(self.local_ttl, self.negative_ttl)
+        with self._lock:
+            self._local[key] = (time.monotonic() + ttl, value)
+
+
+_lookup_cache: Optional[DojoLookupCache] = None
+_lookup_cache_lock = threading.Lock()
+
+
+def get_lookup_cache() -> DojoLookupCache:
+    """Return the process-wide DojoLookupCache, creating it on first use"""
+    global _lookup_cache
+    if _lookup_cache is None:
+        with _lookup_cache_lock:
+            if _lookup_cache is None:
+                _lookup_cache = DojoLookupCache()
+    return _lookup_cache
@@ -2,11 +2,121 @@
 MinIO/S3 Storage Client for PTaaS
 """
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
 from botocore.exceptions import ClientError
+import hashlib
 import os
+import threading
+import zlib
+from datetime import datetime
 from io import BytesIO
-from typing import Optional
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional, Union
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for STORAGE_CODEC=zstd
+    zstandard = None
+
+# Content-addressed storage: object data lives once under cas/<sha256[:2]>/<sha256>
+# and the key a caller uploads to becomes an empty reference object pointing there
+STORAGE_CONTENT_ADDRESSED = os.getenv('STORAGE_CONTENT_ADDRESSED', 'true').lower() == 'true'
+CAS_PREFIX = 'cas/'
+# Metadata key (x-amz-meta-cas-key) of a reference object
+REFERENCE_META = 'cas-key'
+# Resolved reference -> content key entries kept per process (references never change)
+_REFERENCE_CACHE_SIZE = 10000
+
+# Codec objects are stored with: gzip, zstd or identity (uncompressed). The codec
+# is recorded per object (x-amz-meta-codec and Content-Encoding), so objects
+# written with another setting stay readable.
+STORAGE_CODEC = os.getenv('STORAGE_CODEC', 'gzip').lower()
+# Compression level (gzip 1-9, zstd 1-22)
+STORAGE_CODEC_LEVEL = int(os.getenv('STORAGE_CODEC_LEVEL', '6'))
+IDENTITY = 'identity'
+CODEC_META = 'codec'
+# Bytes read from the source per compression step
+_CODEC_CHUNK_SIZE = 1024 * 1024
+
+
+def content_key(sha256: str) -> str:
+    return f"{CAS_PREFIX}{sha256[:2]}/{sha256}"
+
+
+def object_codec(obj: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Codec of a head_object/get_object response, None for uncompressed objects"""
+    codec = ((obj or {}).get('Metadata') or {}).get(CODEC_META)
+    return codec if codec and codec != IDENTITY else None
+
+
+def _compressor(codec: str):
+    if codec == 'gzip':
+        return zlib.compressobj(STORAGE_CODEC_LEVEL, zlib.DEFLATED, 31)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("STORAGE_CODEC=zstd requires the zstandard package")
+        return zstandard.ZstdCompressor(level=STORAGE_CODEC_LEVEL).compressobj()
+    raise ValueError(f"Unknown storage codec: {codec}")
+
+
+def _decompressor(codec: str):
+    if codec == 'gzip':
+        return zlib.decompressobj(31)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Reading zstd objects requires the zstandard package")
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f"Unknown storage codec: {codec}")
+
+
+def decode_chunks(chunks: Iterable[bytes], codec: Optional[str]) -> Iterator[bytes]:
+    """Decompress a stream of object chunks written with `codec`"""
+    if not codec:
+        yield from chunks
+        return
+    decompressor = _decompressor(codec)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+class _CompressingReader:
+    """Read-only file compressing another one on the fly, for upload_fileobj"""
+    
+    def __init__(self, source: BinaryIO, codec: str):
+        self._source = source
+        self._compressor = _compressor(codec)
+        self._buffer = bytearray()
+        self._done = False
+    
+    def read(self, size: int = -1) -> bytes:
+        while not self._done and (size < 0 or len(self._buffer) < size):
+            chunk = self._source.read(_CODEC_CHUNK_SIZE)
+            if chunk:
+                self._buffer += self._compressor.compress(chunk)
+            else:
+                self._buffer += self._compressor.flush()
+                self._done = True
+        if size < 0 or size >= len(self._buffer):
+            data, self._buffer = bytes(self._buffer), bytearray()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+
+def build_object_key(scan_type: str, task_id: str, filename: str, when: Optional[datetime] = None) -> str:
+    """
+    Partitioned object key: <scan_type>/<YYYY>/<MM>/<DD>/<task_id>/<filename>
+    Keeps per-type / per-day listings small and makes keys unique per task
+    """
+    when = when or datetime.utcnow()
+    return f"{scan_type}/{when:%Y/%m/%d}/{task_id}/{filename}"
+
 
 class StorageClient:
     """
@@ -14,24 +124,45 @@ class StorageClient:
     Configuration is environment-based for seamless local-to-cloud transition
     """
     
-    def __init__(self):
+    def __init__(self, ensure_bucket: bool = True):
         self.endpoint_url = os.getenv('S3_ENDPOINT')
         self.bucket_name = os.getenv('S3_BUCKET', 'ptaas')
         self.access_key = os.getenv('S3_ACCESS_KEY')
         self.secret_key = os.getenv('S3_SECRET_KEY')
         
-        # Initialize S3 client
+        # Initialize S3 client (thread-safe; share one instance per process)
         self.client = boto3.client(
             's3',
             endpoint_url=self.endpoint_url,
             aws_access_key_id=self.access_key,
             aws_secret_access_key=self.secret_key,
-            config=Config(signature_version='s3v4'),
+            config=Config(
+                signature_version='s3v4',
+                max_pool_connections=int(os.getenv('S3_MAX_POOL_CONNECTIONS', '20')),
+                connect_timeout=float(os.getenv('S3_CONNECT_TIMEOUT', '5')),
+                read_timeout=float(os.getenv('S3_READ_TIMEOUT', '60')),
+                retries={'max_attempts': int(os.getenv('S3_MAX_ATTEMPTS', '3')), 'mode': 'standard'}
+            ),
             region_name='us-east-1'  # Required for MinIO compatibility
         )
         
+        # Multipart uploads: bounded part size and parallelism per upload
+        self.transfer_config = TransferConfig(
+            multipart_threshold=int(os.getenv('S3_MULTIPART_CHUNK_SIZE', str(8 * 1024 * 1024))),
+            multipart_chunksize=int(os.getenv('S3_MULTIPART_CHUNK_SIZE', str(8 * 1024 * 1024))),
+            max_concurrency=int(os.getenv('S3_UPLOAD_CONCURRENCY', '4'))
+        )
+        
+        self.content_addressed = STORAGE_CONTENT_ADDRESSED
+        self.codec = STORAGE_CODEC if STORAGE_CODEC in ('gzip', 'zstd') else IDENTITY
+        if self.codec == 'zstd' and zstandard is None:
+            print("[Storage] zstandard is not installed, falling back to gzip")
+            self.codec = 'gzip'
+        self._references: Dict[str, str] = {}
+        
         # Ensure bucket exists
-        self._ensure_bucket_exists()
+        if ensure_bucket:
+            self._ensure_bucket_exists()
     
     def _ensure_bucket_exists(self):
         """Create bucket if it doesn't exist"""
@@ -45,14 +176,47 @@ class StorageClient:
             except Exception as e:
                 print(f"Warning: Could not create bucket: {e}")
     
-    def upload(self, file_content: bytes, filename: str, content_type: str = 'application/octet-stream') -> str:
+    @staticmethod
+    def digest(file_content: Union[bytes, BinaryIO]) -> str:
+        """SHA-256 of bytes or a seekable binary file, read in chunks (the file is rewound)"""
+        if isinstance(file_content, bytes):
+            return hashlib.sha256(file_content).hexdigest()
+        sha256 = hashlib.sha256()
+        start = file_content.tell()
+        for chunk in iter(lambda: file_content.read(1024 * 1024), b''):
+            sha256.update(chunk)
+        file_content.seek(start)
+        return sha256.hexdigest()
+    
+    def upload(
+        self,
+        file_content: bytes,
+        filename: str,
+        content_type: str = 'application/octet-stream',
+        metadata: Optional[Dict[str, str]] = None,
+        sha256: Optional[str] = None,
+        content_addressed: Optional[bool] = None,
+        codec: Optional[str] = None
+    ) -> str:
         """
         Upload file to storage
         
+        Content-addressed uploads (the default, see STORAGE_CONTENT_ADDRESSED)
+        store the data under its SHA-256 and skip the transfer when identical
+        content is already stored; `filename` becomes a reference to it.
+        The data is compressed while it streams to S3 (see STORAGE_CODEC);
+        the digest is always that of the uncompressed content.
+        
         Args:
-            file_content: File content as bytes
-            filename: Name of the file
+            file_content: File content as bytes or a readable binary file
+                (streamed as a multipart upload)
+            filename: Name (object key) of the file
             content_type: MIME type of the file
+            metadata: Optional user metadata stored with the object (x-amz-meta-*)
+            sha256: Content digest if the caller already computed it (see digest())
+            content_addressed: Override STORAGE_CONTENT_ADDRESSED for this upload
+                (e.g. for short-lived objects that are deleted again)
+            codec: Override STORAGE_CODEC for this upload ('identity' stores it as is)
             
         Returns:
             URL or path to the uploaded file
@@ -64,21 +228,49 @@ class StorageClient:
             else:
                 file_obj = file_content
             
-            # Upload to S3/MinIO
-            self.client.upload_fileobj(
-                file_obj,
-                self.bucket_name,
-                filename,
-                ExtraArgs={'ContentType': content_type}
-            )
+            extra_args = {'ContentType': content_type}
+            if metadata:
+                extra_args['Metadata'] = {k: str(v) for k, v in metadata.items() if v is not None}
+            
+            key = filename
+            if self.content_addressed if content_addressed is None else content_addressed:
+                sha256 = sha256 or self.digest(file_obj)
+                key = content_key(sha256)
+                reference_meta = {**extra_args.get('Metadata', {}), REFERENCE_META: key, 'content-sha256': sha256}
+                extra_args['Metadata'] = {'content-sha256': sha256}
+            
+            codec = codec or self.codec
+            if codec != IDENTITY:
+                file_obj = _CompressingReader(file_obj, codec)
+                extra_args['ContentEncoding'] = codec
+                extra_args.setdefault('Metadata', {})[CODEC_META] = codec
+            
+            if key != filename and self._head(key) is not None:
+                print(f"[Storage] Deduplicated: {filename} -> {key}")
+            else:
+                # Upload to S3/MinIO
+                self.client.upload_fileobj(
+                    file_obj,
+                    self.bucket_name,
+                    key,
+                    ExtraArgs=extra_args,
+                    Config=self.transfer_config
+                )
+            
+            if key != filename:
+                self.client.put_object(
+                    Bucket=self.bucket_name, Key=filename, Body=b'',
+                    ContentType=content_type, Metadata=reference_meta
+                )
+                self._remember(filename, key)
             
-            # Generate URL
+            # Generate URL (of the object holding the data)
             if 'minio' in self.endpoint_url.lower():
                 # MinIO local URL
-                url = f"{self.endpoint_url}/{self.bucket_name}/{filename}"
+                url = f"{self.endpoint_url}/{self.bucket_name}/{key}"
             else:
                 # AWS S3 URL
-                url = f"https://{self.bucket_name}.s3.amazonaws.com/{filename}"
+                url = f"https://{self.bucket_name}.s3.amazonaws.com/{key}"
             
             print(f"[Storage] Uploaded: {filename}")
             return url
@@ -87,33 +279,134 @@ class StorageClient:
             print(f"[Storage] Upload failed: {e}")
             raise
     
+    def _remember(self, filename: str, key: str) -> None:
+        if len(self._references) >= _REFERENCE_CACHE_SIZE:
+            self._references.clear()
+        self._references[filename] = key
+    
+    def _head(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self.client.head_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            if e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 404:
+                return None
+            raise
+    
+    def resolve(self, filename: str) -> str:
+        """Key of the object holding the data for `filename` (itself unless it is a reference)"""
+        if filename.startswith(CAS_PREFIX):
+            return filename
+        key = self._references.get(filename)
+        if key is None:
+            meta = self._head(filename)
+            if meta is None:
+                return filename
+            key = meta.get('Metadata', {}).get(REFERENCE_META) or filename
+            self._remember(filename, key)
+        return key
+    
     def download(self, filename: str) -> bytes:
-        """Download file from storage"""
+        """Download file from storage (decompressed)"""
+        try:
+            response = self.client.get_object(Bucket=self.bucket_name, Key=self.resolve(filename))
+            codec = object_codec(response)
+            body = response['Body'].read()
+            return b''.join(decode_chunks([body], codec)) if codec else body
+        except Exception as e:
+            print(f"[Storage] Download failed: {e}")
+            raise
+    
+    def download_to(self, filename: str, file_obj: BinaryIO) -> None:
+        """
+        Download an object into a writable binary file: parallel ranged GETs
+        for uncompressed objects, a single decompressing stream otherwise
+        """
         try:
-            response = self.client.get_object(Bucket=self.bucket_name, Key=filename)
-            return response['Body'].read()
+            key = self.resolve(filename)
+            if object_codec(self._head(key)):
+                for chunk in self.iter_chunks(key):
+                    file_obj.write(chunk)
+                return
+            self.client.download_fileobj(self.bucket_name, key, file_obj, Config=self.transfer_config)
         except Exception as e:
             print(f"[Storage] Download failed: {e}")
             raise
     
+    def head(self, filename: str) -> Optional[Dict[str, Any]]:
+        """Return object metadata (size, ETag, ...) or None if it does not exist"""
+        return self._head(self.resolve(filename))
+    
+    def open(self, filename: str, byte_range: Optional[str] = None, if_none_match: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Start a streaming GET; the returned dict's 'Body' has not been read yet
+        and holds the stored (possibly compressed, see object_codec()) bytes
+        
+        Args:
+            filename: Object key
+            byte_range: HTTP Range header value (e.g. 'bytes=0-1023')
+            if_none_match: ETag(s) the caller already has
+            
+        Raises ClientError for missing objects (404), unsatisfiable ranges (416)
+        and ETag matches (304)
+        """
+        kwargs = {'Bucket': self.bucket_name, 'Key': self.resolve(filename)}
+        if byte_range:
+            kwargs['Range'] = byte_range
+        if if_none_match:
+            kwargs['IfNoneMatch'] = if_none_match
+        return self.client.get_object(**kwargs)
+    
+    def iter_chunks(self, filename: str, chunk_size: int = 1024 * 1024, byte_range: Optional[str] = None) -> Iterator[bytes]:
+        """
+        Yield an object's content in chunks without holding it in memory,
+        decompressed unless a byte range of the stored bytes is requested
+        """
+        obj = self.open(filename, byte_range=byte_range)
+        body = obj['Body']
+        try:
+            codec = None if byte_range else object_codec(obj)
+            for chunk in decode_chunks(body.iter_chunks(chunk_size), codec):
+                yield chunk
+        finally:
+            body.close()
+    
     def list_files(self, prefix: str = '') -> list:
-        """List files in bucket with optional prefix filter"""
+        """List files in bucket with optional prefix filter (all pages)"""
         try:
-            response = self.client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=prefix
-            )
-            return [obj['Key'] for obj in response.get('Contents', [])]
+            paginator = self.client.get_paginator('list_objects_v2')
+            return [
+                obj['Key']
+                for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix)
+                for obj in page.get('Contents', [])
+            ]
         except Exception as e:
             print(f"[Storage] List failed: {e}")
             return []
     
     def delete(self, filename: str) -> bool:
-        """Delete file from storage"""
+        """Delete file from storage (for a reference, only the reference: the content may be shared)"""
         try:
             self.client.delete_object(Bucket=self.bucket_name, Key=filename)
+            self._references.pop(filename, None)
             print(f"[Storage] Deleted: {filename}")
             return True
         except Exception as e:
             print(f"[Storage] Delete failed: {e}")
             return False
+
+
+_storage_client: Optional[StorageClient] = None
+_storage_client_lock = threading.Lock()
+
+
+def get_storage_client() -> StorageClient:
+    """
+    Return the process-wide StorageClient, creating it on first use
+    The bucket is verified once here instead of on every request
+    """
+    global _storage_client
+    if _storage_client is None:
+        with _storage_client_lock:
+            if _storage_client is None:
+                _storage_client = StorageClient()
+    return _storage_client
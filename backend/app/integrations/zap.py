@@ -0,0 +1,331 @@
+"""
+OWASP ZAP integration for PTaaS
+
+ZapPool spreads scans over several ZAP daemons: every scan leases the
+least-loaded instance (load = live leases, tracked in Redis so all Celery
+workers see the same numbers) and runs inside its own ZAP context. Its
+report only holds alerts raised on the messages the scan itself produced,
+so concurrent scans and earlier runs kept in the daemon's session never
+leak into it.
+"""
+import os
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import redis
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from ..leases import LeasePool
+
+RISK_CODES = {'Informational': '0', 'Low': '1', 'Medium': '2', 'High': '3'}
+CONFIDENCE_CODES = {'False Positive': '0', 'Low': '1', 'Medium': '2', 'High': '3', 'Confirmed': '4'}
+
+class ZapClient:
+    """
+    ZAP API client bound to one daemon
+    Keeps a keep-alive session with timeouts; connection failures are always
+    retried, read errors and 5xx only for views (actions such as starting a
+    scan are not idempotent)
+    """
+
+    def __init__(self, base_url: str, api_key: str):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.timeout = (
+            float(os.getenv('ZAP_CONNECT_TIMEOUT', '5')),
+            float(os.getenv('ZAP_READ_TIMEOUT', '60'))
+        )
+        self.retries = int(os.getenv('ZAP_RETRIES', '3'))
+        self.retry_backoff = float(os.getenv('ZAP_RETRY_BACKOFF', '0.5'))
+        self.alert_page_size = int(os.getenv('ZAP_ALERT_PAGE_SIZE', '500'))
+        self.poll_min = float(os.getenv('ZAP_POLL_MIN', '1'))
+        self.poll_max = float(os.getenv('ZAP_POLL_MAX', '30'))
+        # Aim for one poll per this many percent of progress
+        self.poll_step = float(os.getenv('ZAP_POLL_STEP', '5'))
+
+        self.session = requests.Session()
+        # No adapter-level retries: _get is the only retry layer
+        adapter = HTTPAdapter(pool_maxsize=int(os.getenv('ZAP_POOL_MAXSIZE', '4')))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _get(self, path: str, idempotent: bool = True, **params: Any) -> requests.Response:
+        params['apikey'] = self.api_key
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(f"{self.base_url}/{path}", params=params, timeout=self.timeout)
+                if response.status_code < 500 or not idempotent or attempt >= self.retries:
+                    response.raise_for_status()
+                    return response
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.retries or not (idempotent or self._not_sent(e)):
+                    raise
+            time.sleep(self.retry_backoff * (2 ** attempt))
+            attempt += 1
+
+    @staticmethod
+    def _not_sent(e: requests.RequestException) -> bool:
+        """True if the connection failed, so ZAP never saw the request"""
+        reason = getattr(e.args[0], 'reason', None) if e.args else None
+        return isinstance(e, requests.ConnectTimeout) or isinstance(reason, NewConnectionError)
+
+    def api(self, component: str, kind: str, name: str, **params: Any) -> Dict[str, Any]:
+        """Call JSON/<component>/<kind>/<name>/ (kind is 'view' or 'action')"""
+        return self._get(f"JSON/{component}/{kind}/{name}/", idempotent=(kind == 'view'), **params).json()
+
+    def close(self) -> None:
+        self.session.close()
+
+    # ----- per-scan context -----
+
+    def new_context(self, name: str, target_url: str) -> str:
+        """Create a context covering target_url and everything below it"""
+        context_id = self.api('context', 'action', 'newContext', contextName=name)['contextId']
+        self.api('context', 'action', 'includeInContext',
+                 contextName=name, regex=f"{re.escape(target_url.rstrip('/'))}.*")
+        return context_id
+
+    def remove_context(self, name: str) -> None:
+        try:
+            self.api('context', 'action', 'removeContext', contextName=name)
+        except requests.RequestException as e:
+            print(f"[ZAP] Could not remove context {name}: {e}")
+
+    # ----- scans -----
+
+    def access_url(self, url: str) -> None:
+        self.api('core', 'action', 'accessUrl', url=url)
+
+    def spider(self, url: str, context_name: str) -> str:
+        return self.api('spider', 'action', 'scan', url=url, contextName=context_name)['scan']
+
+    def spider_status(self, scan_id: str) -> int:
+        return int(self.api('spider', 'view', 'status', scanId=scan_id).get('status', 0))
+
+    def active_scan(self, url: str, context_id: str) -> str:
+        return self.api('ascan', 'action', 'scan', url=url, contextId=context_id, recurse='true')['scan']
+
+    def active_scan_status(self, scan_id: str) -> int:
+        return int(self.api('ascan', 'view', 'status', scanId=scan_id).get('status', 0))
+
+    def spider_message_ids(self, scan_id: str) -> Set[int]:
+        """History ids of the in-scope messages a spider scan fetched"""
+        ids = set()
+        for group in self.api('spider', 'view', 'fullResults', scanId=scan_id).get('fullResults', []):
+            for message in group.get('urlsInScope', []):
+                if message.get('messageId'):
+                    ids.add(int(message['messageId']))
+        return ids
+
+    def active_scan_message_ids(self, scan_id: str) -> Set[int]:
+        """History ids of the messages an active scan sent"""
+        return {int(i) for i in self.api('ascan', 'view', 'messagesIds', scanId=scan_id).get('messagesIds', [])}
+
+    def wait(
+        self,
+        status: Callable[[], int],
+        on_progress: Callable[[int], None],
+        heartbeat: Optional[Callable[[], None]] = None
+    ) -> None:
+        """
+        Poll a 0-100 scan status until it reaches 100
+
+        The interval follows the observed progress rate (about one poll per
+        `poll_step` percent), backs off while progress stalls and stays within
+        [poll_min, poll_max]. on_progress only sees changed values.
+        """
+        interval = self.poll_min
+        last_progress: Optional[int] = None
+        last_change = time.monotonic()
+        while True:
+            progress = status()
+            now = time.monotonic()
+            if progress != last_progress:
+                on_progress(progress)
+            if progress >= 100:
+                return
+
+            if last_progress is not None and progress > last_progress:
+                rate = (progress - last_progress) / max(now - last_change, 1e-3)
+                interval = self.poll_step / rate
+            elif last_progress is not None:
+                interval *= 1.5
+            interval = min(max(interval, self.poll_min), self.poll_max)
+
+            if progress != last_progress:
+                last_progress, last_change = progress, now
+            if heartbeat:
+                heartbeat()
+            time.sleep(interval)
+
+    # ----- results -----
+
+    def iter_alerts(self, base_url: str, message_ids: Optional[Set[int]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Alerts raised under base_url, fetched page by page
+
+        The daemon's session also holds earlier runs and concurrent scans of
+        the same URL, so with `message_ids` only alerts raised on those
+        messages (the ones this scan produced) are returned.
+        """
+        start = 0
+        while True:
+            page = self.api('core', 'view', 'alerts', baseurl=base_url,
+                            start=start, count=self.alert_page_size).get('alerts', [])
+            if message_ids is None:
+                yield from page
+            else:
+                yield from (a for a in page if a.get('messageId') and int(a['messageId']) in message_ids)
+            if len(page) < self.alert_page_size:
+                return
+            start += len(page)
+
+    def version(self) -> str:
+        return self.api('core', 'view', 'version').get('version', '')
+
+
+class ZapPool:
+    """Load-balanced leasing of ZAP daemons shared by all workers"""
+
+    def __init__(
+        self,
+        urls: Optional[List[str]] = None,
+        api_key: Optional[str] = None,
+        redis_url: Optional[str] = None,
+        prefix: Optional[str] = None
+    ):
+        self.urls = urls or [
+            u.strip() for u in os.getenv('ZAP_URLS', os.getenv('ZAP_URL', 'http://zap:8080')).split(',') if u.strip()
+        ]
+        self.api_key = api_key or os.getenv('ZAP_API_KEY', 'changeme')
+        self.redis_url = redis_url or os.getenv(
+            'ZAP_POOL_REDIS_URL',
+            os.getenv('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
+        )
+        self.leases = LeasePool(
+            redis.Redis.from_url(self.redis_url, decode_responses=True),
+            prefix=(prefix or os.getenv('REGISTRY_PREFIX', 'ptaas')) + ':zap',
+            members=self.urls,
+            limit=int(os.getenv('ZAP_MAX_SCANS_PER_INSTANCE', '2')),
+            ttl=float(os.getenv('ZAP_LEASE_TTL', '900')),
+            timeout=float(os.getenv('ZAP_LEASE_TIMEOUT', '1800'))
+        )
+        # One client (and keep-alive session) per daemon, reused across scans
+        self._clients: Dict[str, ZapClient] = {}
+
+    def load(self) -> Dict[str, int]:
+        """Live leases per instance"""
+        return self.leases.load()
+
+    def refresh(self, url: str, lease_id: str) -> None:
+        """Extend a lease; call periodically while a scan is running"""
+        self.leases.refresh(url, lease_id)
+
+    @contextmanager
+    def lease(self, lease_id: Optional[str] = None) -> Iterator[Tuple[ZapClient, str]]:
+        """Lease the least-loaded instance: yields (client, lease_id)"""
+        with self.leases.lease(lease_id) as (url, lease_id):
+            print(f"[ZAP] Leased {url} for {lease_id}")
+            if url not in self._clients:
+                self._clients[url] = ZapClient(url, self.api_key)
+            yield self._clients[url], lease_id
+
+
+_pool: Optional[ZapPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_zap_pool() -> ZapPool:
+    """Return the process-wide ZapPool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ZapPool()
+    return _pool
+
+
+def _site(url: str) -> Tuple[str, str, str, bool]:
+    """(site name, host, port, ssl) as used by ZAP's XML report"""
+    parts = urlsplit(url)
+    ssl = parts.scheme == 'https'
+    port = str(parts.port or (443 if ssl else 80))
+    return f"{parts.scheme}://{parts.hostname}:{port}", parts.hostname or '', port, ssl
+
+
+def _text(parent: ET.Element, tag: str, value: Any) -> None:
+    ET.SubElement(parent, tag).text = '' if value is None else str(value)
+
+
+def write_zap_report(alerts: Iterable[Dict[str, Any]], output: BinaryIO, version: str = '') -> int:
+    """
+    Write alerts (ZAP JSON API format) as a ZAP XML report, the format
+    DefectDojo's "ZAP Scan" parser reads. Alerts of the same plugin on the
+    same site become one <alertitem> with several <instance>s.
+
+    Returns:
+        Number of <alertitem> elements written
+    """
+    sites: Dict[Tuple, Dict[Tuple, ET.Element]] = {}
+    for alert in alerts:
+        site = _site(alert.get('url', ''))
+        items = sites.setdefault(site, {})
+        key = (alert.get('pluginId'), alert.get('alertRef'), alert.get('alert'))
+        item = items.get(key)
+        if item is None:
+            item = items[key] = ET.Element('alertitem')
+            risk = alert.get('risk', 'Informational')
+            confidence = alert.get('confidence', 'Medium')
+            for tag, value in (
+                ('pluginid', alert.get('pluginId')),
+                ('alertRef', alert.get('alertRef')),
+                ('alert', alert.get('alert')),
+                ('name', alert.get('name') or alert.get('alert')),
+                ('riskcode', RISK_CODES.get(risk, '0')),
+                ('confidence', CONFIDENCE_CODES.get(confidence, '2')),
+                ('riskdesc', f"{risk} ({confidence})"),
+                ('confidencedesc', confidence),
+                ('desc', alert.get('description')),
+            ):
+                _text(item, tag, value)
+            ET.SubElement(item, 'instances')
+            for tag, value in (
+                ('count', 0),
+                ('solution', alert.get('solution')),
+                ('otherinfo', alert.get('other')),
+                ('reference', alert.get('reference')),
+                ('cweid', alert.get('cweid')),
+                ('wascid', alert.get('wascid')),
+                ('sourceid', alert.get('sourceid')),
+            ):
+                _text(item, tag, value)
+
+        instance = ET.SubElement(item.find('instances'), 'instance')
+        for tag, field in (('uri', 'url'), ('method', 'method'), ('param', 'param'),
+                           ('attack', 'attack'), ('evidence', 'evidence'), ('otherinfo', 'other')):
+            _text(instance, tag, alert.get(field))
+        count = item.find('count')
+        count.text = str(int(count.text) + 1)
+
+    generated = datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S')
+    output.write(b'<?xml version="1.0"?>\n')
+    output.write(f'<OWASPZAPReport programName="ZAP" version="{version}" generated="{generated}">\n'.encode('utf-8'))
+    written = 0
+    for (name, host, port, ssl), items in sites.items():
+        site = ET.Element('site', name=name, host=host, port=port, ssl=str(ssl).lower())
+        alerts_el = ET.SubElement(site, 'alerts')
+        alerts_el.extend(items.values())
+        output.write(ET.tostring(site))
+        output.write(b'\n')
+        written += len(items)
+    output.write(b'</OWASPZAPReport>\n')
+    return written
@@ -0,0 +1,104 @@
+"""
+Redis-backed lease pools for PTaaS
+
+A LeasePool is a counting semaphore over a set of members (scanner
+containers, ZAP daemons): each running scan holds a lease on the
+least-loaded member, and a member never has more than `limit` live leases.
+Leases carry an expiry so a worker that dies mid-scan cannot hold a slot
+forever. All workers share the pool state through Redis.
+"""
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Picks the member with the fewest live leases and records a new lease on it.
+# KEYS: one lease zset per member (member = lease id, score = expiry)
+# ARGV: now, lease expiry, lease id, max leases per member (0 = unlimited)
+_ACQUIRE_SCRIPT = """
+local best, best_load = 0, -1
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', ARGV[1])
+    local load = redis.call('ZCARD', key)
+    if best_load < 0 or load < best_load then
+        best, best_load = i, load
+    end
+end
+local limit = tonumber(ARGV[4])
+if best == 0 or (limit > 0 and best_load >= limit) then
+    return 0
+end
+redis.call('ZADD', KEYS[best], ARGV[2], ARGV[3])
+return best
+"""
+
+
+class LeasePool:
+    """Least-loaded leasing of a set of members with a per-member limit"""
+
+    def __init__(
+        self,
+        client,
+        prefix: str,
+        members: List[str],
+        limit: int = 0,
+        ttl: float = 900,
+        timeout: float = 1800
+    ):
+        self.client = client
+        self.prefix = prefix
+        self.members = members
+        self.limit = limit
+        self.ttl = ttl
+        self.timeout = timeout
+        self._acquire = client.register_script(_ACQUIRE_SCRIPT)
+
+    def _key(self, member: str) -> str:
+        return f"{self.prefix}:leases:{member}"
+
+    def load(self) -> Dict[str, int]:
+        """Live leases per member"""
+        now = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        for member in self.members:
+            pipe.zcount(self._key(member), now, '+inf')
+        return dict(zip(self.members, pipe.execute()))
+
+    def try_acquire(self, lease_id: str) -> Optional[str]:
+        """Lease the least-loaded member, or None if every member is at its limit"""
+        now = time.time()
+        index = self._acquire(
+            keys=[self._key(m) for m in self.members],
+            args=[now, now + self.ttl, lease_id, self.limit]
+        )
+        return self.members[int(index) - 1] if index else None
+
+    def acquire(self, lease_id: str) -> str:
+        """Block (with backoff) until a member has capacity, then lease it"""
+        deadline = time.monotonic() + self.timeout
+        wait = 1.0
+        while True:
+            member = self.try_acquire(lease_id)
+            if member is not None:
+                return member
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"No free slot in {self.prefix} after {self.timeout:.0f}s")
+            time.sleep(wait)
+            wait = min(wait * 2, 15.0)
+
+    def refresh(self, member: str, lease_id: str) -> None:
+        """Extend a lease; call periodically while holding it for long"""
+        self.client.zadd(self._key(member), {lease_id: time.time() + self.ttl}, xx=True)
+
+    def release(self, member: str, lease_id: str) -> None:
+        self.client.zrem(self._key(member), lease_id)
+
+    @contextmanager
+    def lease(self, lease_id: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+        """Hold a lease for the duration of the block: yields (member, lease_id)"""
+        lease_id = lease_id or uuid.uuid4().hex
+        member = self.acquire(lease_id)
+        try:
+            yield member, lease_id
+        finally:
+            self.release(member, lease_id)
@@ -1,10 +1,13 @@
 # FastAPI Backend for PTaaS
-from fastapi import FastAPI, HTTPException, BackgroundTasks, status
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Response, status
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, HttpUrl, validator
 from typing import Optional, List, Dict
 from datetime import datetime
+import asyncio
+import ipaddress
+import json
 import os
 from dotenv import load_dotenv
 
@@ -12,9 +15,25 @@ from dotenv import load_dotenv
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '..', '.env'))
 
 # Import tasks
-from .tasks import scan_with_nmap, scan_with_zap, scan_with_sqlmap
-from .models import ScanRequest, ScanResponse, ResultResponse
-from .integrations.defectdojo import DefectDojoClient
+from celery import group, uuid
+from .tasks import scan_with_nmap, scan_with_zap, scan_with_sqlmap, start_sharded_nmap, scan_signature, priority_options
+from .models import (
+    ScanRequest, NmapScanRequest, ScanResponse, ResultResponse, BatchStatusRequest,
+    BulkScanRequest, BulkScanResponse
+)
+from .integrations.defectdojo import (
+    get_async_dojo_client, close_async_dojo_client, get_dojo_client, summarize_finding, finding_detail
+)
+from .integrations.storage import get_storage_client
+from .registry import get_registry, TERMINAL_STATES
+from .events import broadcaster
+from .cache import dojo_cache, invalidate_on_import
+from .streaming import stream_collection, storage_object_response, upstream_file_response, conditional_headers
+from .findings_index import get_findings_index, FindingsSyncer
+from .task_states import fetch_task_meta, describe_task, get_task_states
+from .parsers.nmap import filter_host
+from .parsers.jsonl import read_jsonl
+from .diffing import ARTIFACT_FIELDS, diff_artifacts
 
 app = FastAPI(
     title="PTaaS API Gateway",
@@ -22,38 +41,44 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# In-memory registry of active scans (task_id -> metadata)
-ACTIVE_SCANS: Dict[str, Dict] = {}
-TASK_LOG: List[Dict] = []
-
-def _find_task_log(task_id: str) -> Optional[Dict]:
-    for entry in TASK_LOG:
-        if entry.get("task_id") == task_id:
-            return entry
-    return None
-
-def _upsert_task_log(task_id: str, state: str, result: Optional[Dict] = None):
-    meta = ACTIVE_SCANS.get(task_id, {})
-    entry = _find_task_log(task_id) or {
-        "task_id": task_id,
-        "scan_type": meta.get("scan_type"),
-        "target": meta.get("target"),
-        "created": meta.get("created", datetime.utcnow().isoformat()),
-    }
-    entry["state"] = state
-    entry["status"] = "success" if state == "SUCCESS" else ("failure" if state == "FAILURE" else state.lower())
-    entry["timestamp"] = datetime.utcnow().isoformat()
-    if result and isinstance(result, dict):
-        entry["storage_url"] = result.get("storage_url")
-        entry["filename"] = result.get("filename")
-        dojo = result.get("dojo_import") or {}
-        if isinstance(dojo, dict):
-            entry["dojo_test_id"] = dojo.get("test_id")
-            entry["engagement_id"] = dojo.get("engagement_id")
-            entry["product_id"] = dojo.get("product_id")
-    # Insert or update
-    if not _find_task_log(task_id):
-        TASK_LOG.append(entry)
+# Shared scan registry (task_id -> metadata), persisted in Redis
+registry = get_registry()
+
+def _record_task_result(task_id: str, state: str, result: Optional[Dict] = None):
+    """Record a terminal task state in the scan registry (once)"""
+    entry = registry.get(task_id)
+    if entry and entry.get("state") in TERMINAL_STATES:
+        return
+    registry.mark_finished(task_id, state, result)
+
+# Local findings index, refreshed in the background and after every Dojo import
+findings_index = get_findings_index()
+findings_syncer = FindingsSyncer(
+    findings_index,
+    redis_client=registry.client,
+    lock_key=f"{registry.prefix}:lock:findings-sync"
+)
+FINDINGS_SYNC_INTERVAL = float(os.getenv("FINDINGS_SYNC_INTERVAL", "60"))
+_background_tasks: List[asyncio.Task] = []
+
+async def _sync_findings_on_import(event: Dict):
+    """Scan-event listener: pull fresh findings once a task has imported into Dojo"""
+    if event.get("dojo_import"):
+        findings_syncer.request_sync()
+
+# Largest number of scans a single /scan/bulk request may queue
+BULK_MAX_JOBS = int(os.getenv("BULK_MAX_JOBS", "2000"))
+
+# Defaults for sharded Nmap scans when the request sets only one of the two
+NMAP_SHARD_SIZE = int(os.getenv("NMAP_SHARD_SIZE", "256"))
+NMAP_SHARD_PARALLELISM = int(os.getenv("NMAP_SHARD_PARALLELISM", "4"))
+
+# Seconds between SSE keep-alive comments on idle progress streams
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+def _sse(event: str, data) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 # CORS Configuration
 app.add_middleware(
@@ -64,6 +89,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup():
+    """Open the shared scan-progress subscription and verify the storage bucket"""
+    try:
+        await asyncio.to_thread(get_storage_client)
+    except Exception as e:
+        print(f"[Storage] Startup bucket check failed: {e}")
+    broadcaster.add_listener(invalidate_on_import)
+    broadcaster.add_listener(_sync_findings_on_import)
+    await broadcaster.start()
+    _background_tasks.append(asyncio.create_task(
+        findings_syncer.run(get_async_dojo_client(), FINDINGS_SYNC_INTERVAL)
+    ))
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in _background_tasks:
+        task.cancel()
+    await broadcaster.stop()
+    await close_async_dojo_client()
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -84,23 +130,42 @@ async def health_check():
     }
 
 @app.post("/scan/nmap", response_model=ScanResponse)
-async def scan_nmap(request: ScanRequest):
+def scan_nmap(request: NmapScanRequest):
     """
     Start Nmap scan for target IP/CIDR
+    With shard_size/parallelism the target is split into shards scanned in parallel
     """
-    task = scan_with_nmap.delay(
-        target=request.target,
-        options=request.options or "-sV -sC"
+    if request.shard_size or request.parallelism:
+        try:
+            task_id, shards = start_sharded_nmap(
+                target=request.target,
+                options=request.options or "-sV -sC",
+                shard_size=request.shard_size or NMAP_SHARD_SIZE,
+                parallelism=request.parallelism or NMAP_SHARD_PARALLELISM,
+                priority=request.priority,
+                register=lambda task_id, shards: registry.register(
+                    task_id, scan_type="nmap", target=request.target, shards=shards
+                )
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        return ScanResponse(
+            task_id=task_id,
+            scan_type="nmap",
+            target=request.target,
+            status="queued",
+            message=f"Nmap scan queued for {request.target} ({shards} shards)"
+        )
+    
+    # Track active scan before a worker can report on it
+    task_id = uuid()
+    registry.register(task_id, scan_type="nmap", target=request.target)
+    task = scan_with_nmap.apply_async(
+        kwargs={"target": request.target, "options": request.options or "-sV -sC"},
+        task_id=task_id,
+        **priority_options(request.priority)
     )
-    # Track active scan
-    ACTIVE_SCANS[task.id] = {
-        "task_id": task.id,
-        "scan_type": "nmap",
-        "target": request.target,
-        "state": "QUEUED",
-        "progress": 0,
-        "status": "Queued"
-    }
     
     return ScanResponse(
         task_id=task.id,
@@ -111,23 +176,18 @@ async def scan_nmap(request: ScanRequest):
     )
 
 @app.post("/scan/zap", response_model=ScanResponse)
-async def scan_zap(request: ScanRequest):
+def scan_zap(request: ScanRequest):
     """
     Start OWASP ZAP scan for target URL
     """
-    task = scan_with_zap.delay(
-        target_url=request.target,
-        scan_type=request.options or "active"
+    # Track active scan before a worker can report on it
+    task_id = uuid()
+    registry.register(task_id, scan_type="zap", target=request.target)
+    task = scan_with_zap.apply_async(
+        kwargs={"target_url": request.target, "scan_type": request.options or "active"},
+        task_id=task_id,
+        **priority_options(request.priority)
     )
-    # Track active scan
-    ACTIVE_SCANS[task.id] = {
-        "task_id": task.id,
-        "scan_type": "zap",
-        "target": request.target,
-        "state": "QUEUED",
-        "progress": 0,
-        "status": "Queued"
-    }
     
     return ScanResponse(
         task_id=task.id,
@@ -138,23 +198,18 @@ async def scan_zap(request: ScanRequest):
     )
 
 @app.post("/scan/sqlmap", response_model=ScanResponse)
-async def scan_sqlmap(request: ScanRequest):
+def scan_sqlmap(request: ScanRequest):
     """
     Start SQLMap scan for target URL
     """
-    task = scan_with_sqlmap.delay(
-        target_url=request.target,
-        options=request.options or "--batch --level=1 --risk=1"
+    # Track active scan before a worker can report on it
+    task_id = uuid()
+    registry.register(task_id, scan_type="sqlmap", target=request.target)
+    task = scan_with_sqlmap.apply_async(
+        kwargs={"target_url": request.target, "options": request.options or "--batch --level=1 --risk=1"},
+        task_id=task_id,
+        **priority_options(request.priority)
     )
-    # Track active scan
-    ACTIVE_SCANS[task.id] = {
-        "task_id": task.id,
-        "scan_type": "sqlmap",
-        "target": request.target,
-        "state": "QUEUED",
-        "progress": 0,
-        "status": "Queued"
-    }
     
     return ScanResponse(
         task_id=task.id,
@@ -164,89 +219,230 @@ async def scan_sqlmap(request: ScanRequest):
         message=f"SQLMap scan queued for {request.target}"
     )
 
-@app.get("/scan/status/{task_id}")
-async def get_scan_status(task_id: str):
+@app.post("/scan/bulk", response_model=BulkScanResponse)
+async def scan_bulk(request: BulkScanRequest):
     """
-    Get status of a scan task
+    Queue every (target, scan type) pair as one Celery group
+    All scans import into a single DefectDojo engagement for the batch
     """
-    from .celery_app import celery_app
-    from celery.result import AsyncResult
+    jobs = [
+        {"scan_type": scan_type.value, "target": target}
+        for scan_type in request.scan_types
+        for target in request.targets
+    ]
+    if len(jobs) > BULK_MAX_JOBS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_JOBS} scans per batch")
     
-    task = AsyncResult(task_id, app=celery_app)
+    options = request.options or {}
+    engagement_name = request.engagement_name or f"Bulk Scan - {datetime.utcnow():%Y-%m-%d %H:%M:%S}"
     
-    if task.state == 'PENDING':
-        response = {
-            'task_id': task_id,
-            'state': task.state,
-            'status': 'Task is waiting in queue...'
-        }
-    elif task.state == 'STARTED':
-        response = {
-            'task_id': task_id,
-            'state': task.state,
-            'status': 'Task is currently running...',
-            'progress': task.info.get('progress', 0) if task.info else 0
-        }
-    elif task.state == 'SUCCESS':
-        response = {
-            'task_id': task_id,
-            'state': task.state,
-            'status': 'Task completed successfully',
-            'result': task.result
-        }
-        try:
-            _upsert_task_log(task_id, 'SUCCESS', task.result)
-        except Exception as _:
-            pass
-    elif task.state == 'FAILURE':
-        response = {
-            'task_id': task_id,
-            'state': task.state,
-            'status': str(task.info),
-            'error': str(task.info)
-        }
-        try:
-            _upsert_task_log(task_id, 'FAILURE')
-        except Exception as _:
-            pass
+    # Create the shared engagement up front so concurrent imports don't each auto-create one
+    try:
+        await asyncio.to_thread(
+            get_dojo_client().ensure_engagement,
+            engagement_name,
+            os.getenv('PRODUCT_NAME', 'PTaaS Lab Project')
+        )
+    except Exception as e:
+        print(f"[DefectDojo] Could not prepare engagement '{engagement_name}': {e}")
+    
+    batch = group([
+        scan_signature(
+            job["scan_type"], job["target"], options.get(job["scan_type"]),
+            priority=request.priority, engagement_name=engagement_name
+        )
+        for job in jobs
+    ])
+    
+    def submit():
+        # Freeze first so IDs are registered before any worker can report on them
+        result = batch.freeze()
+        for job, child in zip(jobs, result.results):
+            job["task_id"] = child.id
+        registry.register_batch(result.id, jobs, engagement_name=engagement_name)
+        batch.apply_async()
+        result.save()
+        return result
+    
+    result = await asyncio.to_thread(submit)
+    
+    return BulkScanResponse(
+        batch_id=result.id,
+        task_ids=[job["task_id"] for job in jobs],
+        engagement_name=engagement_name,
+        status="queued",
+        message=f"{len(jobs)} scans queued for {len(request.targets)} targets"
+    )
+
+@app.get("/scan/bulk/{batch_id}")
+def get_bulk_status(batch_id: str, include_jobs: bool = True):
+    """
+    Aggregated progress of a bulk submission
+    """
+    batch = registry.get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    states = get_task_states(batch["task_ids"])
+    counts: Dict[str, int] = {}
+    progress_sum = 0.0
+    for state in states.values():
+        counts[state["state"]] = counts.get(state["state"], 0) + 1
+        if state["state"] in TERMINAL_STATES:
+            progress_sum += 100
+        else:
+            progress_sum += state.get("progress", 0) or 0
+    
+    total = len(batch["task_ids"])
+    finished = sum(counts.get(s, 0) for s in TERMINAL_STATES)
+    if finished == total:
+        overall = "SUCCESS" if counts.get("SUCCESS", 0) == total else "COMPLETED_WITH_ERRORS"
+    elif finished or counts.get("STARTED"):
+        overall = "STARTED"
     else:
-        response = {
-            'task_id': task_id,
-            'state': task.state,
-            'status': str(task.info)
-        }
+        overall = "PENDING"
+    
+    response = {
+        "batch_id": batch_id,
+        "state": overall,
+        "engagement_name": batch.get("engagement_name"),
+        "created": batch.get("created"),
+        "total": total,
+        "finished": finished,
+        "counts": counts,
+        "progress": round(progress_sum / total, 1) if total else 100
+    }
+    if include_jobs:
+        response["jobs"] = [states[task_id] for task_id in batch["task_ids"]]
+    return response
+
+@app.get("/scan/status/{task_id}")
+def get_scan_status(task_id: str):
+    """
+    Get status of a scan task
+    """
+    meta = fetch_task_meta([task_id])[task_id]
+    response = describe_task(task_id, meta)
+
+    try:
+        if response['state'] == 'SUCCESS':
+            _record_task_result(task_id, 'SUCCESS', response.get('result'))
+        elif response['state'] == 'FAILURE':
+            _record_task_result(task_id, 'FAILURE')
+    except Exception as _:
+        pass
     
     return response
 
+@app.post("/scan/status/batch")
+def get_scan_status_batch(request: BatchStatusRequest):
+    """
+    Get status of many scan tasks with one pipelined read of the result backend
+    """
+    return get_task_states(request.task_ids)
+
+@app.get("/scan/{task_id}/hosts")
+async def get_scan_hosts(
+    task_id: str,
+    ip: Optional[str] = None,
+    port: Optional[int] = None,
+    protocol: Optional[str] = None,
+    state: Optional[str] = None,
+    service: Optional[str] = None,
+    limit: int = 100,
+    offset: int = 0
+):
+    """
+    Hosts and ports found by an Nmap scan, read from its parsed host artifact
+    ip accepts an address or CIDR; port/protocol/state/service narrow each host's ports
+    """
+    entry = await asyncio.to_thread(registry.get, task_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Task not found in registry")
+    key = entry.get("hosts_key")
+    if not key:
+        raise HTTPException(status_code=404, detail="No parsed host data for this task")
+    try:
+        network = ipaddress.ip_network(ip, strict=False) if ip else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid IP address or network: {ip}")
+    limit = max(1, min(limit, 1000))
+    offset = max(0, offset)
+
+    def collect():
+        total = 0
+        hosts = []
+        for host in read_jsonl(get_storage_client().iter_chunks(key)):
+            host = filter_host(host, network, port, protocol, state, service)
+            if host is None:
+                continue
+            if offset <= total < offset + limit:
+                hosts.append(host)
+            total += 1
+        return total, hosts
+
+    total, hosts = await asyncio.to_thread(collect)
+    return {"task_id": task_id, "total": total, "limit": limit, "offset": offset, "hosts": hosts}
+
+@app.get("/scan/{task_id}/diff")
+async def get_scan_diff(task_id: str, against: Optional[str] = None):
+    """
+    Changes since the previous scan of the same target: new/gone hosts, new/closed
+    ports and changed services for Nmap, new/resolved alerts for ZAP
+    against compares with another scan of the same type instead
+    """
+    entry = await asyncio.to_thread(registry.get, task_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Task not found in registry")
+    if against is None and entry.get("diff_key"):
+        body = await asyncio.to_thread(get_storage_client().download, entry["diff_key"])
+        return json.loads(body)
+
+    scan_type = entry.get("scan_type")
+    field = ARTIFACT_FIELDS.get(scan_type)
+    if not field:
+        raise HTTPException(status_code=400, detail=f"Diffs are not supported for {scan_type} scans")
+    against = against or entry.get("baseline_task_id")
+    if not against:
+        raise HTTPException(status_code=404, detail="No previous scan to compare with")
+    previous = await asyncio.to_thread(registry.get, against)
+    if not previous or previous.get("scan_type") != scan_type:
+        raise HTTPException(status_code=404, detail=f"No {scan_type} scan {against} to compare with")
+    if not entry.get(field) or not previous.get(field):
+        raise HTTPException(status_code=404, detail="No parsed results for one of the scans")
+
+    diff = await asyncio.to_thread(diff_artifacts, get_storage_client(), scan_type, previous[field], entry[field])
+    diff["baseline_task_id"] = against
+    return diff
+
 @app.get("/scan/active")
-async def list_active_scans():
+def list_active_scans():
     """Return current active scans with live status updates."""
-    from .celery_app import celery_app
-    from celery.result import AsyncResult
-
     updated: List[Dict] = []
-    remove_keys: List[str] = []
+    finished: Dict[str, str] = {}
 
-    # Create snapshot to avoid dict size change during iteration
-    scan_items = list(ACTIVE_SCANS.items())
-    
-    for task_id, meta in scan_items:
+    active = registry.list_active()
+    metas = fetch_task_meta([meta["task_id"] for meta in active])
+
+    for meta in active:
+        task_id = meta["task_id"]
         try:
-            task = AsyncResult(task_id, app=celery_app)
-            state = task.state
+            task_meta = metas.get(task_id, {})
+            state = task_meta.get('status', 'PENDING')
+            info = task_meta.get('result')
             progress = 0
             status_msg = meta.get("status", "")
             
             if state == 'STARTED':
-                if isinstance(task.info, dict):
-                    progress = task.info.get('progress', 0)
-                    status_msg = task.info.get('status', 'Running')
+                if isinstance(info, dict):
+                    progress = info.get('progress', 0)
+                    status_msg = info.get('status', 'Running')
             elif state == 'SUCCESS':
                 # Mark for cleanup after returning once
-                remove_keys.append(task_id)
+                finished[task_id] = state
                 status_msg = 'Completed'
             elif state == 'FAILURE':
-                remove_keys.append(task_id)
+                finished[task_id] = state
                 status_msg = 'Failed'
 
             updated.append({
@@ -255,67 +451,141 @@ async def list_active_scans():
                 "target": meta.get("target"),
                 "state": state,
                 "progress": progress,
-                "status": status_msg
+                "status": status_msg,
+                "created": meta.get("created")
             })
         except Exception as e:
             print(f"Error processing task {task_id}: {e}")
-            remove_keys.append(task_id)
+            finished[task_id] = 'FAILURE'
 
-    # Cleanup finished tasks from registry
-    for k in remove_keys:
-        ACTIVE_SCANS.pop(k, None)
+    # Move finished tasks from the active set into the completed history
+    for task_id, state in finished.items():
+        _record_task_result(task_id, state)
 
     return updated
 
+@app.get("/scan/events")
+async def stream_scan_events(request: Request):
+    """
+    Server-Sent Events stream of scan progress.
+    Sends a snapshot of active scans, then every progress event published by the workers.
+    """
+    queue = broadcaster.subscribe()
+
+    async def event_stream():
+        try:
+            active = await asyncio.to_thread(registry.list_active)
+            snapshot = [{
+                "task_id": e.get("task_id"),
+                "scan_type": e.get("scan_type"),
+                "target": e.get("target"),
+                "state": e.get("state"),
+                "progress": e.get("progress", 0),
+                "status": e.get("status"),
+                "created": e.get("created")
+            } for e in active]
+            yield _sse("snapshot", snapshot)
+
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse("progress", event)
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/scan/completed")
-async def list_completed_scans():
-    """Return completed/failed scans recorded in TASK_LOG."""
-    # Return newest first
-    return sorted(TASK_LOG, key=lambda e: e.get("timestamp", e.get("created", "")), reverse=True)
+def list_completed_scans(
+    limit: int = 100,
+    offset: int = 0,
+    scan_type: Optional[str] = None,
+    target: Optional[str] = None
+):
+    """Return completed/failed scans from the registry, newest first."""
+    if scan_type:
+        return registry.list_completed_by_scan_type(scan_type, limit=limit, offset=offset)
+    if target:
+        return registry.list_completed_by_target(target, limit=limit, offset=offset)
+    return registry.list_completed(limit=limit, offset=offset)
+
+@app.get("/stats/summary")
+async def get_stats_summary(days: int = 7):
+    """
+    Pre-aggregated dashboard figures: finding histograms from the local
+    findings index counters and scan counters from the registry
+    """
+    counts = await asyncio.to_thread(findings_index.counts)
+    indexed = await asyncio.to_thread(findings_index.ready)
+    severity = counts.get("severity", {})
+    return {
+        "findings": {
+            "total": sum(severity.values()),
+            "by_severity": severity,
+            "active_by_severity": counts.get("severity_active", {}),
+            "by_test": counts.get("test", {}),
+            "by_engagement": counts.get("engagement", {}),
+            "by_scan_type": counts.get("scan_type", {}),
+            "indexed": indexed
+        },
+        "scans": await asyncio.to_thread(registry.scan_stats, days=max(1, min(days, 90)))
+    }
 
 @app.get("/storage/raw/{task_id}")
-async def download_raw_by_task(task_id: str):
-    """Stream raw scan result from MinIO for a given task_id."""
-    from fastapi.responses import StreamingResponse
+async def download_raw_by_task(task_id: str, request: Request):
+    """Stream raw scan result from MinIO for a given task_id (supports Range / ETag)."""
     import re
 
-    entry = _find_task_log(task_id)
+    entry = await asyncio.to_thread(registry.get, task_id)
     if not entry:
-        raise HTTPException(status_code=404, detail="Task not found in log")
-    storage_url = entry.get("storage_url")
-    if not storage_url:
-        raise HTTPException(status_code=404, detail="No storage_url for this task")
-
-    # Expect format http://minio:9000/<bucket>/<key>
-    m = re.match(r"https?://[^/]+/(.*?)/(.*)", storage_url)
-    if not m:
-        raise HTTPException(status_code=400, detail="Invalid storage_url format")
-    bucket, key = m.group(1), m.group(2)
-
-    try:
-        import boto3
-        from botocore.exceptions import ClientError
-        s3_client = boto3.client('s3', 
-            endpoint_url=os.getenv("S3_ENDPOINT"),
-            aws_access_key_id=os.getenv("S3_ACCESS_KEY"),
-            aws_secret_access_key=os.getenv("S3_SECRET_KEY")
-        )
-        obj = s3_client.get_object(Bucket=bucket, Key=key)
-        content_type = 'application/xml' if key.endswith('.xml') else 'text/plain'
-        return StreamingResponse(obj['Body'], media_type=content_type)
-    except ClientError as e:
-        raise HTTPException(status_code=500, detail=f"S3 error: {str(e)}")
+        raise HTTPException(status_code=404, detail="Task not found in registry")
+    key = entry.get("object_key")
+    if not key:
+        # Older entries only recorded the URL: http://minio:9000/<bucket>/<key>
+        storage_url = entry.get("storage_url")
+        if not storage_url:
+            raise HTTPException(status_code=404, detail="No storage_url for this task")
+        m = re.match(r"https?://[^/]+/(.*?)/(.*)", storage_url)
+        if not m:
+            raise HTTPException(status_code=400, detail="Invalid storage_url format")
+        key = m.group(2)
+
+    content_type = 'application/xml' if key.endswith('.xml') else 'text/plain'
+    return await storage_object_response(request, get_storage_client(), key, media_type=content_type)
 
 @app.get("/results", response_model=List[ResultResponse])
 async def get_results(
+    response: Response,
     product: Optional[str] = None,
-    limit: int = 10
+    severity: Optional[str] = None,
+    test: Optional[int] = None,
+    scan_type: Optional[str] = None,
+    q: Optional[str] = None,
+    limit: int = 10,
+    offset: int = 0
 ):
     """
-    Get scan results from DefectDojo (simplified model)
+    Get scan results (simplified model) from the local findings index,
+    falling back to DefectDojo until the first sync has completed
     """
-    dojo_client = DefectDojoClient()
-    findings = dojo_client.get_findings(product_name=product, limit=limit)
+    if await asyncio.to_thread(findings_index.ready):
+        total, findings = await asyncio.to_thread(
+            findings_index.query,
+            severity=severity, product=product, test_id=test, scan_type=scan_type,
+            q=q, active=True, limit=limit, offset=offset
+        )
+        response.headers["X-Total-Count"] = str(total)
+        return [summarize_finding(f) for f in findings]
+
+    dojo_client = get_async_dojo_client()
+    findings = await dojo_client.get_findings(product_name=product, severity=severity, limit=limit)
     return findings
 
 @app.get("/results/{finding_id}")
@@ -323,107 +593,114 @@ async def get_result_detail(finding_id: int):
     """
     Get detailed information about a specific finding
     """
-    dojo_client = DefectDojoClient()
-    finding = dojo_client.get_finding_detail(finding_id)
+    indexed = await asyncio.to_thread(findings_index.get, finding_id)
+    if indexed:
+        return finding_detail(indexed)
+    dojo_client = get_async_dojo_client()
+    finding = await dojo_client.get_finding_detail(finding_id)
     if not finding:
         raise HTTPException(status_code=404, detail="Finding not found")
     return finding
 
 @app.get("/dojo/findings")
-async def proxy_dojo_findings(limit: int = 100, offset: int = 0):
-    """Proxy raw findings from DefectDojo to avoid browser CORS issues"""
-    dojo_client = DefectDojoClient()
-    return dojo_client.list_findings_raw(limit=limit, offset=offset)
+async def proxy_dojo_findings(
+    request: Request,
+    response: Response,
+    limit: int = 100,
+    offset: int = 0,
+    stream: bool = False,
+    severity: Optional[str] = None,
+    product: Optional[str] = None,
+    test: Optional[int] = None,
+    scan_type: Optional[str] = None,
+    q: Optional[str] = None
+):
+    """
+    Raw findings, answered from the local findings index once it is ready
+    (otherwise proxied from DefectDojo to avoid browser CORS issues)
+    stream=true bypasses index and cache and streams pages from DefectDojo (JSON array or NDJSON)
+    """
+    dojo_client = get_async_dojo_client()
+    if stream:
+        return stream_collection(request, dojo_client.iter_pages('findings/', max_items=limit, offset=offset))
+    if await asyncio.to_thread(findings_index.ready):
+        total, findings = await asyncio.to_thread(
+            findings_index.query,
+            severity=severity, product=product, test_id=test, scan_type=scan_type,
+            q=q, limit=limit, offset=offset
+        )
+        response.headers["X-Total-Count"] = str(total)
+        return findings
+    return await dojo_cache.get_or_fetch(
+        ("findings", limit, offset),
+        lambda: dojo_client.list_findings_raw(limit=limit, offset=offset)
+    )
 
 @app.get("/dojo/engagements")
-async def proxy_dojo_engagements(limit: int = 100, offset: int = 0):
+async def proxy_dojo_engagements(request: Request, limit: int = 100, offset: int = 0, stream: bool = False):
     """Proxy engagements from DefectDojo for dashboard/history"""
-    dojo_client = DefectDojoClient()
-    return dojo_client.list_engagements_raw(limit=limit, offset=offset)
+    dojo_client = get_async_dojo_client()
+    if stream:
+        return stream_collection(request, dojo_client.iter_pages('engagements/', max_items=limit, offset=offset))
+    return await dojo_cache.get_or_fetch(
+        ("engagements", limit, offset),
+        lambda: dojo_client.list_engagements_raw(limit=limit, offset=offset)
+    )
 
 @app.get("/dojo/products")
 async def proxy_dojo_products(limit: int = 100, offset: int = 0):
-    dojo_client = DefectDojoClient()
-    data = dojo_client.get_products()
+    dojo_client = get_async_dojo_client()
+    data = await dojo_cache.get_or_fetch(("products",), dojo_client.get_products)
     return data
 
 @app.get("/dojo/tests")
-async def proxy_dojo_tests(limit: int = 1000):
+async def proxy_dojo_tests(request: Request, limit: int = 1000, stream: bool = False):
     """Proxy tests from DefectDojo for mapping test IDs to scan info"""
-    dojo_client = DefectDojoClient()
-    return dojo_client.get_tests(limit=limit)
+    dojo_client = get_async_dojo_client()
+    if stream:
+        return stream_collection(request, dojo_client.iter_pages('tests/', max_items=limit))
+    return await dojo_cache.get_or_fetch(
+        ("tests", limit),
+        lambda: dojo_client.get_tests(limit=limit)
+    )
 
 @app.get("/dojo/tests/{test_id}")
 async def proxy_dojo_test_detail(test_id: int):
     """Get test detail by ID"""
-    dojo_client = DefectDojoClient()
-    test = dojo_client.get_test_detail(test_id)
+    dojo_client = get_async_dojo_client()
+    test = await dojo_client.get_test_detail(test_id)
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
     return test
 
 @app.get("/dojo/tests/{test_id}/raw")
-async def download_dojo_test_raw(test_id: int):
-    """Download raw scan file for DefectDojo test"""
-    from .integrations.storage import StorageClient
-    
-    dojo_client = DefectDojoClient()
+async def download_dojo_test_raw(test_id: int, request: Request):
+    """Stream raw scan file for DefectDojo test (supports Range / ETag)"""
+    dojo_client = get_async_dojo_client()
     
     # Try to get raw file from DefectDojo first
-    raw_data = dojo_client.get_test_file(test_id)
-    if raw_data:
-        return StreamingResponse(
-            iter([raw_data]),
-            media_type="application/octet-stream",
-            headers={"Content-Disposition": f'attachment; filename="test_{test_id}_raw.xml"'}
-        )
-    
-    # Fallback: Try MinIO - search for files matching test_id or target pattern
-    storage = StorageClient()
-    
-    # Get test info to search by target name
-    test = dojo_client.get_test_detail(test_id)
-    if not test:
-        raise HTTPException(status_code=404, detail="Test not found")
+    upstream = await dojo_client.open_test_file(test_id, headers=conditional_headers(request))
+    if upstream is not None:
+        return upstream_file_response(upstream, filename=f"test_{test_id}_raw.xml")
     
-    # List files in MinIO and try to find matching scan results
-    # Look for files created around test creation time with similar scan type
-    all_files = storage.list_files()
-    
-    # Filter by scan type pattern (nmap_*, zap_*, sqlmap_*)
-    scan_type = test.get('scan_type', '').lower()
-    matching_files = []
-    
-    if 'nmap' in scan_type:
-        matching_files = [f for f in all_files if 'nmap' in f.lower()]
-    elif 'zap' in scan_type:
-        matching_files = [f for f in all_files if 'zap' in f.lower()]
-    elif 'sqlmap' in scan_type:
-        matching_files = [f for f in all_files if 'sqlmap' in f.lower()]
-    
-    if matching_files:
-        # Try most recent file of this type
-        matching_files.sort(reverse=True)
-        filename = matching_files[0]
-        try:
-            raw_data = storage.download(filename)
-            return StreamingResponse(
-                iter([raw_data]),
-                media_type="application/octet-stream",
-                headers={"Content-Disposition": f'attachment; filename="{filename}"'}
-            )
-        except:
-            pass
+    # Fallback: MinIO object recorded by the scan task that produced this test
+    task_id = await asyncio.to_thread(registry.task_for_dojo_test, test_id)
+    entry = await asyncio.to_thread(registry.get, task_id) if task_id else None
+    if entry and entry.get("object_key"):
+        key = entry["object_key"]
+        return await storage_object_response(
+            request, get_storage_client(), key,
+            filename=key.rsplit('/', 1)[-1],
+            media_type="application/octet-stream"
+        )
     
     # No raw file found
     raise HTTPException(status_code=404, detail="Raw file not found in MinIO or DefectDojo")
 
 @app.get("/results/{task_id}/download")
-async def download_raw_results(task_id: str):
-    """Download raw scan results from MinIO (placeholder)"""
-    # This would fetch from MinIO based on task_id
-    # For now, return error since we need MinIO integration
-    raise HTTPException(status_code=501, detail="Raw download not yet implemented")
+async def download_raw_results(task_id: str, request: Request):
+    """Download raw scan results from MinIO"""
+    return await download_raw_by_task(task_id, request)
 
 if __name__ == "__main__":
     import uvicorn
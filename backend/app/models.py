@@ -21,6 +21,7 @@ class ScanRequest(BaseModel):
     """Request model for starting a scan"""
     target: str = Field(..., description="Target URL or IP address")
     options: Optional[str] = Field(None, description="Additional scan options")
+    priority: Optional[int] = Field(None, ge=0, le=9, description="Queue priority, 0 (lowest) to 9 (most urgent)")
     
     @validator('target')
     def validate_target(cls, v):
@@ -28,6 +29,42 @@ class ScanRequest(BaseModel):
             raise ValueError('Target cannot be empty')
         return v.strip()
 
+class NmapScanRequest(ScanRequest):
+    """Nmap scan request; setting shard_size or parallelism runs a sharded scan"""
+    shard_size: Optional[int] = Field(None, ge=1, le=65536, description="Max addresses per shard")
+    parallelism: Optional[int] = Field(None, ge=1, le=64, description="Max shards scanned at once")
+
+class BulkScanRequest(BaseModel):
+    """Request model for scanning many targets in one submission"""
+    targets: List[str] = Field(..., min_length=1, max_length=1000, description="Target URLs or IP addresses")
+    scan_types: List[ScanType] = Field(..., min_length=1, description="Scans to run against every target")
+    options: Optional[Dict[ScanType, str]] = Field(None, description="Scan options per scan type")
+    engagement_name: Optional[str] = Field(None, description="DefectDojo engagement shared by the batch")
+    priority: Optional[int] = Field(None, ge=0, le=9, description="Queue priority, 0 (lowest) to 9 (most urgent)")
+    
+    @validator('targets')
+    def validate_targets(cls, v):
+        targets = list(dict.fromkeys(t.strip() for t in v if t and t.strip()))
+        if not targets:
+            raise ValueError('Targets cannot be empty')
+        return targets
+    
+    @validator('scan_types')
+    def validate_scan_types(cls, v):
+        return list(dict.fromkeys(v))
+
+class BulkScanResponse(BaseModel):
+    """Response model for a bulk submission"""
+    batch_id: str = Field(..., description="Parent job ID (Celery group ID)")
+    task_ids: List[str] = Field(..., description="Celery task IDs of the individual scans")
+    engagement_name: str = Field(..., description="DefectDojo engagement receiving every import")
+    status: str = Field(..., description="Current status")
+    message: str = Field(..., description="Status message")
+
+class BatchStatusRequest(BaseModel):
+    """Request model for looking up many task states at once"""
+    task_ids: List[str] = Field(..., min_length=1, max_length=1000, description="Celery task IDs")
+
 class ScanResponse(BaseModel):
     """Response model for scan initiation"""
     task_id: str = Field(..., description="Celery task ID")
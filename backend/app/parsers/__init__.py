@@ -0,0 +1 @@
+# Scanner output parsers
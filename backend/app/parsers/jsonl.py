@@ -0,0 +1,46 @@
+"""
+JSON-lines helpers for the parsed scan artifacts stored next to raw reports
+"""
+import hashlib
+import json
+from typing import Any, BinaryIO, Dict, Iterable, Iterator
+
+
+def dump_line(record: Dict[str, Any]) -> bytes:
+    """One compact JSON line"""
+    return json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def write_jsonl(records: Iterable[Dict[str, Any]], output: BinaryIO) -> int:
+    """Write records as JSON lines; returns the number written"""
+    count = 0
+    for record in records:
+        output.write(dump_line(record))
+        count += 1
+    return count
+
+
+def read_jsonl(chunks: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    """Records from a JSON-lines artifact delivered in arbitrary chunks"""
+    buffer = b''
+    for chunk in chunks:
+        lines = (buffer + chunk).split(b'\n')
+        buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if buffer.strip():
+        yield json.loads(buffer)
+
+
+def unordered_digest(lines: Iterable[bytes]) -> str:
+    """
+    SHA-256 based digest of a collection of lines that does not depend on
+    their order (scanners do not always report hosts/alerts in the same order)
+    """
+    total = 0
+    for line in lines:
+        line = line.rstrip(b'\n')
+        if line:
+            total = (total + int.from_bytes(hashlib.sha256(line).digest(), 'big')) % (1 << 256)
+    return f"{total:064x}"
@@ -0,0 +1,184 @@
+"""
+Streaming Nmap XML parser
+
+iter_nmap_hosts() walks an Nmap XML report with iterparse and yields one
+compact record per <host>, dropping each element once it has been read, so
+a /16-sized report is processed in constant memory. The records are stored
+as JSON lines (one host per line) next to the raw report and back the
+/scan/{task_id}/hosts endpoint.
+
+NmapTaskFilter keeps the <taskbegin>/<taskprogress>/<taskend> progress
+chatter (--stats-every) out of the report that is stored and imported.
+"""
+import ipaddress
+import json
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from .jsonl import dump_line, unordered_digest
+
+HOSTS_FILENAME = 'hosts.jsonl'
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def _compact(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in record.items() if v not in (None, '', [], {})}
+
+
+def _scripts(parent: Optional[ET.Element]) -> Dict[str, str]:
+    """NSE script id -> output (DefectDojo turns e.g. vulners output into findings)"""
+    if parent is None:
+        return {}
+    return {s.get('id'): s.get('output') or '' for s in parent.findall('script') if s.get('id')}
+
+
+def _port_record(port: ET.Element) -> Dict[str, Any]:
+    state = port.find('state')
+    service = port.find('service')
+    record = {
+        'port': int(port.get('portid', 0)),
+        'protocol': port.get('protocol'),
+        'state': state.get('state') if state is not None else None,
+    }
+    if service is not None:
+        record.update({
+            'service': service.get('name'),
+            'product': service.get('product'),
+            'version': service.get('version'),
+            'extrainfo': service.get('extrainfo'),
+            'tunnel': service.get('tunnel'),
+            'cpe': [cpe.text for cpe in service.findall('cpe') if cpe.text],
+        })
+    record['scripts'] = _scripts(port)
+    return _compact(record)
+
+
+def _host_record(host: ET.Element) -> Dict[str, Any]:
+    addresses = {a.get('addrtype'): a.get('addr') for a in host.findall('address')}
+    status = host.find('status')
+    osmatch = host.find('os/osmatch')
+    return _compact({
+        'ip': addresses.get('ipv4') or addresses.get('ipv6'),
+        'mac': addresses.get('mac'),
+        'hostnames': [h.get('name') for h in host.findall('hostnames/hostname') if h.get('name')],
+        'status': status.get('state') if status is not None else None,
+        'os': osmatch.get('name') if osmatch is not None else None,
+        'ports': [_port_record(p) for p in host.findall('ports/port')],
+        'hostscripts': _scripts(host.find('hostscript')),
+    })
+
+
+class NmapTaskFilter:
+    """Writable wrapper dropping Nmap's task* progress lines from an XML stream"""
+
+    _TASK = re.compile(rb'^\s*<task(?:begin|progress|end)\b')
+
+    def __init__(self, output: BinaryIO):
+        self.output = output
+        self._partial = b''
+
+    def write(self, chunk: bytes) -> int:
+        lines = (self._partial + chunk).split(b'\n')
+        # The last element is an unfinished line (or b'')
+        self._partial = lines.pop()
+        kept = [line for line in lines if not self._TASK.match(line)]
+        if kept:
+            self.output.write(b'\n'.join(kept) + b'\n')
+        return len(chunk)
+
+    def flush(self) -> None:
+        """Write out a trailing line without newline"""
+        if self._partial and not self._TASK.match(self._partial):
+            self.output.write(self._partial)
+        self._partial = b''
+
+
+def iter_nmap_hosts(source: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """Yield one record per <host> of an Nmap XML report"""
+    root = None
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            continue
+        if elem.tag == 'host':
+            yield _host_record(elem)
+        # Drop completed top-level elements so the tree never grows
+        if root is not None and elem in list(root):
+            root.remove(elem)
+
+
+def write_hosts_jsonl(hosts: Iterable[Dict[str, Any]], output: BinaryIO) -> Tuple[int, int]:
+    """
+    Write host records as JSON lines
+
+    Returns:
+        (hosts written, open ports across all hosts)
+    """
+    count = open_ports = 0
+    for host in hosts:
+        output.write(dump_line(host))
+        count += 1
+        open_ports += sum(1 for p in host.get('ports', []) if p.get('state') == 'open')
+    return count, open_ports
+
+
+# Port fields DefectDojo's Nmap parser turns into findings
+_IMPORTED_PORT_FIELDS = ('port', 'protocol', 'service', 'product', 'version', 'extrainfo', 'cpe', 'scripts')
+
+
+def import_record(host: Dict[str, Any]) -> Dict[str, Any]:
+    """The parts of a host record that end up in DefectDojo (open ports, services, NSE output)"""
+    ports = [
+        {k: p[k] for k in _IMPORTED_PORT_FIELDS if k in p}
+        for p in host.get('ports', []) if 'open' in (p.get('state') or '')
+    ]
+    return _compact({
+        'ip': host.get('ip'),
+        'hostnames': sorted(host.get('hostnames', [])),
+        'os': host.get('os'),
+        'ports': sorted(ports, key=lambda p: (p.get('protocol') or '', p.get('port', 0))),
+        'hostscripts': host.get('hostscripts'),
+    })
+
+
+def import_digest(hosts: Iterable[Dict[str, Any]]) -> str:
+    """Order-independent digest of what a report imports into DefectDojo"""
+    return unordered_digest(json.dumps(import_record(h), sort_keys=True).encode('utf-8') for h in hosts)
+
+
+def filter_host(
+    host: Dict[str, Any],
+    network: Optional[Network] = None,
+    port: Optional[int] = None,
+    protocol: Optional[str] = None,
+    state: Optional[str] = None,
+    service: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Apply /hosts query filters to one record
+
+    Port-level filters narrow the host's port list to the matching ports and
+    drop hosts left with none. Returns None if the host does not match.
+    """
+    if network is not None:
+        try:
+            if ipaddress.ip_address(host.get('ip', '')) not in network:
+                return None
+        except ValueError:
+            return None
+
+    if port is None and protocol is None and state is None and service is None:
+        return host
+    ports = [
+        p for p in host.get('ports', [])
+        if (port is None or p.get('port') == port)
+        and (protocol is None or p.get('protocol') == protocol)
+        and (state is None or p.get('state') == state)
+        and (service is None or service.lower() in (p.get('service') or '').lower())
+    ]
+    if not ports:
+        return None
+    return {**host, 'ports': ports}
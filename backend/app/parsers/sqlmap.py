@@ -0,0 +1,166 @@
+"""
+Streaming parser for SQLMap console output
+
+SQLMap reports what it found in a block like
+
+    sqlmap identified the following injection point(s) with a total of 46 HTTP(s) requests:
+    ---
+    Parameter: id (GET)
+        Type: boolean-based blind
+        Title: AND boolean-based blind - WHERE or HAVING clause
+        Payload: id=1 AND 5678=5678
+    ---
+
+("resumed the following injection point(s) from stored session" when the
+session file already had them), followed by fingerprint lines such as
+"back-end DBMS: MySQL >= 5.0.12". The parser is fed output chunks as they
+stream out of the container and keeps only the current line plus what it
+extracted, so memory does not grow with the size of the log.
+"""
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Longer lines (echoed payloads, dumped table rows) are truncated
+MAX_LINE = 16 * 1024
+
+_BLOCK_START = re.compile(r'(?:identified|resumed) the following injection point', re.I)
+_PARAMETER = re.compile(r'^Parameter: (.+) \((.+)\)\s*$')
+_FIELD = re.compile(r'^\s+(Type|Title|Payload|Vector): (.*)$')
+_FINGERPRINT = re.compile(r'^(back-end DBMS|web server operating system|web application technology): (.+)$')
+# Log line printed as soon as a technique works, e.g.
+# [10:01:02] [INFO] GET parameter 'id' appears to be 'AND boolean-based blind' injectable
+_INJECTABLE = re.compile(r"(\S+) parameter '([^']+)' (?:is|appears to be) '(.+?)' injectable", re.I)
+
+_FINGERPRINT_FIELDS = {
+    'back-end DBMS': 'dbms',
+    'web server operating system': 'os',
+    'web application technology': 'technology',
+}
+
+MITIGATION = (
+    "Use parameterized queries (prepared statements) or a safe ORM API for every query "
+    "built from request data, validate input against an allow-list and run the application "
+    "with a least-privilege database account."
+)
+
+
+class SqlmapResultParser:
+    """Collects injection points, techniques, payloads and fingerprints from SQLMap output"""
+
+    def __init__(self):
+        # (place, parameter) -> {'techniques': [...], 'logged': [titles]}
+        self.points: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.dbms: Optional[str] = None
+        self.os: Optional[str] = None
+        self.technology: Optional[str] = None
+        self._buffer = b''
+        self._block_pending = False
+        self._in_block = False
+        self._point: Optional[Dict[str, Any]] = None
+        self._technique: Optional[Dict[str, str]] = None
+
+    def feed(self, chunk: bytes) -> None:
+        lines = (self._buffer + chunk).split(b'\n')
+        # The last element is an unfinished line (or b'')
+        self._buffer = lines.pop()[:MAX_LINE]
+        for line in lines:
+            self._line(line[:MAX_LINE].decode('utf-8', errors='replace').rstrip('\r'))
+
+    def close(self) -> None:
+        """Process a final line that had no trailing newline"""
+        if self._buffer:
+            self._line(self._buffer.decode('utf-8', errors='replace').rstrip('\r'))
+            self._buffer = b''
+
+    def _get_point(self, place: str, name: str) -> Dict[str, Any]:
+        # "(custom) POST" in the summary block is logged as plain "POST"
+        key = (place.split()[-1], name)
+        if key not in self.points:
+            self.points[key] = {'techniques': [], 'logged': []}
+        return self.points[key]
+
+    def _line(self, line: str) -> None:
+        if self._in_block:
+            if line.strip() == '---':
+                self._in_block = False
+                self._point = self._technique = None
+                return
+            match = _PARAMETER.match(line)
+            if match:
+                self._point = self._get_point(match.group(2), match.group(1))
+                self._technique = None
+                return
+            match = _FIELD.match(line)
+            if match and self._point is not None:
+                field, value = match.group(1).lower(), match.group(2).strip()
+                if field == 'type':
+                    self._technique = {'type': value}
+                    self._point['techniques'].append(self._technique)
+                elif self._technique is not None:
+                    self._technique.setdefault(field, value)
+            return
+
+        if self._block_pending:
+            if line.strip() == '---':
+                self._block_pending, self._in_block = False, True
+            return
+        if _BLOCK_START.search(line):
+            self._block_pending = True
+            return
+
+        match = _FINGERPRINT.match(line)
+        if match:
+            setattr(self, _FINGERPRINT_FIELDS[match.group(1)], match.group(2).strip())
+            return
+        match = _INJECTABLE.search(line)
+        if match:
+            place, name, title = match.groups()
+            logged = self._get_point(place, name)['logged']
+            if title not in logged:
+                logged.append(title)
+
+    @property
+    def injectable(self) -> List[Tuple[str, str]]:
+        """(place, parameter) of every injection point found"""
+        return [key for key, point in self.points.items() if point['techniques'] or point['logged']]
+
+    def findings(self, target_url: str, references: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        One DefectDojo Generic Findings entry per injectable parameter
+
+        Techniques come from the summary block; when SQLMap stopped before
+        printing it, the titles from the "... injectable" log lines are used.
+        """
+        findings = []
+        for (place, name), point in self.points.items():
+            techniques = point['techniques'] or [{'title': title} for title in point['logged']]
+            if not techniques:
+                continue
+
+            description = [f"SQLMap found {place} parameter '{name}' of {target_url} injectable.", ""]
+            for label, value in (('Back-end DBMS', self.dbms), ('Web server OS', self.os),
+                                 ('Web application technology', self.technology)):
+                if value:
+                    description.append(f"**{label}:** {value}")
+            description += ["", "**Techniques:**"]
+            for technique in techniques:
+                heading = technique.get('title', '')
+                if technique.get('type'):
+                    heading = f"{technique['type']}: {heading}" if heading else technique['type']
+                description.append(f"- {heading}")
+                if technique.get('payload'):
+                    description.append(f"  Payload: `{technique['payload']}`")
+
+            payload = next((t['payload'] for t in techniques if t.get('payload')), None)
+            findings.append({
+                "title": f"SQL Injection in {place} parameter '{name}'",
+                "severity": "High",
+                "description": "\n".join(description),
+                "mitigation": MITIGATION,
+                "references": references,
+                "cwe": 89,
+                "param": name,
+                "payload": payload,
+                "unique_id_from_tool": f"sqlmap:{target_url}:{place}:{name}",
+            })
+        return findings
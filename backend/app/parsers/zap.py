@@ -0,0 +1,51 @@
+"""
+Compact ZAP alert records
+
+Each alert gets a fingerprint that stays stable across scans of the same
+application: plugin, HTTP method, URL without query string or fragment, and
+parameter. The records are stored as alerts.jsonl next to the XML report
+and are what run-to-run diffs compare.
+"""
+import hashlib
+from typing import Any, BinaryIO, Dict, Iterable, Iterator
+from urllib.parse import urlsplit
+
+from .jsonl import dump_line
+
+ALERTS_FILENAME = 'alerts.jsonl'
+
+
+def alert_fingerprint(alert: Dict[str, Any]) -> str:
+    parts = urlsplit(alert.get('url', ''))
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    key = '|'.join((
+        str(alert.get('pluginId', '')),
+        (alert.get('method') or 'GET').upper(),
+        f"{parts.scheme}://{(parts.hostname or '').lower()}:{port}{parts.path or '/'}",
+        alert.get('param') or '',
+    ))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def alert_record(alert: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'fingerprint': alert_fingerprint(alert),
+        'plugin_id': alert.get('pluginId'),
+        'alert': alert.get('alert') or alert.get('name'),
+        'risk': alert.get('risk'),
+        'confidence': alert.get('confidence'),
+        'method': alert.get('method'),
+        'url': alert.get('url'),
+        'param': alert.get('param') or None,
+    }
+
+
+def tee_alert_records(alerts: Iterable[Dict[str, Any]], output: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """Pass alerts through unchanged, writing one record per distinct fingerprint to `output`"""
+    seen = set()
+    for alert in alerts:
+        record = alert_record(alert)
+        if record['fingerprint'] not in seen:
+            seen.add(record['fingerprint'])
+            output.write(dump_line(record))
+        yield alert
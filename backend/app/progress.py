@@ -0,0 +1,218 @@
+"""
+Incremental progress parsing for streamed scanner output
+
+Parsers are fed raw output chunks as they arrive from the container and
+return a progress dict (percent within the scan phase, ETA, hosts done)
+whenever something changed. ProgressThrottle sits between the parsers and
+Task.update_state so a chatty scanner cannot flood the result backend.
+"""
+import math
+import os
+import re
+import time
+from typing import Any, Callable, Dict, Optional
+
+# Emit at most one progress update per interval, unless progress jumped this much
+PROGRESS_MIN_INTERVAL = float(os.getenv('PROGRESS_MIN_INTERVAL', '2'))
+PROGRESS_MIN_DELTA = float(os.getenv('PROGRESS_MIN_DELTA', '5'))
+
+# Bytes kept between chunks so a tag/line split across chunks is still seen
+_CARRY = 1024
+
+
+class ProgressThrottle:
+    """Forward progress updates to `emit` no more often than needed"""
+
+    def __init__(
+        self,
+        emit: Callable[[Dict[str, Any]], None],
+        min_interval: float = PROGRESS_MIN_INTERVAL,
+        min_delta: float = PROGRESS_MIN_DELTA
+    ):
+        self.emit = emit
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        self._last_at = 0.0
+        self._last_progress: Optional[float] = None
+        self._pending: Optional[Dict[str, Any]] = None
+
+    def update(self, meta: Dict[str, Any], force: bool = False) -> None:
+        now = time.monotonic()
+        progress = meta.get('progress', 0)
+        due = (
+            force
+            or self._last_progress is None
+            or now - self._last_at >= self.min_interval
+            or abs(progress - self._last_progress) >= self.min_delta
+        )
+        if not due:
+            self._pending = meta
+            return
+        self._pending = None
+        self._last_at = now
+        self._last_progress = progress
+        self.emit(meta)
+
+    def flush(self) -> None:
+        """Emit the last suppressed update, if any"""
+        if self._pending is not None:
+            self.update(self._pending, force=True)
+
+
+def _scale(percent: float, start: float, end: float) -> float:
+    """Map 0-100 within a phase onto the task's [start, end] progress window"""
+    return round(start + (end - start) * max(0.0, min(percent, 100.0)) / 100.0, 1)
+
+
+class NmapProgressParser:
+    """
+    Reads Nmap XML output produced with --stats-every, e.g.
+    <taskprogress task="SYN Stealth Scan" time="..." percent="42.10" remaining="88" etc="..."/>
+    and counts finished <host> elements
+
+    Nmap's percent restarts at 0 in every phase (ping, port scan, service
+    detection, ...), so each phase is mapped into its own band of the
+    overall progress, which never decreases.
+    """
+
+    _TAG = re.compile(rb'<(taskbegin|taskprogress|taskend) ([^>]*)>')
+    _ATTR = re.compile(rb'(\w+)="([^"]*)"')
+    # (task name fragment, band start, band end) in percent of the whole scan;
+    # the first matching fragment wins, so the generic port scan band is last
+    _PHASES = (
+        ('ping', 0, 10),
+        ('dns resolution', 10, 15),
+        ('service', 60, 80),
+        ('os detection', 80, 85),
+        ('nse', 85, 98),
+        ('traceroute', 98, 100),
+        ('scan', 15, 60),
+    )
+
+    def __init__(self, start: float = 0, end: float = 100):
+        self.start = start
+        self.end = end
+        self.hosts_done = 0
+        self.phase: Optional[str] = None
+        self.percent = 0.0
+        self.overall = 0.0
+        self.eta: Optional[int] = None
+        self._buffer = b''
+
+    @classmethod
+    def _band(cls, phase: str):
+        lower = phase.lower()
+        for fragment, start, end in cls._PHASES:
+            if fragment in lower:
+                return start, end
+        return None
+
+    def feed(self, chunk: bytes) -> Optional[Dict[str, Any]]:
+        data = self._buffer + chunk
+        changed = False
+
+        hosts = data.count(b'</host>')
+        if hosts:
+            self.hosts_done += hosts
+            changed = True
+        for tag, attrs in self._TAG.findall(data):
+            attrs = dict(self._ATTR.findall(attrs))
+            self.phase = attrs.get(b'task', b'').decode(errors='ignore') or self.phase
+            self.percent = 100.0 if tag == b'taskend' else float(attrs.get(b'percent', 0))
+            band = self._band(self.phase or '')
+            if band:
+                self.overall = max(self.overall, band[0] + (band[1] - band[0]) * min(self.percent, 100.0) / 100.0)
+            remaining = attrs.get(b'remaining')
+            self.eta = int(remaining) if remaining and remaining.isdigit() else None
+            changed = True
+
+        # Keep only an unfinished trailing tag; complete ones were consumed above
+        tail = data[-_CARRY:]
+        cut = tail.rfind(b'<')
+        self._buffer = tail[cut:] if cut != -1 and b'>' not in tail[cut:] else b''
+
+        return self.snapshot() if changed else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        status = f'{self.phase}: {self.percent:.0f}%' if self.phase else 'Scanning...'
+        if self.eta is not None:
+            status += f' (ETA {self.eta}s)'
+        status += f', {self.hosts_done} host(s) done'
+        return {
+            'progress': _scale(self.overall, self.start, self.end),
+            'status': status,
+            'phase': self.phase,
+            'eta': self.eta,
+            'hosts_done': self.hosts_done,
+        }
+
+
+class SqlmapProgressParser:
+    """
+    Estimates progress from SQLMap's log lines
+
+    SQLMap has no percentage output, so progress comes from the phase it is in
+    (connection checks, parameter heuristics, technique tests, exploitation);
+    technique tests approach the end of their band asymptotically since their
+    count depends on --level/--risk.
+    """
+
+    # (marker, percent reached once seen), in the order SQLMap prints them
+    _PHASES = (
+        (b'testing connection to the target url', 5),
+        (b'checking if the target is protected', 10),
+        (b'is dynamic', 15),
+        (b'heuristic', 20),
+        (b'sqlmap identified the following injection point', 85),
+        (b'fetched data logged to text files', 95),
+        (b'ending @', 100),
+    )
+    _TECHNIQUE = re.compile(rb"\[INFO\] testing '")
+    _PARAMETER = re.compile(rb"(?:GET|POST|URI|Cookie|User-Agent|Referer|Host) parameter '([^']+)'", re.I)
+    _INJECTABLE = re.compile(rb"parameter '[^']+' (?:is|appears to be) '[^']*' injectable", re.I)
+    # Technique tests needed to cover ~63% of the 20-80% band
+    _TECHNIQUE_SCALE = 30.0
+
+    def __init__(self, start: float = 0, end: float = 100):
+        self.start = start
+        self.end = end
+        self.percent = 0.0
+        self.techniques_tested = 0
+        self.parameters = set()
+        self.injectable = 0
+        self._buffer = b''
+
+    def feed(self, chunk: bytes) -> Optional[Dict[str, Any]]:
+        data = self._buffer + chunk
+        lines = data.split(b'\n')
+        # The last element is an unfinished line (or b'')
+        self._buffer = lines.pop()[-_CARRY:]
+        before = (self.percent, len(self.parameters), self.injectable)
+
+        for line in lines:
+            lower = line.lower()
+            for marker, percent in self._PHASES:
+                if marker in lower:
+                    self.percent = max(self.percent, percent)
+            for name in self._PARAMETER.findall(line):
+                self.parameters.add(name)
+            if self._INJECTABLE.search(line):
+                self.injectable += 1
+            if self._TECHNIQUE.search(line):
+                self.techniques_tested += 1
+                band = 60 * (1 - math.exp(-self.techniques_tested / self._TECHNIQUE_SCALE))
+                self.percent = max(self.percent, 20 + band)
+
+        if (self.percent, len(self.parameters), self.injectable) == before:
+            return None
+        return self.snapshot()
+
+    def snapshot(self) -> Dict[str, Any]:
+        status = f'SQLMap: {len(self.parameters)} parameter(s) tested, {self.injectable} injectable'
+        return {
+            'progress': _scale(self.percent, self.start, self.end),
+            'status': status,
+            'eta': None,
+            'parameters_tested': len(self.parameters),
+            'injectable': self.injectable,
+        }
@@ -0,0 +1,319 @@
+"""
+Durable scan registry for PTaaS
+
+Replaces the per-process ACTIVE_SCANS / TASK_LOG structures with Redis so that
+every API worker and Celery worker sees the same scan history.
+
+Key layout (all keys share the REGISTRY_PREFIX namespace):
+    scan:{task_id}          hash   - scan metadata, values JSON-encoded
+    scans:active            zset   - task_id scored by creation time
+    scans:completed         zset   - task_id scored by completion time
+    scans:type:{scan_type}  zset   - task_id scored by creation time
+    scans:target:{target}   zset   - task_id scored by creation time
+    scans:completed:type:{scan_type}, scans:completed:target:{target}
+                            zset   - finished scans only, scored by completion time
+    stats:*                 hash   - running counters for the dashboard summary
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import redis
+
+TERMINAL_STATES = ('SUCCESS', 'FAILURE', 'REVOKED')
+
+
+class ScanRegistry:
+    """Redis-backed registry of submitted scans with O(1) lookup by task_id"""
+
+    def __init__(self, redis_url: Optional[str] = None, prefix: Optional[str] = None):
+        self.redis_url = redis_url or os.getenv(
+            'REGISTRY_REDIS_URL',
+            os.getenv('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
+        )
+        self.prefix = prefix or os.getenv('REGISTRY_PREFIX', 'ptaas')
+        self.client = redis.Redis.from_url(self.redis_url, decode_responses=True)
+
+    # ----- key helpers -----
+
+    def _key(self, *parts: str) -> str:
+        return ':'.join((self.prefix,) + parts)
+
+    def _scan_key(self, task_id: str) -> str:
+        return self._key('scan', task_id)
+
+    @staticmethod
+    def _encode(fields: Dict[str, Any]) -> Dict[str, str]:
+        return {k: json.dumps(v) for k, v in fields.items()}
+
+    @staticmethod
+    def _decode(raw: Dict[str, str]) -> Dict[str, Any]:
+        decoded = {}
+        for k, v in raw.items():
+            try:
+                decoded[k] = json.loads(v)
+            except (TypeError, ValueError):
+                decoded[k] = v
+        return decoded
+
+    # ----- writes -----
+
+    def register(self, task_id: str, scan_type: str, target: str, pipe=None, **extra: Any) -> Dict[str, Any]:
+        """Record a newly queued scan, optionally on a caller's pipeline"""
+        now = time.time()
+        entry = {
+            'task_id': task_id,
+            'scan_type': scan_type,
+            'target': target,
+            'state': 'QUEUED',
+            'status': 'Queued',
+            'progress': 0,
+            'created': datetime.utcnow().isoformat(),
+            'created_ts': now,
+        }
+        entry.update(extra)
+
+        own_pipe = pipe is None
+        pipe = pipe if pipe is not None else self.client.pipeline(transaction=True)
+        pipe.hset(self._scan_key(task_id), mapping=self._encode(entry))
+        pipe.zadd(self._key('scans', 'active'), {task_id: now})
+        pipe.zadd(self._key('scans', 'type', scan_type), {task_id: now})
+        pipe.zadd(self._key('scans', 'target', target), {task_id: now})
+        if own_pipe:
+            pipe.execute()
+        return entry
+
+    def register_batch(self, batch_id: str, jobs: List[Dict[str, str]], **extra: Any) -> Dict[str, Any]:
+        """Record a bulk submission and all of its child scans in one round trip"""
+        batch = {
+            'batch_id': batch_id,
+            'total': len(jobs),
+            'created': datetime.utcnow().isoformat(),
+            'created_ts': time.time(),
+        }
+        batch.update(extra)
+
+        pipe = self.client.pipeline(transaction=True)
+        for job in jobs:
+            self.register(job['task_id'], job['scan_type'], job['target'], pipe=pipe, batch_id=batch_id)
+        pipe.hset(self._key('batch', batch_id), mapping=self._encode(batch))
+        pipe.rpush(self._key('batch', batch_id, 'tasks'), *[job['task_id'] for job in jobs])
+        pipe.execute()
+        return batch
+
+    def update(self, task_id: str, pipe=None, **fields: Any) -> None:
+        """Merge fields into an existing scan entry, optionally on a caller's pipeline"""
+        if fields:
+            (pipe or self.client).hset(self._scan_key(task_id), mapping=self._encode(fields))
+
+    def setdefault(self, task_id: str, field: str, value: Any) -> bool:
+        """Set a field of a scan entry unless it is already set; True if it was written"""
+        return bool(self.client.hsetnx(self._scan_key(task_id), field, json.dumps(value)))
+
+    def increment(self, task_id: str, field: str, amount: int = 1) -> int:
+        """Atomically bump a numeric field of a scan entry"""
+        return self.client.hincrby(self._scan_key(task_id), field, amount)
+
+    def mark_finished(self, task_id: str, state: str, result: Optional[Dict] = None) -> Dict[str, Any]:
+        """Move a scan from the active set to the completed history"""
+        now = time.time()
+        fields: Dict[str, Any] = {
+            'task_id': task_id,
+            'state': state,
+            'status': 'success' if state == 'SUCCESS' else ('failure' if state == 'FAILURE' else state.lower()),
+            'timestamp': datetime.utcnow().isoformat(),
+            'finished_ts': now,
+        }
+        if result and isinstance(result, dict):
+            fields['storage_url'] = result.get('storage_url')
+            fields['filename'] = result.get('filename')
+            if result.get('object_key'):
+                fields['object_key'] = result['object_key']
+            dojo = result.get('dojo_import') or {}
+            if isinstance(dojo, dict):
+                fields['dojo_test_id'] = dojo.get('test_id') or dojo.get('test')
+                fields['engagement_id'] = dojo.get('engagement_id')
+                fields['product_id'] = dojo.get('product_id')
+            if not self.client.hexists(self._scan_key(task_id), 'target') and result.get('target'):
+                fields['target'] = result.get('target')
+
+        scan_type, target, created_ts, started_ts = [
+            json.loads(v) if v else None
+            for v in self.client.hmget(self._scan_key(task_id), 'scan_type', 'target', 'created_ts', 'started_ts')
+        ]
+        target = target or fields.get('target')
+
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(self._scan_key(task_id), mapping=self._encode(fields))
+        pipe.zrem(self._key('scans', 'active'), task_id)
+        # NX keeps the first completion time if the status is reported twice
+        pipe.zadd(self._key('scans', 'completed'), {task_id: now}, nx=True)
+        if scan_type:
+            pipe.zadd(self._key('scans', 'completed', 'type', scan_type), {task_id: now}, nx=True)
+        if target:
+            pipe.zadd(self._key('scans', 'completed', 'target', target), {task_id: now}, nx=True)
+        if fields.get('dojo_test_id'):
+            self.link_dojo_test(fields['dojo_test_id'], task_id, pipe=pipe)
+        first_completion = pipe.execute()[2]
+
+        if first_completion:
+            started = started_ts or created_ts
+            self._record_stats(
+                scan_type or 'unknown',
+                state,
+                now - float(started) if started else None
+            )
+        return fields
+
+    def _record_stats(self, scan_type: str, state: str, duration: Optional[float]) -> None:
+        """Fold one finished scan into the running dashboard counters"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hincrby(self._key('stats', 'scans', 'day'), datetime.utcnow().strftime('%Y-%m-%d'), 1)
+        pipe.hincrby(self._key('stats', 'scans', 'type'), scan_type, 1)
+        pipe.hincrby(self._key('stats', 'scans', 'state'), state, 1)
+        if duration is not None and state == 'SUCCESS':
+            pipe.hincrbyfloat(self._key('stats', 'duration', 'sum'), scan_type, duration)
+            pipe.hincrby(self._key('stats', 'duration', 'count'), scan_type, 1)
+        pipe.execute()
+
+    # ----- reads -----
+
+    def link_dojo_test(self, test_id: Any, task_id: str, pipe=None) -> None:
+        """Remember which scan task produced a DefectDojo test"""
+        (pipe or self.client).hset(self._key('dojo-tests'), str(test_id), task_id)
+
+    def task_for_dojo_test(self, test_id: Any) -> Optional[str]:
+        return self.client.hget(self._key('dojo-tests'), str(test_id))
+
+    @staticmethod
+    def _baseline_field(scan_type: str, target: str, engagement_name: str) -> str:
+        return json.dumps([scan_type, target, engagement_name])
+
+    def set_baseline(self, scan_type: str, target: str, engagement_name: str, task_id: str) -> None:
+        """Remember the latest imported scan of a target (what the next run is diffed against)"""
+        self.client.hset(self._key('baselines'), self._baseline_field(scan_type, target, engagement_name), task_id)
+
+    def get_baseline(self, scan_type: str, target: str, engagement_name: str) -> Optional[str]:
+        return self.client.hget(self._key('baselines'), self._baseline_field(scan_type, target, engagement_name))
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Return a single scan entry or None"""
+        raw = self.client.hgetall(self._scan_key(task_id))
+        return self._decode(raw) if raw else None
+
+    def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Bulk submission metadata plus its child task IDs"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hgetall(self._key('batch', batch_id))
+        pipe.lrange(self._key('batch', batch_id, 'tasks'), 0, -1)
+        raw, task_ids = pipe.execute()
+        if not raw:
+            return None
+        batch = self._decode(raw)
+        batch['task_ids'] = task_ids
+        return batch
+
+    def get_many(self, task_ids: List[str]) -> List[Dict[str, Any]]:
+        """Fetch several entries in one pipelined round-trip, preserving order"""
+        if not task_ids:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for task_id in task_ids:
+            pipe.hgetall(self._scan_key(task_id))
+        return [self._decode(raw) for raw in pipe.execute() if raw]
+
+    def _page(self, key: str, limit: int, offset: int, newest_first: bool = True) -> List[Dict[str, Any]]:
+        end = offset + limit - 1 if limit > 0 else -1
+        if newest_first:
+            task_ids = self.client.zrevrange(key, offset, end)
+        else:
+            task_ids = self.client.zrange(key, offset, end)
+        return self.get_many(task_ids)
+
+    def list_active(self) -> List[Dict[str, Any]]:
+        """Active (queued or running) scans, oldest first"""
+        return self._page(self._key('scans', 'active'), 0, 0, newest_first=False)
+
+    def list_completed(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """Completed/failed scans, newest first"""
+        return self._page(self._key('scans', 'completed'), limit, offset)
+
+    def count_completed(self) -> int:
+        return self.client.zcard(self._key('scans', 'completed'))
+
+    def scan_stats(self, days: int = 7) -> Dict[str, Any]:
+        """Scan counters maintained by mark_finished"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hgetall(self._key('stats', 'scans', 'day'))
+        pipe.hgetall(self._key('stats', 'scans', 'type'))
+        pipe.hgetall(self._key('stats', 'scans', 'state'))
+        pipe.hgetall(self._key('stats', 'duration', 'sum'))
+        pipe.hgetall(self._key('stats', 'duration', 'count'))
+        pipe.zcard(self._key('scans', 'active'))
+        per_day, by_type, by_state, duration_sum, duration_count, active = pipe.execute()
+
+        today = datetime.utcnow().date()
+        day_keys = [(today - timedelta(days=i)).isoformat() for i in range(days - 1, -1, -1)]
+        total_sum = sum(float(v) for v in duration_sum.values())
+        total_count = sum(int(v) for v in duration_count.values())
+        return {
+            'total': sum(int(v) for v in by_type.values()),
+            'active': active,
+            'by_type': {k: int(v) for k, v in by_type.items()},
+            'by_state': {k: int(v) for k, v in by_state.items()},
+            'per_day': {d: int(per_day.get(d, 0)) for d in day_keys},
+            'mean_duration_seconds': round(total_sum / total_count, 2) if total_count else None,
+            'mean_duration_by_type': {
+                k: round(float(duration_sum.get(k, 0)) / int(c), 2)
+                for k, c in duration_count.items() if int(c)
+            },
+        }
+
+    def list_by_scan_type(self, scan_type: str, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """Scans of one type, newest first"""
+        return self._page(self._key('scans', 'type', scan_type), limit, offset)
+
+    def list_by_target(self, target: str, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """Scans against one target, newest first"""
+        return self._page(self._key('scans', 'target', target), limit, offset)
+
+    def _completed_index(self, kind: str, value: str) -> str:
+        """
+        Key of the completed-only index for one scan type/target. Scans that
+        finished before these indexes existed are folded in once, from the
+        intersection of the completed set with the type/target index.
+        """
+        key = self._key('scans', 'completed', kind, value)
+        built = self._key('scans', 'completed', 'indexed')
+        if not self.client.sismember(built, key):
+            pipe = self.client.pipeline(transaction=True)
+            # Weight 0 keeps the completion time as the score
+            pipe.zinterstore(key, {self._key('scans', 'completed'): 1, self._key('scans', kind, value): 0})
+            pipe.sadd(built, key)
+            pipe.execute()
+        return key
+
+    def list_completed_by_scan_type(self, scan_type: str, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """Completed/failed scans of one type, newest first"""
+        return self._page(self._completed_index('type', scan_type), limit, offset)
+
+    def list_completed_by_target(self, target: str, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """Completed/failed scans against one target, newest first"""
+        return self._page(self._completed_index('target', target), limit, offset)
+
+
+_registry: Optional[ScanRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ScanRegistry:
+    """Return the process-wide ScanRegistry, creating it on first use"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ScanRegistry()
+    return _registry
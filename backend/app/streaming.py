@@ -0,0 +1,162 @@
+"""
+Streaming response helpers for PTaaS
+"""
+import asyncio
+import json
+import os
+from email.utils import format_datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import httpx
+from botocore.exceptions import ClientError
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from .integrations.storage import decode_chunks, object_codec
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+# Bytes per chunk when relaying raw scan files
+RAW_CHUNK_SIZE = int(os.getenv('RAW_STREAM_CHUNK_SIZE', str(256 * 1024)))
+# Upstream headers forwarded on proxied file downloads
+_FILE_HEADERS = ('content-type', 'content-length', 'content-range', 'content-encoding',
+                 'accept-ranges', 'etag', 'last-modified')
+
+
+async def json_array_stream(pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """Serialize pages of items as one JSON array without holding them all"""
+    yield b'['
+    first = True
+    async for page in pages:
+        for item in page:
+            yield (b'' if first else b',') + json.dumps(item).encode('utf-8')
+            first = False
+    yield b']'
+
+
+async def ndjson_stream(pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """Serialize pages of items as newline-delimited JSON"""
+    async for page in pages:
+        yield b''.join(json.dumps(item).encode('utf-8') + b'\n' for item in page)
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get('accept', '')
+
+
+def stream_collection(request: Request, pages: AsyncIterator[List[Dict[str, Any]]]) -> StreamingResponse:
+    """Stream a paginated collection as NDJSON (if accepted) or a JSON array"""
+    if wants_ndjson(request):
+        return StreamingResponse(ndjson_stream(pages), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(json_array_stream(pages), media_type='application/json')
+
+
+def conditional_headers(request: Request) -> Dict[str, str]:
+    """Range / If-None-Match headers worth forwarding upstream"""
+    return {k: request.headers[k] for k in ('range', 'if-none-match') if k in request.headers}
+
+
+def _attachment(filename: Optional[str]) -> Dict[str, str]:
+    return {'Content-Disposition': f'attachment; filename="{filename}"'} if filename else {}
+
+
+def accepts_encoding(request: Request, coding: str) -> bool:
+    """Whether the client's Accept-Encoding allows `coding` (q=0 excludes it)"""
+    accepted = {}
+    for item in request.headers.get('accept-encoding', '').split(','):
+        name, _, params = item.strip().partition(';')
+        q = params.strip()[2:] if params.strip().startswith('q=') else '1'
+        try:
+            accepted[name.strip().lower()] = float(q) > 0
+        except ValueError:
+            accepted[name.strip().lower()] = False
+    return accepted.get(coding, accepted.get('*', False))
+
+
+def _iter_body(body, chunk_size: int, codec: Optional[str] = None) -> Iterator[bytes]:
+    try:
+        for chunk in decode_chunks(body.iter_chunks(chunk_size), codec):
+            yield chunk
+    finally:
+        body.close()
+
+
+async def storage_object_response(
+    request: Request,
+    storage,
+    key: str,
+    filename: Optional[str] = None,
+    media_type: Optional[str] = None
+) -> Response:
+    """
+    Stream an object from MinIO/S3 chunk by chunk, honouring Range and
+    If-None-Match so partial and resumed downloads work
+    
+    Compressed objects are sent as stored (Content-Encoding) to clients that
+    accept the codec, and decompressed on the fly for the others; decoded
+    responses carry a weak ETag and ignore Range.
+    """
+    headers = conditional_headers(request)
+    if headers.get('if-none-match', '').startswith('W/'):
+        headers['if-none-match'] = headers['if-none-match'][2:]
+    try:
+        if headers.get('range'):
+            # Ranges address the stored bytes: a response that will be decoded
+            # is sent whole, so don't let S3 apply (or reject) the range
+            codec = object_codec(await asyncio.to_thread(storage.head, key))
+            if codec and not accepts_encoding(request, codec):
+                del headers['range']
+        obj = await asyncio.to_thread(storage.open, key, headers.get('range'), headers.get('if-none-match'))
+        codec = object_codec(obj)
+    except ClientError as e:
+        status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        if status == 304:
+            return Response(status_code=304, headers={'ETag': request.headers['if-none-match']})
+        if status == 416:
+            meta = await asyncio.to_thread(storage.head, key)
+            size = meta['ContentLength'] if meta else '*'
+            return Response(status_code=416, headers={'Content-Range': f'bytes */{size}'})
+        if status == 404:
+            raise HTTPException(status_code=404, detail="Raw file not found in storage")
+        raise HTTPException(status_code=502, detail=f"S3 error: {str(e)}")
+
+    decode = codec if codec and not accepts_encoding(request, codec) else None
+    if decode:
+        # Decoded size is unknown up front: no Content-Length, no ranges
+        response_headers = {'Accept-Ranges': 'none'}
+    else:
+        response_headers = {'Accept-Ranges': 'bytes', 'Content-Length': str(obj['ContentLength'])}
+    if codec:
+        response_headers['Vary'] = 'Accept-Encoding'
+        if not decode:
+            response_headers['Content-Encoding'] = codec
+    if obj.get('ETag'):
+        response_headers['ETag'] = f"W/{obj['ETag']}" if decode else obj['ETag']
+    if obj.get('LastModified'):
+        response_headers['Last-Modified'] = format_datetime(obj['LastModified'], usegmt=True)
+    if obj.get('ContentRange'):
+        response_headers['Content-Range'] = obj['ContentRange']
+    response_headers.update(_attachment(filename))
+
+    return StreamingResponse(
+        _iter_body(obj['Body'], RAW_CHUNK_SIZE, decode),
+        status_code=206 if obj.get('ContentRange') else 200,
+        media_type=media_type or obj.get('ContentType'),
+        headers=response_headers
+    )
+
+
+def upstream_file_response(upstream: httpx.Response, filename: Optional[str] = None) -> Response:
+    """Relay an open (stream=True) httpx response without buffering it"""
+    headers = {k: upstream.headers[k] for k in _FILE_HEADERS if k in upstream.headers}
+    headers.update(_attachment(filename))
+    media_type = headers.pop('content-type', 'application/octet-stream')
+    if upstream.status_code == 304:
+        return Response(status_code=304, headers=headers, background=BackgroundTask(upstream.aclose))
+    return StreamingResponse(
+        upstream.aiter_raw(RAW_CHUNK_SIZE),
+        status_code=upstream.status_code,
+        media_type=media_type,
+        headers=headers,
+        background=BackgroundTask(upstream.aclose)
+    )
@@ -0,0 +1,96 @@
+"""
+Batched Celery task state lookup for PTaaS
+
+AsyncResult.state / .info each hit the result backend separately, and do so
+again on every access while a task is still running. These helpers read the
+raw task metadata for many task IDs with one MGET per chunk and decode it
+locally.
+"""
+import os
+from typing import Any, Dict, Iterable, List
+
+from .celery_app import celery_app
+
+# Keys per MGET round-trip
+STATUS_BATCH_CHUNK = int(os.getenv('STATUS_BATCH_CHUNK', '500'))
+
+
+def fetch_task_meta(task_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Return {task_id: celery meta dict} using pipelined MGETs against the result backend"""
+    backend = celery_app.backend
+    task_ids = list(dict.fromkeys(task_ids))
+    metas: Dict[str, Dict[str, Any]] = {}
+
+    for start in range(0, len(task_ids), STATUS_BATCH_CHUNK):
+        chunk = task_ids[start:start + STATUS_BATCH_CHUNK]
+        keys = [backend.get_key_for_task(task_id) for task_id in chunk]
+        for task_id, raw in zip(chunk, backend.mget(keys)):
+            if raw is None:
+                metas[task_id] = {'status': 'PENDING', 'result': None}
+                continue
+            try:
+                metas[task_id] = backend.decode_result(raw)
+            except Exception as e:
+                print(f"[TaskStates] Could not decode meta for {task_id}: {e}")
+                metas[task_id] = {'status': 'PENDING', 'result': None}
+    return metas
+
+
+def describe_task(task_id: str, meta: Dict[str, Any], include_result: bool = True) -> Dict[str, Any]:
+    """Build the /scan/status response body from raw task metadata"""
+    state = meta.get('status', 'PENDING')
+    info = meta.get('result')
+
+    if state == 'PENDING':
+        return {
+            'task_id': task_id,
+            'state': state,
+            'status': 'Task is waiting in queue...'
+        }
+    if state == 'STARTED':
+        return {
+            'task_id': task_id,
+            'state': state,
+            'status': 'Task is currently running...',
+            'progress': info.get('progress', 0) if isinstance(info, dict) else 0
+        }
+    if state == 'SUCCESS':
+        response = {
+            'task_id': task_id,
+            'state': state,
+            'status': 'Task completed successfully'
+        }
+        if include_result:
+            response['result'] = info
+        return response
+    if state == 'FAILURE':
+        error = _format_exception(info)
+        return {
+            'task_id': task_id,
+            'state': state,
+            'status': error,
+            'error': error
+        }
+    return {
+        'task_id': task_id,
+        'state': state,
+        'status': str(info)
+    }
+
+
+def _format_exception(info: Any) -> str:
+    if isinstance(info, dict) and 'exc_message' in info:
+        message = info.get('exc_message')
+        if isinstance(message, (list, tuple)):
+            message = ' '.join(str(m) for m in message)
+        return str(message)
+    return str(info)
+
+
+def get_task_states(task_ids: List[str], include_result: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Compact {task_id: status} map for many tasks"""
+    metas = fetch_task_meta(task_ids)
+    return {
+        task_id: describe_task(task_id, meta, include_result=include_result)
+        for task_id, meta in metas.items()
+    }
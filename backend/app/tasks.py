@@ -1,227 +1,557 @@
 """
 Celery tasks for PTaaS scanners
 """
-from celery import Task
+from celery import Task, chain, chord, uuid
 from .celery_app import celery_app
 import docker
-import requests
+import httpx
 import time
 import os
-from .integrations.storage import StorageClient
-from .integrations.defectdojo import DefectDojoClient
+import tempfile
+import json
+import xml.etree.ElementTree as ET
+from .integrations.storage import IDENTITY, get_storage_client, build_object_key
+from .integrations.defectdojo import get_dojo_client
+from .integrations.containers import get_docker_client, exec_stream
+from .integrations.zap import get_zap_pool, write_zap_report
+from .registry import get_registry, TERMINAL_STATES
+from .events import publish_scan_event
+from .progress import ProgressThrottle, NmapProgressParser, SqlmapProgressParser
+from .sharding import shard_targets, merge_nmap_xml
+from .parsers.sqlmap import SqlmapResultParser
+from .parsers.nmap import HOSTS_FILENAME, NmapTaskFilter, iter_nmap_hosts, write_hosts_jsonl, import_digest
+from .parsers.zap import ALERTS_FILENAME, tee_alert_records
+from .parsers.jsonl import read_jsonl, unordered_digest
+from .diffing import ARTIFACT_FIELDS, DIFF_FILENAME, diff_artifacts
+from .leases import LeasePool
+
+SQLMAP_CONTAINERS = [
+    c.strip() for c in os.getenv('SQLMAP_CONTAINERS', os.getenv('SQLMAP_CONTAINER', 'ptaas-sqlmap')).split(',') if c.strip()
+]
+# Concurrent scans allowed per scanner container (0 = unlimited)
+MAX_SCANS_PER_CONTAINER = {
+    'nmap': int(os.getenv('NMAP_MAX_SCANS_PER_CONTAINER', '4')),
+    'sqlmap': int(os.getenv('SQLMAP_MAX_SCANS_PER_CONTAINER', '2')),
+}
+# Interval for Nmap's in-stream progress reports (--stats-every)
+NMAP_STATS_EVERY = os.getenv('NMAP_STATS_EVERY', '5s')
+# Nmap containers sharded scans are spread across (defaults to NMAP_CONTAINER)
+NMAP_CONTAINERS = [
+    c.strip() for c in os.getenv('NMAP_CONTAINERS', os.getenv('NMAP_CONTAINER', 'ptaas-nmap')).split(',') if c.strip()
+]
+# Scanner output beyond this many bytes is spooled to disk instead of memory
+SPOOL_MAX_MEMORY = int(os.getenv('SCAN_SPOOL_MAX_MEMORY', str(8 * 1024 * 1024)))
+# DefectDojo import stage: retries with exponential backoff (seconds, jittered)
+IMPORT_MAX_RETRIES = int(os.getenv('IMPORT_MAX_RETRIES', '5'))
+IMPORT_RETRY_BACKOFF = int(os.getenv('IMPORT_RETRY_BACKOFF', '30'))
+IMPORT_RETRY_BACKOFF_MAX = int(os.getenv('IMPORT_RETRY_BACKOFF_MAX', '600'))
+
+
+def _spool():
+    """Temporary file holding one scan's raw output"""
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+
+
+_container_pools = {}
+
+
+def container_pool(scanner: str) -> LeasePool:
+    """
+    Slots on the scanner's containers shared by all workers; a scan holds a
+    lease on the least busy container while its exec runs
+    """
+    pool = _container_pools.get(scanner)
+    if pool is None:
+        registry = get_registry()
+        pool = _container_pools[scanner] = LeasePool(
+            registry.client,
+            prefix=f"{registry.prefix}:containers:{scanner}",
+            members=NMAP_CONTAINERS if scanner == 'nmap' else SQLMAP_CONTAINERS,
+            limit=MAX_SCANS_PER_CONTAINER[scanner],
+            # Outlives the hard time limit, so a lease never expires under a running scan
+            ttl=celery_app.conf.task_time_limit + 60,
+            timeout=float(os.getenv('CONTAINER_LEASE_TIMEOUT', '1800'))
+        )
+    return pool
+
+
+def priority_options(priority=None):
+    """
+    apply_async options for an API priority (0-9, higher = more urgent)
+    The Redis broker serves priority 0 first, so the scale is inverted
+    """
+    return {} if priority is None else {'priority': 9 - priority}
+
+class DojoUnavailable(Exception):
+    """DefectDojo answered an import with a transient error (5xx / 429)"""
 
-# Initialize clients
-docker_client = docker.from_env()
-storage_client = StorageClient()
-dojo_client = DefectDojoClient()
 
 class ScanTask(Task):
     """Base task with common functionality"""
     
+    def before_start(self, task_id, args, kwargs):
+        """
+        Remember when the worker picked the task up (for scan duration stats)
+        Kept if already set, e.g. by the first shard of a sharded job or a retried run
+        """
+        try:
+            get_registry().setdefault(task_id, 'started_ts', time.time())
+        except Exception as e:
+            print(f'Task {task_id}: could not update scan registry: {e}')
+
     def on_failure(self, exc, task_id, args, kwargs, einfo):
         """Handle task failure"""
         print(f'Task {task_id} failed: {exc}')
+        self._record(task_id, 'FAILURE')
     
     def on_success(self, retval, task_id, args, kwargs):
         """Handle task success"""
         print(f'Task {task_id} completed successfully')
+        self._record(task_id, 'SUCCESS', retval)
+
+    def update_state(self, task_id=None, state=None, meta=None, **kwargs):
+        """Store state in the result backend and push it to live progress subscribers"""
+        super().update_state(task_id=task_id, state=state, meta=meta, **kwargs)
+        task_id = task_id or self.request.id
+        try:
+            publish_scan_event(task_id, state, meta, **self._event_context())
+        except Exception as e:
+            print(f'Task {task_id}: could not publish progress event: {e}')
+
+    def _event_context(self):
+        """scan_type/target attached to every published event"""
+        kwargs = self.request.kwargs or {}
+        return {
+            'scan_type': kwargs.get('scanner') or getattr(self, 'scanner', None) or self.name.rsplit('scan_with_', 1)[-1],
+            'target': kwargs.get('target') or kwargs.get('target_url'),
+        }
+
+    def store_raw(self, content, filename, content_type, target):
+        """
+        Upload a raw scan artifact under a partitioned key and record the
+        task_id -> object key mapping (and content digest) in the scan registry
+        """
+        task_id = self.request.id
+        scan_type = self._event_context()['scan_type']
+        object_key = build_object_key(scan_type, task_id, filename)
+        storage = get_storage_client()
+        sha256 = storage.digest(content)
+        storage_url = storage.upload(
+            content, object_key, content_type=content_type,
+            metadata={'task-id': task_id, 'scan-type': scan_type, 'target': target},
+            sha256=sha256
+        )
+        try:
+            get_registry().update(task_id, object_key=object_key, storage_url=storage_url, content_sha256=sha256)
+        except Exception as e:
+            print(f'Task {task_id}: could not update scan registry: {e}')
+        return object_key, storage_url
+
+    def store_artifact(self, content, object_key, filename, content_type, field):
+        """
+        Upload a derived artifact next to the raw object `object_key` and
+        record its key in the registry under `field`
+        """
+        task_id = self.request.id
+        key = f"{object_key.rsplit('/', 1)[0]}/{filename}"
+        get_storage_client().upload(
+            content, key, content_type=content_type,
+            metadata={'task-id': task_id, 'scan-type': self._event_context()['scan_type']}
+        )
+        try:
+            get_registry().update(task_id, **{field: key})
+        except Exception as e:
+            print(f'Task {task_id}: could not update scan registry: {e}')
+        return key
+
+    def hand_off_import(self, result, dojo_scan_type, engagement_name, content=None):
+        """
+        End the scan stage by replacing this task with import_scan_results on
+        the import queue. The import task keeps this task's id, so clients and
+        the registry still see a single job, while this worker slot is free
+        for the next scan as soon as the raw output is stored.
+        """
+        self.update_state(state='STARTED', meta={'progress': 85, 'status': 'Queued for DefectDojo import...'})
+        sig = import_scan_results.s(
+            result,
+            scanner=self._event_context()['scan_type'],
+            target=result['target'],
+            dojo_scan_type=dojo_scan_type,
+            engagement_name=engagement_name,
+            content=content
+        )
+        priority = (self.request.delivery_info or {}).get('priority')
+        if priority is not None:
+            sig.set(priority=priority)
+        return self.replace(sig)
+
+    def progress_reporter(self, parser):
+        """
+        Output callback for exec_stream: feeds the scanner's output to `parser`
+        and reports the parsed progress through a throttle
+        """
+        throttle = ProgressThrottle(lambda meta: self.update_state(state='STARTED', meta=meta))
+
+        def on_output(chunk):
+            meta = parser.feed(chunk)
+            if meta:
+                throttle.update(meta)
+
+        on_output.flush = throttle.flush
+        return on_output
+
+    def _record(self, task_id, state, result=None):
+        """Persist the terminal state in the shared scan registry"""
+        try:
+            dojo = result.get('dojo_import') if isinstance(result, dict) else None
+            imported = bool(dojo) and not (isinstance(dojo, dict) and dojo.get('skipped'))
+            publish_scan_event(task_id, state, {
+                'progress': 100 if state == 'SUCCESS' else 0,
+                'status': 'Completed' if state == 'SUCCESS' else 'Failed'
+            }, dojo_import=imported, **self._event_context())
+            get_registry().mark_finished(task_id, state, result)
+        except Exception as e:
+            print(f'Task {task_id}: could not update scan registry: {e}')
 
 @celery_app.task(base=ScanTask, bind=True, name='app.tasks.scan_with_nmap')
-def scan_with_nmap(self, target: str, options: str = "-sV -sC"):
+def scan_with_nmap(self, target: str, options: str = "-sV -sC", engagement_name: str = None):
     """
     Execute Nmap scan in container and upload results
     """
     self.update_state(state='STARTED', meta={'progress': 0, 'status': 'Initializing Nmap scan...'})
     
     try:
-        # Get Nmap container
-        container_name = os.getenv('NMAP_CONTAINER', 'ptaas-nmap')
-        
-        self.update_state(state='STARTED', meta={'progress': 20, 'status': f'Scanning {target}...'})
-        
-        # Run Nmap scan (output to XML)
-        container = docker_client.containers.get(container_name)
-        command = f"nmap {options} -oX - {target}"
-        result = container.exec_run(command)
-        
-        if result.exit_code != 0:
-            raise Exception(f"Nmap scan failed: {result.output.decode()}")
-        
-        scan_output = result.output
-        
-        self.update_state(state='STARTED', meta={'progress': 60, 'status': 'Uploading to storage...'})
-        
-        # Upload to MinIO/S3
-        filename = f"nmap_{target.replace('/', '_')}_{int(time.time())}.xml"
-        storage_url = storage_client.upload(scan_output, filename, content_type='application/xml')
-        
-        self.update_state(state='STARTED', meta={'progress': 80, 'status': 'Importing to DefectDojo...'})
+        stats = '' if '--stats-every' in options else f' --stats-every {NMAP_STATS_EVERY}'
+        command = f"nmap {options}{stats} -oX - {target}"
+        
+        with _spool() as scan_output:
+            # Run Nmap scan (output to XML) on the least busy Nmap container
+            with container_pool('nmap').lease(self.request.id) as (container_name, _):
+                self.update_state(state='STARTED', meta={'progress': 20, 'status': f'Scanning {target}...'})
+                
+                container = get_docker_client().containers.get(container_name)
+                reporter = self.progress_reporter(NmapProgressParser(start=20, end=60))
+                # Progress is parsed from the raw stream; the stored report leaves it out
+                report = NmapTaskFilter(scan_output)
+                exit_code, stderr = exec_stream(container, command, report, on_output=reporter)
+                report.flush()
+                reporter.flush()
+            
+            if exit_code != 0:
+                raise Exception(f"Nmap scan failed: {stderr.decode(errors='ignore')}")
+            
+            result = _store_nmap_report(self, scan_output, target)
         
-        # Import to DefectDojo
-        dojo_result = dojo_client.import_scan(
-            file_content=scan_output,
-            filename=filename,
-            scan_type="Nmap Scan",
-            engagement_name=f"Nmap Scan - {target}",
-            product_name=os.getenv('PRODUCT_NAME', 'PTaaS Lab Project')
+    except Exception as e:
+        self.update_state(state='FAILURE', meta={'error': str(e)})
+        raise
+    
+    return self.hand_off_import(result, "Nmap Scan", engagement_name or f"Nmap Scan - {target}")
+
+
+def _store_nmap_report(task, scan_output, target, **result):
+    """Upload a finished Nmap XML report; returns the scan result for the import stage"""
+    task.update_state(state='STARTED', meta={'progress': 60, 'status': 'Uploading to storage...'})
+    
+    # Upload to MinIO/S3
+    filename = f"nmap_{target.replace('/', '_').replace(' ', '_')}_{int(time.time())}.xml"
+    scan_output.seek(0)
+    object_key, storage_url = task.store_raw(scan_output, filename, 'application/xml', target)
+    
+    task.update_state(state='STARTED', meta={'progress': 75, 'status': 'Normalizing host data...'})
+    
+    # Compact host/port records stored next to the raw report (see /scan/{task_id}/hosts)
+    scan_output.seek(0)
+    try:
+        with _spool() as hosts_output:
+            hosts, open_ports = write_hosts_jsonl(iter_nmap_hosts(scan_output), hosts_output)
+            hosts_output.seek(0)
+            # What DefectDojo would import (including NSE output), independent of
+            # report timestamps and host order
+            import_sha256 = import_digest(read_jsonl(hosts_output))
+            hosts_output.seek(0)
+            result.update(
+                hosts_key=task.store_artifact(hosts_output, object_key, HOSTS_FILENAME, 'application/x-ndjson', 'hosts_key'),
+                hosts_up=hosts,
+                open_ports=open_ports,
+                import_sha256=import_sha256
+            )
+    except ET.ParseError as e:
+        print(f"[Nmap] Could not parse report for {task.request.id}: {e}")
+    
+    return {
+        'status': 'success',
+        'target': target,
+        'storage_url': storage_url,
+        'object_key': object_key,
+        'filename': filename,
+        **result
+    }
+
+
+
+def start_sharded_nmap(target: str, options: str, shard_size: int, parallelism: int, priority: int = None, register=None):
+    """
+    Fan a large Nmap scan out as a chord: `parallelism` lanes of shard tasks
+    (each lane a chain, so at most `parallelism` shards run at once) followed
+    by merge_nmap_shards, whose task id is the job id returned to the client
+    `register(task_id, shards)` is called before anything is queued, so the job
+    is tracked before a worker can report on it
+
+    Returns:
+        (task_id, number of shards)
+    """
+    shards = shard_targets(target, shard_size)
+    parent_id = uuid()
+    lanes = []
+    for lane in range(min(max(1, parallelism), len(shards))):
+        steps = [
+            scan_nmap_shard.s(
+                parent_id=parent_id, index=i, total=len(shards),
+                targets=shards[i], options=options, scan_target=target
+            ).set(**priority_options(priority))
+            for i in range(lane, len(shards), parallelism)
+        ]
+        lanes.append(chain(*steps))
+    
+    merge = merge_nmap_shards.s(target=target, options=options).set(task_id=parent_id, **priority_options(priority))
+    # A failed shard means the merge never runs; the errback finalizes the job instead
+    merge.on_error(fail_sharded_nmap.si(parent_id=parent_id, target=target))
+    if register is not None:
+        register(parent_id, len(shards))
+    chord(lanes)(merge)
+    return parent_id, len(shards)
+
+
+@celery_app.task(name='app.tasks.fail_sharded_nmap', ignore_result=True)
+def fail_sharded_nmap(*, parent_id: str, target: str):
+    """
+    Errback of a sharded Nmap chord: record the job as failed in the registry
+    and on the progress stream, as ScanTask does for a failing scan
+    """
+    registry = get_registry()
+    entry = registry.get(parent_id) or {}
+    if entry.get('state') in TERMINAL_STATES:
+        # The merge itself failed and ScanTask already recorded it
+        return
+    try:
+        publish_scan_event(parent_id, 'FAILURE', {'progress': 0, 'status': 'Failed'},
+                           dojo_import=False, scan_type='nmap', target=target)
+    except Exception as e:
+        print(f'Task {parent_id}: could not publish progress event: {e}')
+    registry.mark_finished(parent_id, 'FAILURE')
+
+
+@celery_app.task(bind=True, name='app.tasks.scan_nmap_shard')
+def scan_nmap_shard(self, previous=None, *, parent_id: str, index: int, total: int, targets: str, options: str, scan_target: str):
+    """
+    Scan one shard of a sharded Nmap job and upload its XML
+    `previous` holds the shard object keys produced earlier in the same lane
+    (passed in by the chain; None for the first shard of a lane)
+    """
+    command = f"nmap {options} -oX - {targets}"
+    registry = get_registry()
+    try:
+        # The job's duration runs from the first shard, not from the merge
+        registry.setdefault(parent_id, 'started_ts', time.time())
+    except Exception as e:
+        print(f'Task {parent_id}: could not update scan registry: {e}')
+    
+    with _spool() as shard_output:
+        with container_pool('nmap').lease(self.request.id) as (container_name, _):
+            container = get_docker_client().containers.get(container_name)
+            exit_code, stderr = exec_stream(container, command, shard_output)
+        if exit_code != 0:
+            raise Exception(f"Nmap shard {index} failed: {stderr.decode(errors='ignore')}")
+        
+        object_key = build_object_key('nmap', parent_id, f"shard-{index:05d}.xml")
+        shard_output.seek(0)
+        # Deleted again after the merge (which parses the stored bytes directly),
+        # so neither content-addressed nor compressed
+        get_storage_client().upload(
+            shard_output, object_key, content_type='application/xml',
+            metadata={'task-id': parent_id, 'scan-type': 'nmap', 'shard': index},
+            content_addressed=False, codec=IDENTITY
         )
-        
-        self.update_state(state='STARTED', meta={'progress': 100, 'status': 'Completed'})
-        
-        return {
-            'status': 'success',
-            'target': target,
-            'storage_url': storage_url,
-            'dojo_import': dojo_result,
-            'filename': filename
-        }
-        
+    
+    # Report fan-out progress on the parent job
+    done = registry.increment(parent_id, 'shards_done')
+    meta = {'progress': round(5 + 50 * done / total, 1), 'status': f'Nmap shards: {done}/{total} done'}
+    self.update_state(task_id=parent_id, state='STARTED', meta=meta)
+    try:
+        publish_scan_event(parent_id, 'STARTED', meta, scan_type='nmap', target=scan_target)
+    except Exception as e:
+        print(f'Task {parent_id}: could not publish progress event: {e}')
+    
+    return list(previous or []) + [object_key]
+
+
+@celery_app.task(base=ScanTask, bind=True, name='app.tasks.merge_nmap_shards', scanner='nmap')
+def merge_nmap_shards(self, lanes, target: str, options: str):
+    """
+    Merge the shard reports of a sharded Nmap job into one XML document,
+    then upload it and hand over to the import stage like a regular Nmap scan
+    """
+    keys = sorted(key for lane in lanes for key in lane)
+    storage = get_storage_client()
+    
+    self.update_state(state='STARTED', meta={'progress': 55, 'status': f'Merging {len(keys)} shard reports...'})
+    
+    def shard_reports():
+        for key in keys:
+            body = storage.open(key)['Body']
+            try:
+                yield body
+            finally:
+                body.close()
+    
+    try:
+        with _spool() as scan_output:
+            hosts = merge_nmap_xml(shard_reports(), scan_output, args=f"nmap {options} {target}")
+            result = _store_nmap_report(self, scan_output, target, shards=len(keys), hosts=hosts)
     except Exception as e:
         self.update_state(state='FAILURE', meta={'error': str(e)})
         raise
+    
+    for key in keys:
+        storage.delete(key)
+    return self.hand_off_import(result, "Nmap Scan", f"Nmap Scan - {target}")
 
 @celery_app.task(base=ScanTask, bind=True, name='app.tasks.scan_with_zap')
-def scan_with_zap(self, target_url: str, scan_type: str = "active"):
+def scan_with_zap(self, target_url: str, scan_type: str = "active", engagement_name: str = None):
     """
     Execute OWASP ZAP scan and upload results
-    ZAP Container must be running with API enabled
+    A ZAP daemon is leased from the pool; the scan runs in its own context
     """
     self.update_state(state='STARTED', meta={'progress': 0, 'status': 'Initializing ZAP scan...'})
     
     try:
-        zap_base_url = os.getenv('ZAP_URL', 'http://zap:8080')
-        zap_api_key = os.getenv('ZAP_API_KEY', 'changeme')
-        
-        # ZAP API endpoints
-        def zap_api(endpoint):
-            url = f"{zap_base_url}/{endpoint}"
-            if '?' in url:
-                url += f"&apikey={zap_api_key}"
-            else:
-                url += f"?apikey={zap_api_key}"
-            return url
-        
-        self.update_state(state='STARTED', meta={'progress': 10, 'status': f'Accessing URL: {target_url}'})
-        
-        # 1. Access the target URL (Spider)
-        requests.get(zap_api(f"JSON/core/action/accessUrl/?url={target_url}"))
-        time.sleep(2)
-        
-        # 2. Start Spider scan
-        spider_response = requests.get(zap_api(f"JSON/spider/action/scan/?url={target_url}"))
-        spider_id = spider_response.json().get('scan')
-        
-        self.update_state(state='STARTED', meta={'progress': 20, 'status': 'Spidering website...'})
-        
-        # Wait for spider to complete
-        while True:
-            spider_status = requests.get(zap_api(f"JSON/spider/view/status/?scanId={spider_id}"))
-            progress = int(spider_status.json().get('status', 0))
-            self.update_state(state='STARTED', meta={'progress': 20 + (progress * 0.3), 'status': f'Spider: {progress}%'})
-            if progress >= 100:
-                break
-            time.sleep(3)
-        
-        # 3. Start Active Scan (if requested)
-        if scan_type.lower() == "active":
-            self.update_state(state='STARTED', meta={'progress': 50, 'status': 'Starting active scan...'})
+        pool = get_zap_pool()
+        with _spool() as scan_output, _spool() as alerts_output:
+            with pool.lease(lease_id=self.request.id) as (zap, lease_id):
+                context_name = f"ptaas-{self.request.id}"
+                context_id = zap.new_context(context_name, target_url)
+                try:
+                    self.update_state(state='STARTED', meta={'progress': 10, 'status': f'Accessing URL: {target_url}'})
+                    
+                    # 1. Access the target URL (returns once ZAP has fetched it)
+                    zap.access_url(target_url)
+                    
+                    # 2. Start Spider scan (limited to this scan's context)
+                    spider_id = zap.spider(target_url, context_name)
+                    
+                    self.update_state(state='STARTED', meta={'progress': 20, 'status': 'Spidering website...'})
+                    
+                    throttle = ProgressThrottle(lambda meta: self.update_state(state='STARTED', meta=meta))
+                    heartbeat = lambda: pool.refresh(zap.base_url, lease_id)
+                    
+                    # Wait for spider to complete
+                    zap.wait(
+                        lambda: zap.spider_status(spider_id),
+                        lambda p: throttle.update({'progress': 20 + (p * 0.3), 'status': f'Spider: {p}%'}, force=p >= 100),
+                        heartbeat
+                    )
+                    message_ids = zap.spider_message_ids(spider_id)
+                    
+                    # 3. Start Active Scan (if requested)
+                    if scan_type.lower() == "active":
+                        self.update_state(state='STARTED', meta={'progress': 50, 'status': 'Starting active scan...'})
+                        
+                        ascan_id = zap.active_scan(target_url, context_id)
+                        
+                        # Wait for active scan to complete
+                        zap.wait(
+                            lambda: zap.active_scan_status(ascan_id),
+                            lambda p: throttle.update({'progress': 50 + (p * 0.3), 'status': f'Active Scan: {p}%'}, force=p >= 100),
+                            heartbeat
+                        )
+                        message_ids |= zap.active_scan_message_ids(ascan_id)
+                    
+                    self.update_state(state='STARTED', meta={'progress': 80, 'status': 'Generating report...'})
+                    
+                    # 4. Build this scan's XML report from its own alerts (DefectDojo expects ZAP XML),
+                    #    plus compact per-alert records for run-to-run diffs
+                    write_zap_report(
+                        tee_alert_records(zap.iter_alerts(target_url, message_ids), alerts_output),
+                        scan_output, version=zap.version()
+                    )
+                finally:
+                    zap.remove_context(context_name)
             
-            ascan_response = requests.get(zap_api(f"JSON/ascan/action/scan/?url={target_url}"))
-            ascan_id = ascan_response.json().get('scan')
+            self.update_state(state='STARTED', meta={'progress': 85, 'status': 'Uploading to storage...'})
             
-            # Wait for active scan to complete
-            while True:
-                ascan_status = requests.get(zap_api(f"JSON/ascan/view/status/?scanId={ascan_id}"))
-                progress = int(ascan_status.json().get('status', 0))
-                self.update_state(state='STARTED', meta={'progress': 50 + (progress * 0.3), 'status': f'Active Scan: {progress}%'})
-                if progress >= 100:
-                    break
-                time.sleep(5)
-        
-        self.update_state(state='STARTED', meta={'progress': 80, 'status': 'Generating report...'})
-        
-        # 4. Get XML report (DefectDojo expects ZAP XML)
-        report_response = requests.get(zap_api("OTHER/core/other/xmlreport/"))
-        scan_output = report_response.content
-        
-        self.update_state(state='STARTED', meta={'progress': 85, 'status': 'Uploading to storage...'})
-        
-        # Upload to MinIO/S3
-        filename = f"zap_{target_url.replace('://', '_').replace('/', '_')}_{int(time.time())}.xml"
-        storage_url = storage_client.upload(scan_output, filename, content_type='application/xml')
-        
-        self.update_state(state='STARTED', meta={'progress': 90, 'status': 'Importing to DefectDojo...'})
-        
-        # Import to DefectDojo
-        dojo_result = dojo_client.import_scan(
-            file_content=scan_output,
-            filename=filename,
-            scan_type="ZAP Scan",
-            engagement_name=f"ZAP {scan_type.title()} Scan - {target_url}",
-            product_name=os.getenv('PRODUCT_NAME', 'PTaaS Lab Project')
-        )
-        
-        self.update_state(state='STARTED', meta={'progress': 100, 'status': 'Completed'})
-        
-        return {
+            # Upload to MinIO/S3
+            filename = f"zap_{target_url.replace('://', '_').replace('/', '_')}_{int(time.time())}.xml"
+            scan_output.seek(0)
+            object_key, storage_url = self.store_raw(scan_output, filename, 'application/xml', target_url)
+            alerts_output.seek(0)
+            import_sha256 = unordered_digest(alerts_output)
+            alerts_output.seek(0)
+            alerts_key = self.store_artifact(
+                alerts_output, object_key, ALERTS_FILENAME, 'application/x-ndjson', 'alerts_key'
+            )
+        
+        result = {
             'status': 'success',
             'target': target_url,
             'scan_type': scan_type,
             'storage_url': storage_url,
-            'dojo_import': dojo_result,
+            'object_key': object_key,
+            'alerts_key': alerts_key,
+            'import_sha256': import_sha256,
             'filename': filename
         }
         
     except Exception as e:
         self.update_state(state='FAILURE', meta={'error': str(e)})
         raise
+    
+    return self.hand_off_import(
+        result, "ZAP Scan", engagement_name or f"ZAP {scan_type.title()} Scan - {target_url}"
+    )
 
 @celery_app.task(base=ScanTask, bind=True, name='app.tasks.scan_with_sqlmap')
-def scan_with_sqlmap(self, target_url: str, options: str = "--batch --level=1 --risk=1"):
+def scan_with_sqlmap(self, target_url: str, options: str = "--batch --level=1 --risk=1", engagement_name: str = None):
     """
     Execute SQLMap scan in container and upload results
     """
     self.update_state(state='STARTED', meta={'progress': 0, 'status': 'Initializing SQLMap scan...'})
     
+    container_name = None
     try:
-        # Get SQLMap container
-        container_name = os.getenv('SQLMAP_CONTAINER', 'ptaas-sqlmap')
-        
-        self.update_state(state='STARTED', meta={'progress': 20, 'status': f'Scanning {target_url}...'})
-        
-        # Run SQLMap - output to log file
-        container = docker_client.containers.get(container_name)
         output_dir = f"/tmp/sqlmap_{int(time.time())}"
         command = f"python3 /sqlmap/sqlmap.py -u {target_url} {options} --output-dir={output_dir}"
-        result = container.exec_run(command)
-        
-        scan_output = result.output
-        
-        self.update_state(state='STARTED', meta={'progress': 60, 'status': 'Uploading results...'})
         
-        # Upload to MinIO/S3
-        filename = f"sqlmap_{target_url.replace('://', '_').replace('/', '_').replace('?', '_')}_{int(time.time())}.txt"
-        storage_url = storage_client.upload(scan_output, filename, content_type='text/plain')
-        
-        self.update_state(state='STARTED', meta={'progress': 80, 'status': 'Parsing results...'})
-        
-        # Parse SQLMap output for vulnerabilities
-        output_text = scan_output.decode('utf-8', errors='ignore')
-        vulnerabilities_found = 'sqlmap identified the following' in output_text.lower() or 'parameter' in output_text.lower() and 'vulnerable' in output_text.lower()
+        with _spool() as scan_output:
+            # Run SQLMap on the least busy SQLMap container
+            with container_pool('sqlmap').lease(self.request.id) as (container_name, _):
+                self.update_state(state='STARTED', meta={'progress': 20, 'status': f'Scanning {target_url}...'})
+                
+                container = get_docker_client().containers.get(container_name)
+                reporter = self.progress_reporter(SqlmapProgressParser(start=20, end=60))
+                # Results are parsed in the same single pass over the streamed output
+                parser = SqlmapResultParser()
+                
+                def on_output(chunk):
+                    parser.feed(chunk)
+                    reporter(chunk)
+                
+                exec_stream(container, command, scan_output, merge_stderr=True, on_output=on_output)
+                parser.close()
+                reporter.flush()
+            
+            self.update_state(state='STARTED', meta={'progress': 60, 'status': 'Uploading results...'})
+            
+            # Upload to MinIO/S3
+            filename = f"sqlmap_{target_url.replace('://', '_').replace('/', '_').replace('?', '_')}_{int(time.time())}.txt"
+            scan_output.seek(0)
+            object_key, storage_url = self.store_raw(scan_output, filename, 'text/plain', target_url)
         
-        # Create simple JSON for DefectDojo Generic Findings Import
+        # Create JSON for DefectDojo Generic Findings Import: one finding per injectable parameter
         import json
-        findings = []
-        if vulnerabilities_found:
-            # Extract vulnerability info (simplified)
-            findings.append({
-                "title": f"SQLMap Scan Result - {target_url}",
-                "severity": "High",
-                "description": output_text[:2000],  # First 2000 chars
-                "mitigation": "Review SQLMap output and patch SQL injection vulnerabilities",
-                "references": f"Storage: {storage_url}"
-            })
-        else:
+        findings = parser.findings(target_url, references=f"Full report: {storage_url}")
+        vulnerabilities_found = bool(findings)
+        if not findings:
             findings.append({
                 "title": f"SQLMap Scan - No vulnerabilities found",
                 "severity": "Info",
@@ -230,28 +560,24 @@ def scan_with_sqlmap(self, target_url: str, options: str = "--batch --level=1 --
                 "references": f"Full report: {storage_url}"
             })
         
-        findings_json = json.dumps({"findings": findings}).encode('utf-8')
-        
-        self.update_state(state='STARTED', meta={'progress': 90, 'status': 'Importing to DefectDojo...'})
-        
-        # Import to DefectDojo
-        dojo_result = dojo_client.import_scan(
-            file_content=findings_json,
-            filename=f"sqlmap_findings_{int(time.time())}.json",
-            scan_type="Generic Findings Import",
-            engagement_name=f"SQLMap Scan - {target_url}",
-            product_name=os.getenv('PRODUCT_NAME', 'PTaaS Lab Project')
+        findings_json = json.dumps({"findings": findings})
+        # References name this task's report, so they are left out of the comparison
+        import_sha256 = unordered_digest(
+            json.dumps({k: v for k, v in f.items() if k != 'references'}, sort_keys=True).encode('utf-8')
+            for f in findings
         )
         
-        self.update_state(state='STARTED', meta={'progress': 100, 'status': 'Completed'})
-        
-        return {
+        result = {
             'status': 'success',
             'target': target_url,
             'storage_url': storage_url,
-            'dojo_import': dojo_result,
+            'object_key': object_key,
             'filename': filename,
-            'vulnerabilities_found': vulnerabilities_found
+            'findings_filename': f"sqlmap_findings_{int(time.time())}.json",
+            'vulnerabilities_found': vulnerabilities_found,
+            'injectable_parameters': [f"{place}:{name}" for place, name in parser.injectable],
+            'import_sha256': import_sha256,
+            'dbms': parser.dbms
         }
         
     except docker.errors.NotFound:
@@ -259,3 +585,156 @@ def scan_with_sqlmap(self, target_url: str, options: str = "--batch --level=1 --
     except Exception as e:
         self.update_state(state='FAILURE', meta={'error': str(e)})
         raise
+    
+    # The findings JSON is small, so it travels with the message instead of via storage
+    return self.hand_off_import(
+        result, "Generic Findings Import", engagement_name or f"SQLMap Scan - {target_url}",
+        content=findings_json
+    )
+
+
+class ImportTask(ScanTask):
+    """
+    Post-processing stage that takes over a scan task's id
+    DefectDojo outages are retried with exponential backoff. Imports are not
+    idempotent, so only failures where DefectDojo never got the request are
+    retried; a read/write timeout may have created the test and fails the task
+    """
+    autoretry_for = (httpx.ConnectError, httpx.ConnectTimeout, DojoUnavailable)
+    max_retries = IMPORT_MAX_RETRIES
+    retry_backoff = IMPORT_RETRY_BACKOFF
+    retry_backoff_max = IMPORT_RETRY_BACKOFF_MAX
+    retry_jitter = True
+
+    def before_start(self, task_id, args, kwargs):
+        """started_ts belongs to the scan stage; keep it"""
+
+    def on_retry(self, exc, task_id, args, kwargs, einfo):
+        print(f'Task {task_id}: DefectDojo import failed, retrying: {exc}')
+        try:
+            publish_scan_event(task_id, 'RETRY', {
+                'progress': 90, 'status': f'DefectDojo import failed, retrying: {exc}'
+            }, **self._event_context())
+        except Exception as e:
+            print(f'Task {task_id}: could not publish progress event: {e}')
+
+
+@celery_app.task(base=ImportTask, bind=True, name='app.tasks.import_scan_results')
+def import_scan_results(self, result, *, scanner: str, target: str, dojo_scan_type: str,
+                        engagement_name: str, content: str = None):
+    """
+    Import stage: stream a stored scan report into DefectDojo, or `content`
+    when the report was generated from the raw output (SQLMap findings)
+    
+    Results identical to the previous import of the same target and
+    engagement (same import_sha256) skip DefectDojo. Otherwise Nmap/ZAP
+    scans are diffed against that import first: an unchanged result skips
+    DefectDojo too, a changed one is re-imported into the previous test so
+    DefectDojo only adds new findings and closes resolved ones.
+    """
+    self.update_state(state='STARTED', meta={'progress': 90, 'status': 'Importing to DefectDojo...'})
+    
+    registry = get_registry()
+    try:
+        baseline_id = registry.get_baseline(scanner, target, engagement_name)
+        baseline = registry.get(baseline_id) if baseline_id else None
+    except Exception as e:
+        print(f'Task {self.request.id}: could not read scan registry: {e}')
+        baseline_id = baseline = None
+    
+    dojo = get_dojo_client()
+    import_kwargs = dict(
+        scan_type=dojo_scan_type,
+        engagement_name=engagement_name,
+        product_name=os.getenv('PRODUCT_NAME', 'PTaaS Lab Project')
+    )
+    if (baseline and baseline.get('dojo_test_id') and result.get('import_sha256')
+            and baseline.get('import_sha256') == result['import_sha256']):
+        print(f"[DefectDojo] {scanner} results for {target} identical to {baseline_id}, import skipped")
+        result = {**result, 'baseline_task_id': baseline_id}
+        dojo_result = {'skipped': True, 'reason': 'identical to previous import', 'test': baseline['dojo_test_id']}
+    elif content is not None:
+        dojo_result = dojo.import_scan(
+            file_content=content.encode('utf-8'),
+            filename=result.get('findings_filename') or result['filename'],
+            **import_kwargs
+        )
+    else:
+        test_id, diff = _diff_previous_scan(self, result, scanner, baseline_id, baseline)
+        if diff is not None:
+            result = {**result, 'baseline_task_id': diff['baseline_task_id'], 'diff': diff['summary']}
+        
+        if diff is not None and not diff['changed']:
+            print(f"[DefectDojo] {scanner} results for {target} unchanged, import skipped")
+            dojo_result = {'skipped': True, 'reason': 'unchanged since previous scan', 'test': test_id}
+        else:
+            with _spool() as report:
+                get_storage_client().download_to(result['object_key'], report)
+                report.seek(0)
+                if diff is not None:
+                    dojo_result = dojo.reimport_scan(test_id, report, result['filename'], dojo_scan_type)
+                    if 400 <= dojo_result.get('status_code', 0) < 500 and dojo_result['status_code'] != 429:
+                        # e.g. the previous test was deleted in DefectDojo: start a fresh one
+                        report.seek(0)
+                        dojo_result = dojo.import_scan(file_content=report, filename=result['filename'], **import_kwargs)
+                else:
+                    dojo_result = dojo.import_scan(file_content=report, filename=result['filename'], **import_kwargs)
+    
+    status_code = dojo_result.get('status_code', 0) if isinstance(dojo_result, dict) else 0
+    if status_code >= 500 or status_code == 429:
+        raise DojoUnavailable(f"DefectDojo import returned {status_code}")
+    
+    if not status_code:
+        try:
+            registry.update(self.request.id, import_sha256=result.get('import_sha256'))
+            registry.set_baseline(scanner, target, engagement_name, self.request.id)
+        except Exception as e:
+            print(f'Task {self.request.id}: could not update scan registry: {e}')
+    
+    self.update_state(state='STARTED', meta={'progress': 100, 'status': 'Completed'})
+    return {**result, 'dojo_import': dojo_result}
+
+
+def _diff_previous_scan(task, result, scanner, baseline_id, baseline):
+    """
+    Diff this scan's parsed artifact against the previous imported scan of the
+    same target/engagement and store the diff as diff.json next to the raw report
+    
+    Returns:
+        (previous DefectDojo test id, diff), or (None, None) without a usable baseline
+    """
+    field = ARTIFACT_FIELDS.get(scanner)
+    if not field or not result.get(field):
+        return None, None
+    if not baseline or not baseline.get(field) or not baseline.get('dojo_test_id'):
+        return None, None
+    registry = get_registry()
+    try:
+        diff = diff_artifacts(get_storage_client(), scanner, baseline[field], result[field])
+        diff['baseline_task_id'] = baseline_id
+        task.store_artifact(
+            json.dumps(diff).encode('utf-8'), result['object_key'], DIFF_FILENAME, 'application/json', 'diff_key'
+        )
+        registry.update(task.request.id, baseline_task_id=baseline_id)
+    except Exception as e:
+        # A missing or unreadable baseline only costs a full import
+        print(f"Task {task.request.id}: could not diff against previous scan: {e}")
+        return None, None
+    return baseline['dojo_test_id'], diff
+
+
+def scan_signature(scan_type: str, target: str, options: str = None, priority: int = None, **kwargs):
+    """Celery signature for one scan of `target`; options=None keeps the task's default"""
+    if scan_type == 'nmap':
+        sig_kwargs = {'target': target, 'options': options}
+        task = scan_with_nmap
+    elif scan_type == 'zap':
+        sig_kwargs = {'target_url': target, 'scan_type': options}
+        task = scan_with_zap
+    elif scan_type == 'sqlmap':
+        sig_kwargs = {'target_url': target, 'options': options}
+        task = scan_with_sqlmap
+    else:
+        raise ValueError(f"Unknown scan type: {scan_type}")
+    sig_kwargs.update(kwargs)
+    return task.s(**{k: v for k, v in sig_kwargs.items() if v is not None}).set(**priority_options(priority))
@@ -70,6 +70,22 @@ async function getActiveScans() {
     }
 }
 
+/**
+ * Get pre-aggregated dashboard statistics
+ */
+async function getStatsSummary() {
+    try {
+        const response = await fetch(`${BACKEND_URL}/stats/summary`);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        return await response.json();
+    } catch (error) {
+        console.error('Error fetching stats summary:', error);
+        return null;
+    }
+}
+
 /**
  * Get all findings (proxied through backend to avoid CORS)
  */
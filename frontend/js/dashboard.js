@@ -7,38 +7,29 @@
  */
 async function loadDashboard() {
     try {
-        // Load data in parallel
-        const [findings, engagements, activeScans, tests] = await Promise.all([
-            getFindings(1000),
-            getEngagements(100),
-            getActiveScans(),
-            fetch('/api/dojo/tests?limit=1000').then(r => r.json()).catch(() => [])
+        // Aggregates come pre-computed from the backend; only the 10 newest findings are fetched
+        const [summary, findings, activeScans] = await Promise.all([
+            getStatsSummary(),
+            getFindings(10),
+            getActiveScans()
         ]);
 
-        // Calculate stats
-        // Total Scans = number of tests completed (percent_complete = 100)
-        const completedTests = tests.filter(t => t.percent_complete === 100).length;
-        const totalScans = completedTests > 0 ? completedTests : tests.length;
-        
-        // Active Tasks = tests not completed + active scans in progress
-        const incompleteTasks = tests.filter(t => t.percent_complete < 100).length;
-        const activeTasks = incompleteTasks + (activeScans ? activeScans.length : 0);
-        
-        const totalFindings = findings.length;
-        const criticalFindings = findings.filter(f => f.severity === 'Critical').length;
+        const findingStats = (summary && summary.findings) || {};
+        const scanStats = (summary && summary.scans) || {};
+        const bySeverity = findingStats.by_severity || {};
 
         // Update stat cards
-        document.getElementById('totalScans').textContent = totalScans;
-        document.getElementById('activeTasks').textContent = activeTasks;
-        document.getElementById('totalFindings').textContent = totalFindings;
-        document.getElementById('criticalFindings').textContent = criticalFindings;
+        document.getElementById('totalScans').textContent = scanStats.total || 0;
+        document.getElementById('activeTasks').textContent = activeScans ? activeScans.length : (scanStats.active || 0);
+        document.getElementById('totalFindings').textContent = findingStats.total || 0;
+        document.getElementById('criticalFindings').textContent = bySeverity['Critical'] || 0;
 
         // Update recent findings table
         displayRecentFindings(findings.slice(0, 10));
 
         // Draw charts
-        drawSeverityChart(findings);
-        drawActivityChart(engagements);
+        drawSeverityChart(bySeverity);
+        drawActivityChart(scanStats.per_day || {});
 
         // Optionally show active scans list (if an element exists)
         const activeList = document.getElementById('activeScansList');
@@ -82,26 +73,21 @@ function displayRecentFindings(findings) {
 }
 
 /**
- * Draw severity distribution chart
+ * Draw severity distribution chart from pre-aggregated counts
  */
-function drawSeverityChart(findings) {
+function drawSeverityChart(counts) {
     const canvas = document.getElementById('severityChart');
-    if (!canvas || !findings.length) return;
+    if (!canvas) return;
 
-    // Count by severity
     const severityCount = {
-        'Critical': 0,
-        'High': 0,
-        'Medium': 0,
-        'Low': 0,
-        'Info': 0
+        'Critical': counts['Critical'] || 0,
+        'High': counts['High'] || 0,
+        'Medium': counts['Medium'] || 0,
+        'Low': counts['Low'] || 0,
+        'Info': counts['Info'] || 0
     };
-
-    findings.forEach(f => {
-        if (f.severity in severityCount) {
-            severityCount[f.severity]++;
-        }
-    });
+    const total = Object.values(severityCount).reduce((a, b) => a + b, 0);
+    if (!total) return;
 
     // Simple bar chart using HTML/CSS
     const html = `
@@ -114,7 +100,7 @@ function drawSeverityChart(findings) {
                     'Low': '#3498db',
                     'Info': '#27ae60'
                 };
-                const percentage = findings.length ? (count / findings.length * 100) : 0;
+                const percentage = total ? (count / total * 100) : 0;
                 return `
                     <div>
                         <div style="display: flex; justify-content: space-between; margin-bottom: 5px;">
@@ -134,33 +120,17 @@ function drawSeverityChart(findings) {
 }
 
 /**
- * Draw activity chart (last 7 days)
+ * Draw activity chart (last 7 days) from per-day scan counts ({'YYYY-MM-DD': n})
  */
-function drawActivityChart(engagements) {
+function drawActivityChart(perDay) {
     const canvas = document.getElementById('activityChart');
     if (!canvas) return;
 
-    // Count scans by date (last 7 days)
-    const now = new Date();
     const activityData = {};
-
-    for (let i = 0; i < 7; i++) {
-        const date = new Date(now);
-        date.setDate(date.getDate() - i);
-        const dateStr = date.toLocaleDateString('en-US', { month: 'short', day: 'numeric' });
-        activityData[dateStr] = 0;
-    }
-
-    engagements.forEach(eng => {
-        // Use created or updated timestamp (not target_start which is just a date)
-        const dateField = eng.created || eng.updated;
-        if (dateField) {
-            const date = new Date(dateField);
-            const dateStr = date.toLocaleDateString('en-US', { month: 'short', day: 'numeric' });
-            if (dateStr in activityData) {
-                activityData[dateStr]++;
-            }
-        }
+    Object.keys(perDay).sort().reverse().slice(0, 7).forEach(day => {
+        const date = new Date(day + 'T00:00:00Z');
+        const dateStr = date.toLocaleDateString('en-US', { month: 'short', day: 'numeric', timeZone: 'UTC' });
+        activityData[dateStr] = perDay[day];
     });
 
     const dates = Object.keys(activityData).reverse();
@@ -33,8 +33,17 @@ async function handleScanSubmit(e) {
         // Kick Active Jobs refresh to show the new job
         try { startActiveJobsAutoRefresh(); refreshActiveJobs(); } catch (err) {}
 
-        // Optionally poll for completion to show final notification only
-        pollScanStatus(taskId, null, onScanComplete);
+        // Show final notification when the job finishes
+        activeJobs[taskId] = activeJobs[taskId] || {
+            task_id: taskId,
+            scan_type: scanType,
+            target: target,
+            state: 'QUEUED',
+            progress: 0,
+            created: new Date().toISOString()
+        };
+        renderActiveJobs();
+        watchScanCompletion(taskId, onScanComplete);
 
         // Reset form
         document.getElementById('scanForm').reset();
@@ -90,9 +99,56 @@ function onScanComplete(status) {
 // ========================================
 // Active Jobs (Scan page only)
 // ========================================
+// Progress is pushed by the backend over Server-Sent Events (/scan/events).
+// Polling /scan/active is only used when the stream is unavailable.
 let activeJobsInterval = null;
+let activeJobsStream = null;
+const activeJobs = {};
+const jobCompletionCallbacks = {};
 
 function startActiveJobsAutoRefresh() {
+    if (activeJobsStream || activeJobsInterval) {
+        return;
+    }
+    if (typeof EventSource === 'undefined') {
+        startActiveJobsPolling();
+        return;
+    }
+
+    activeJobsStream = new EventSource(`${BACKEND_URL}/scan/events`);
+
+    activeJobsStream.addEventListener('snapshot', (e) => {
+        Object.keys(activeJobs).forEach(k => delete activeJobs[k]);
+        JSON.parse(e.data).forEach(job => { activeJobs[job.task_id] = job; });
+        renderActiveJobs();
+    });
+
+    activeJobsStream.addEventListener('progress', (e) => {
+        const event = JSON.parse(e.data);
+        const job = Object.assign(activeJobs[event.task_id] || {}, event);
+        if (job.state === 'SUCCESS' || job.state === 'FAILURE') {
+            delete activeJobs[event.task_id];
+            const callback = jobCompletionCallbacks[event.task_id];
+            if (callback) {
+                delete jobCompletionCallbacks[event.task_id];
+                callback(job);
+            }
+        } else {
+            activeJobs[event.task_id] = job;
+        }
+        renderActiveJobs();
+    });
+
+    activeJobsStream.onerror = () => {
+        // EventSource reconnects on its own; fall back to polling only if it gave up
+        if (activeJobsStream && activeJobsStream.readyState === EventSource.CLOSED) {
+            activeJobsStream = null;
+            startActiveJobsPolling();
+        }
+    };
+}
+
+function startActiveJobsPolling() {
     if (activeJobsInterval) {
         clearInterval(activeJobsInterval);
     }
@@ -101,35 +157,66 @@ function startActiveJobsAutoRefresh() {
 }
 
 function stopActiveJobsAutoRefresh() {
+    if (activeJobsStream) {
+        activeJobsStream.close();
+        activeJobsStream = null;
+        // Hand pending completion notifications over to status polling
+        Object.keys(jobCompletionCallbacks).forEach(taskId => {
+            pollScanStatus(taskId, null, jobCompletionCallbacks[taskId]);
+            delete jobCompletionCallbacks[taskId];
+        });
+    }
     if (activeJobsInterval) {
         clearInterval(activeJobsInterval);
         activeJobsInterval = null;
     }
 }
 
+/**
+ * Wait for a job to finish: via the event stream when connected, polling otherwise
+ */
+function watchScanCompletion(taskId, onComplete) {
+    if (activeJobsStream) {
+        jobCompletionCallbacks[taskId] = onComplete;
+    } else {
+        pollScanStatus(taskId, null, onComplete);
+    }
+}
+
 async function refreshActiveJobs() {
+    if (activeJobsStream) {
+        renderActiveJobs();
+        return;
+    }
     try {
-        const tbody = document.getElementById('activeJobsBody');
-        if (!tbody) return;
         const active = await getActiveScans();
-        if (!active || active.length === 0) {
-            tbody.innerHTML = '<tr><td colspan="5" class="loading">No active jobs</td></tr>';
-            return;
-        }
-        tbody.innerHTML = '';
-        active.forEach(job => {
-            const statusBadge = getStatusBadge((job.status || job.state || 'Queued').toUpperCase());
-            const row = document.createElement('tr');
-            row.innerHTML = `
-                <td>${getScanTypeIcon(job.scan_type)} ${getScanTypeLabel(job.scan_type)}</td>
-                <td style="word-break: break-all;">${job.target || '-'}</td>
-                <td>${statusBadge}</td>
-                <td>${Math.round(job.progress || 0)}%</td>
-                <td>${formatDate(job.created || new Date().toISOString())}</td>
-            `;
-            tbody.appendChild(row);
-        });
+        Object.keys(activeJobs).forEach(k => delete activeJobs[k]);
+        active.forEach(job => { activeJobs[job.task_id] = job; });
+        renderActiveJobs();
     } catch (err) {
         console.error('Error refreshing active jobs:', err);
     }
 }
+
+function renderActiveJobs() {
+    const tbody = document.getElementById('activeJobsBody');
+    if (!tbody) return;
+    const active = Object.values(activeJobs);
+    if (active.length === 0) {
+        tbody.innerHTML = '<tr><td colspan="5" class="loading">No active jobs</td></tr>';
+        return;
+    }
+    tbody.innerHTML = '';
+    active.forEach(job => {
+        const statusBadge = getStatusBadge((job.status || job.state || 'Queued').toUpperCase());
+        const row = document.createElement('tr');
+        row.innerHTML = `
+            <td>${getScanTypeIcon(job.scan_type)} ${getScanTypeLabel(job.scan_type)}</td>
+            <td style="word-break: break-all;">${job.target || '-'}</td>
+            <td>${statusBadge}</td>
+            <td>${Math.round(job.progress || 0)}%</td>
+            <td>${formatDate(job.created || new Date().toISOString())}</td>
+        `;
+        tbody.appendChild(row);
+    });
+}